@@ -0,0 +1,181 @@
+try:
+    import numpy as np
+except ImportError:  # numpy нужен только аналитике: без него остальное приложение работает
+    np = None
+
+from db_cache import analytics_cache
+from db_manager import get_note_codes
+from note_columns import open_snapshot
+from vocabulary import VOCABULARIES
+
+# Группы значений в порядке кодов заметки (rating_code, emotions_mask, people_mask, weather_code);
+# в матрице признаков каждому значению каждой группы соответствует свой столбец
+GROUPS = tuple(VOCABULARIES)
+# Группы множественного выбора хранятся битовыми масками, остальные - кодами 1..N
+MASK_GROUPS = ("emotion", "people")
+# Балл настроения по оценке дня: "Замечательно" - 5, "Плохо" - 1
+RATING_SCORES = tuple(range(len(VOCABULARIES["rating"]), 0, -1))
+# Находки по признакам, встречавшимся реже, не показываются: слишком мало данных
+MIN_DAYS = 10
+TOP_FINDINGS = 10
+# Подписи групп в тексте находок
+GROUP_TITLES = {"emotion": "Эмоция", "people": "Люди", "weather": "Погода"}
+
+
+def feature_matrix(codes):
+    """Матрица дней x признаков (0/1) по массиву кодов заметок формы (дней, 4)."""
+    columns = []
+    for group, column in zip(GROUPS, codes.T):
+        values = np.arange(len(VOCABULARIES[group]))
+        if group in MASK_GROUPS:
+            columns.append((column[:, None] >> values) & 1)
+        else:
+            columns.append(column[:, None] == values + 1)
+    return np.hstack(columns).astype(np.float64)
+
+
+class HistoryAnalytics:
+    """История пользователя в массивах NumPy и статистика по ней.
+
+    Совместная встречаемость всех пар значений (counts) считается одним умножением
+    матрицы признаков на себя; условные распределения и находки - векторно по строкам
+    и столбцам counts, без циклов по дням.
+    """
+
+    def __init__(self, codes):
+        """codes - коды заметок (rating_code, emotions_mask, people_mask, weather_code) по дням."""
+        codes = np.array(codes, dtype=np.int64).reshape(-1, len(GROUPS))
+        self.days = len(codes)
+        self.slices = {}
+        start = 0
+        for group in GROUPS:
+            self.slices[group] = slice(start, start + len(VOCABULARIES[group]))
+            start += len(VOCABULARIES[group])
+        features = feature_matrix(codes)
+        self.counts = (features.T @ features).astype(np.int64)
+        self.findings = None
+
+    def cooccurrence(self, group, target):
+        """Число дней с каждой парой значений: матрица (значения group) x (значения target)."""
+        return self.counts[self.slices[group], self.slices[target]]
+
+    def frequencies(self, group):
+        """Число дней с каждым значением группы."""
+        return np.diagonal(self.counts)[self.slices[group]]
+
+    def conditional(self, target, group):
+        """Доли значений target в дни с каждым значением group: матрица долей.
+
+        Для оценки и погоды доли считаются от дней, где значение target выбрано
+        (строка в сумме дает 1), для эмоций и людей - от всех дней со значением group.
+        """
+        pairs = self.cooccurrence(group, target)
+        totals = self.frequencies(group) if target in MASK_GROUPS else pairs.sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(totals[:, None] > 0, pairs / totals[:, None], 0.0)
+
+    def distribution(self, target, group, label):
+        """Распределение target в дни со значением label группы group, например
+        distribution("rating", "people", "Друзья") - оценки дней с друзьями: {значение: доля}."""
+        shares = self.conditional(target, group)[VOCABULARIES[group].index(label)]
+        return dict(zip(VOCABULARIES[target], shares.tolist()))
+
+    def mood_scores(self, group):
+        """Средний балл настроения (1..5) и число оцененных дней для каждого значения группы."""
+        ratings = self.cooccurrence(group, "rating")
+        rated = ratings.sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return ratings @ np.array(RATING_SCORES) / rated, rated
+
+    def top_findings(self, limit=TOP_FINDINGS):
+        """Самые заметные связи в истории, от сильных к слабым.
+
+        Сравниваются с обычными днями: средний балл настроения при каждой эмоции, людях
+        и погоде, а также частота каждой эмоции при людях и погоде. Сила связи - z-оценка
+        отклонения (разница в стандартных ошибках), поэтому связи, подтвержденные большим
+        числом дней, идут выше случайных совпадений на малых выборках.
+        """
+        if self.findings is None:
+            self.findings = self._mood_findings() + self._emotion_findings()
+            self.findings.sort(key=lambda finding: -abs(finding["strength"]))
+        return self.findings[:limit]
+
+    def _mood_findings(self):
+        scores = np.array(RATING_SCORES)
+        rated_days = self.frequencies("rating")
+        total = rated_days.sum()
+        if not total:
+            return []
+        baseline = rated_days @ scores / total
+        deviation = np.sqrt(rated_days @ (scores - baseline) ** 2 / total)
+        findings = []
+        for group in ("emotion", "people", "weather"):
+            means, rated = self.mood_scores(group)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                strength = (means - baseline) / (deviation / np.sqrt(rated))
+            for index in np.flatnonzero((rated >= MIN_DAYS) & np.isfinite(strength)):
+                findings.append({
+                    "kind": "mood", "group": group, "label": VOCABULARIES[group][index],
+                    "days": int(rated[index]), "value": float(means[index]), "baseline": float(baseline),
+                    "strength": float(strength[index]),
+                })
+        return findings
+
+    def _emotion_findings(self):
+        if not self.days:
+            return []
+        baseline = self.frequencies("emotion") / self.days
+        findings = []
+        for group in ("people", "weather"):
+            days = self.frequencies(group)
+            shares = self.conditional("emotion", group)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                strength = (shares - baseline) / np.sqrt(baseline * (1 - baseline) / days[:, None])
+            valid = (days[:, None] >= MIN_DAYS) & np.isfinite(strength)
+            for index, emotion in zip(*np.nonzero(valid)):
+                findings.append({
+                    "kind": "emotion", "group": group, "label": VOCABULARIES[group][index],
+                    "emotion": VOCABULARIES["emotion"][emotion], "days": int(days[index]),
+                    "value": float(shares[index, emotion]), "baseline": float(baseline[emotion]),
+                    "strength": float(strength[index, emotion]),
+                })
+        return findings
+
+
+def get_analytics(user_id):
+    """Аналитика пользователя: из кэша или заново по всей истории (None, если numpy не установлен).
+
+    История читается из столбцового снимка (см. note_columns), а если он недоступен - из БД.
+    Кэш сбрасывается при каждой записи заметок пользователя (см. db_manager); если запись
+    пришлась на время построения, результат возвращается, но в кэш не попадает.
+    """
+    if np is None:
+        return None
+    analytics = analytics_cache.get(user_id)
+    if analytics is None:
+        generation = analytics_cache.generation
+        columns = open_snapshot(user_id)
+        if columns is None:
+            codes = get_note_codes(user_id)
+        else:
+            present = columns["date"] != 0
+            codes = np.column_stack([columns[name][present] for name in ("rating", "emotions", "people", "weather")])
+        analytics = HistoryAnalytics(codes)
+        analytics_cache.put(user_id, analytics, generation)
+    return analytics
+
+
+def get_top_findings(user_id, limit=TOP_FINDINGS):
+    """Главные находки пользователя (см. HistoryAnalytics.top_findings) или None без numpy."""
+    analytics = get_analytics(user_id)
+    return None if analytics is None else analytics.top_findings(limit)
+
+
+def describe_finding(finding):
+    """Текст находки для экрана аналитики."""
+    subject = f"{GROUP_TITLES[finding['group']]}: {finding['label']}"
+    if finding["kind"] == "mood":
+        return (f"{subject} - настроение {finding['value']:.1f} из 5 "
+                f"(обычно {finding['baseline']:.1f}), дней: {finding['days']}")
+    return (f"{subject} - \"{finding['emotion']}\" в {finding['value']:.0%} дней "
+            f"(обычно {finding['baseline']:.0%}), дней: {finding['days']}")
@@ -0,0 +1,194 @@
+import argparse
+import base64
+import hashlib
+import hmac
+import os
+import sqlite3
+import time
+
+from db_connection import get_connection
+from log_setup import get_logger, setup_logging
+from metrics import timed
+
+logger = get_logger("auth")
+
+# Параметры scrypt: память = 128 * n * r байт (16 МБ при n=2**14, r=8).
+# Подобраны бенчмарком (python auth.py --target-ms ...) под время входа ~50-100 мс.
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+# Запасной вариант, если Python собран без scrypt (нет поддержки в OpenSSL)
+PBKDF2_ITERATIONS = 200_000
+
+SALT_SIZE = 16
+HASH_SIZE = 32
+
+# Цель по времени проверки пароля для бенчмарка (миллисекунды)
+TARGET_LOGIN_MS = 100
+
+HAS_SCRYPT = hasattr(hashlib, "scrypt")
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+def _b64decode(text):
+    return base64.b64decode(text.encode("ascii"))
+
+
+def _scrypt(password, salt, n, r, p):
+    # maxmem с запасом: по умолчанию OpenSSL ограничивает 32 МБ
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r + 1024 * 1024, dklen=HASH_SIZE)
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations, dklen=HASH_SIZE)
+
+
+def hash_password(password, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, iterations=PBKDF2_ITERATIONS):
+    """Соленый хэш пароля вида 'scrypt$n$r$p$соль$хэш' (или 'pbkdf2_sha256$итерации$соль$хэш')."""
+    salt = os.urandom(SALT_SIZE)
+    if HAS_SCRYPT:
+        digest = _scrypt(password, salt, n, r, p)
+        return f"scrypt${n}${r}${p}${_b64encode(salt)}${_b64encode(digest)}"
+    digest = _pbkdf2(password, salt, iterations)
+    return f"pbkdf2_sha256${iterations}${_b64encode(salt)}${_b64encode(digest)}"
+
+
+def _is_legacy_hash(stored):
+    """Старый формат: SHA-256 без соли (64 шестнадцатеричных символа)."""
+    return len(stored) == 64 and "$" not in stored
+
+
+def needs_rehash(stored):
+    """True, если хэш старого формата или параметры стоимости отличаются от текущих."""
+    if HAS_SCRYPT:
+        return not stored.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+    return not stored.startswith(f"pbkdf2_sha256${PBKDF2_ITERATIONS}$")
+
+
+def verify_password(stored, password):
+    """Проверяет пароль по сохраненному хэшу (любого поддерживаемого формата)."""
+    if not stored:
+        return False
+    if _is_legacy_hash(stored):
+        return hmac.compare_digest(stored, hashlib.sha256(password.encode()).hexdigest())
+
+    parts = stored.split("$")
+    try:
+        if parts[0] == "scrypt" and len(parts) == 6:
+            n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+            salt, expected = _b64decode(parts[4]), _b64decode(parts[5])
+            digest = _scrypt(password, salt, n, r, p)
+        elif parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+            salt, expected = _b64decode(parts[2]), _b64decode(parts[3])
+            digest = _pbkdf2(password, salt, int(parts[1]))
+        else:
+            logger.error("Неизвестный формат хэша пароля.")
+            return False
+    except (ValueError, TypeError) as e:
+        logger.error("Поврежденный хэш пароля: %s", e)
+        return False
+    return hmac.compare_digest(digest, expected)
+
+
+# Хэш для проверки несуществующего пользователя: время ответа не выдает, есть ли такое имя
+_dummy_hash = None
+
+
+@timed("auth")
+def authenticate(username, password):
+    """Проверяет имя и пароль. Возвращает ID пользователя или None.
+
+    Выполняется в фоновом потоке: ID и хэш читаются одним запросом, а хэш
+    старого формата после успешного входа заменяется на новый. Ошибка БД
+    записывается в журнал и передается вызывающему (sqlite3.Error).
+    """
+    global _dummy_hash
+    connection = get_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT id, password FROM users WHERE username = ?", (username,))
+        result = cursor.fetchone()
+    except sqlite3.Error as e:
+        logger.error("Ошибка при загрузке пользователя: %s", e)
+        raise
+
+    if result is None:
+        if _dummy_hash is None:
+            _dummy_hash = hash_password("")
+        verify_password(_dummy_hash, password)
+        return None
+
+    user_id, stored = result
+    if not verify_password(stored, password):
+        return None
+
+    if needs_rehash(stored):
+        try:
+            cursor.execute("UPDATE users SET password = ? WHERE id = ?", (hash_password(password), user_id))
+            connection.commit()
+            logger.info("Хэш пароля пользователя %s обновлен.", user_id)
+        except sqlite3.Error as e:
+            connection.rollback()
+            logger.error("Ошибка при обновлении хэша пароля: %s", e)
+    return user_id
+
+
+@timed("auth")
+def register_user(username, password):
+    """Создает пользователя. Возвращает его ID или None, если имя уже занято.
+
+    Остальные ошибки БД записываются в журнал и передаются вызывающему (sqlite3.Error).
+    """
+    hashed_password = hash_password(password)
+    connection = get_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed_password))
+        connection.commit()
+        return cursor.lastrowid
+    except sqlite3.IntegrityError:
+        connection.rollback()
+        return None
+    except sqlite3.Error as e:
+        connection.rollback()
+        logger.error("Ошибка при регистрации пользователя: %s", e)
+        raise
+
+
+def benchmark(target_ms=TARGET_LOGIN_MS, rounds=5):
+    """Замеряет время проверки пароля для разных n и возвращает наибольшее n в пределах target_ms."""
+    best = None
+    n = 2 ** 12
+    while n <= 2 ** 20:
+        stored = hash_password("benchmark-password", n=n)
+        timings = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            verify_password(stored, "benchmark-password")
+            timings.append((time.perf_counter() - started) * 1000)
+        median = sorted(timings)[len(timings) // 2]
+        print(f"n=2**{n.bit_length() - 1}: {median:.1f} мс")
+        if median > target_ms:
+            break
+        best = n
+        n *= 2
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Подбор параметров scrypt под целевое время входа.")
+    parser.add_argument("--target-ms", type=float, default=TARGET_LOGIN_MS)
+    args = parser.parse_args()
+    setup_logging()
+    if not HAS_SCRYPT:
+        logger.error("hashlib.scrypt недоступен, используется PBKDF2.")
+    else:
+        best = benchmark(args.target_ms)
+        if best is None:
+            logger.warning("Даже минимальная стоимость дольше %s мс.", args.target_ms)
+        else:
+            print(f"Рекомендуемое значение: SCRYPT_N = 2 ** {best.bit_length() - 1}")
@@ -0,0 +1,135 @@
+import threading
+import time
+
+from db_manager import save_notes_to_db
+from log_setup import get_logger
+
+logger = get_logger("autosave")
+
+# Пауза после последнего изменения, после которой изменения пишутся в БД (секунды)
+AUTOSAVE_DELAY = 1.5
+# Максимальное время, которое изменение может ждать записи при непрерывном вводе
+AUTOSAVE_MAX_DELAY = 10.0
+
+
+class NoteAutosaver:
+    """Фоновая отложенная запись заметок (write-behind).
+
+    Изменения одной заметки (user_id, date) схлопываются в одну запись, запись
+    откладывается до паузы во вводе, а все накопленные заметки сохраняются
+    одной транзакцией. Если запись не удалась, пачка возвращается в очередь (не затирая
+    более новые правки тех же заметок) и повторяется после паузы.
+    """
+
+    def __init__(self, save_batch=save_notes_to_db, delay=AUTOSAVE_DELAY, max_delay=AUTOSAVE_MAX_DELAY):
+        self.save_batch = save_batch
+        self.delay = delay
+        self.max_delay = max_delay
+        self.condition = threading.Condition()
+        self.pending = {}  # (user_id, date) -> строка для save_notes_to_db
+        self.first_edit = None
+        self.last_edit = None
+        self.flush_requested = False
+        self.writing = False
+        self.failed = False  # Последняя попытка записи не удалась
+
+        # Счетчики для оценки эффекта
+        self.edits = 0
+        self.commits = 0
+        self.rows_written = 0
+        self.failures = 0
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def push(self, user_id, date, note, day_rating=None, emotions=None, people=None, weather=None):
+        """Ставит актуальное состояние заметки в очередь на запись."""
+        if user_id is None or date is None:
+            return
+        with self.condition:
+            now = time.monotonic()
+            self.pending[(user_id, date)] = (user_id, date, note, day_rating, emotions, people, weather)
+            if self.first_edit is None:
+                self.first_edit = now
+            self.last_edit = now
+            self.edits += 1
+            self.condition.notify_all()
+
+    def flush(self, timeout=5.0):
+        """Немедленно записывает накопленные изменения и ждет окончания записи.
+
+        Возвращает True, если все изменения записаны; False - если запись не удалась
+        (изменения остаются в очереди) или не закончилась за timeout секунд.
+        """
+        with self.condition:
+            if not self.pending and not self.writing:
+                return True
+            failures = self.failures
+            self.flush_requested = True
+            self.condition.notify_all()
+            self.condition.wait_for(
+                lambda: (not self.pending and not self.writing) or self.failures != failures, timeout)
+            return not self.pending and not self.writing
+
+    def stats(self):
+        with self.condition:
+            return {
+                "edits": self.edits,
+                "commits": self.commits,
+                "rows_written": self.rows_written,
+                "failures": self.failures,
+                "pending": len(self.pending),
+            }
+
+    def _next_batch(self):
+        """Ждет, пока наступит время записи, и забирает накопленные изменения."""
+        with self.condition:
+            while True:
+                if not self.pending:
+                    self.flush_requested = False
+                    self.condition.wait()
+                    continue
+                now = time.monotonic()
+                due = min(self.last_edit + self.delay, self.first_edit + self.max_delay)
+                if self.flush_requested or now >= due:
+                    break
+                self.condition.wait(due - now)
+
+            batch = list(self.pending.values())
+            self.pending = {}
+            self.first_edit = self.last_edit = None
+            self.flush_requested = False
+            self.writing = True
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            saved = False
+            try:
+                saved = self.save_batch(batch)
+            except Exception as e:
+                logger.error("Ошибка автосохранения: %s", e)
+            finally:
+                with self.condition:
+                    self.writing = False
+                    self.failed = not saved
+                    if saved:
+                        self.commits += 1
+                        self.rows_written += len(batch)
+                    else:
+                        self._requeue(batch)
+                    self.condition.notify_all()
+
+    def _requeue(self, batch):
+        """Возвращает неудавшуюся пачку в очередь (вызывается под self.condition).
+
+        Правки, поставленные в очередь во время записи, новее строк пачки и остаются как есть.
+        """
+        self.failures += 1
+        for row in batch:
+            self.pending.setdefault((row[0], row[1]), row)
+        now = time.monotonic()
+        if self.first_edit is None:
+            self.first_edit = now
+        self.last_edit = max(self.last_edit or now, now)
@@ -0,0 +1,702 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date as Date, timedelta
+
+from analytics import get_analytics, get_top_findings
+from auth import authenticate
+from autosave import NoteAutosaver
+from db_cache import notes_cache, habits_cache, analytics_cache, clear_caches
+from db_connection import get_connection, get_db_path, set_db_path, close_all
+from journal_io import iter_user_records, write_records, read_records, import_records
+from log_setup import get_logger, setup_logging
+from db_manager import (init_db, save_note_to_db, get_note_from_db, get_user_habits, get_saved_habits,
+                        get_habit_stats, save_selected_habits_to_db, get_note_revisions, get_note_revision,
+                        get_note_codes, search_notes)
+from note_columns import build_snapshot, open_snapshot
+from synthetic_data import generate_dataset, SYNTHETIC_PASSWORD, NOTE_WORDS
+from vocabulary import RATINGS, EMOTIONS, PEOPLE, WEATHER
+
+logger = get_logger("benchmark")
+
+# Размеры набора данных: лет истории у каждого пользователя
+DEFAULT_SIZES = (1, 5, 20)
+DEFAULT_USERS = 5
+DEFAULT_ITERATIONS = 200
+# Вход намеренно медленный (scrypt), поэтому замеров меньше
+LOGIN_ITERATIONS = 20
+# Экспорт и импорт журнала занимают секунды, поэтому повторов мало
+DEFAULT_JOURNAL_RUNS = 3
+# Во сколько раз может вырасти p95 относительно базового отчета, прежде чем считать это регрессией
+DEFAULT_THRESHOLD = 1.5
+# Сеанс набора текста: пауза между нажатиями и раз в сколько нажатий пользователь
+# задумывается (паузы сокращены вместе с задержками автосохранения, чтобы замер шел секунды)
+TYPING_KEY_INTERVAL = 0.002
+TYPING_BURST = 40
+TYPING_PAUSE = 0.1
+TYPING_AUTOSAVE_DELAY = 0.05
+TYPING_AUTOSAVE_MAX_DELAY = 0.5
+# Разница меньше этой (мс) не считается регрессией: это шум для микросекундных операций
+MIN_REGRESSION_MS = 0.1
+
+
+def percentile(values, fraction):
+    """Перцентиль по методу ближайшего ранга (values должен быть отсортирован)."""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, int(round(fraction * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def measure(func, iterations, prepare=None):
+    """Вызывает func(i) iterations раз и возвращает сводку по задержкам.
+
+    prepare(i), если указан, выполняется перед каждым вызовом и не попадает в замер
+    (например, сброс кэша для холодного чтения).
+    """
+    timings = []
+    for i in range(iterations):
+        if prepare is not None:
+            prepare(i)
+        started = time.perf_counter()
+        func(i)
+        timings.append(time.perf_counter() - started)
+    return summarize(timings)
+
+
+def summarize(timings):
+    """Сводка по списку задержек в секундах."""
+    timings = sorted(timings)
+    iterations = len(timings)
+    total = sum(timings)
+    return {
+        "iterations": iterations,
+        "p50_ms": round(percentile(timings, 0.50) * 1000, 4),
+        "p95_ms": round(percentile(timings, 0.95) * 1000, 4),
+        "mean_ms": round(total / iterations * 1000, 4),
+        "ops_per_s": round(iterations / total, 1) if total else None,
+    }
+
+
+def run_size(years, users, iterations, seed):
+    """Генерирует БД заданного размера во временной папке и замеряет горячие пути."""
+    with tempfile.TemporaryDirectory() as directory:
+        set_db_path(os.path.join(directory, "bench.db"))
+        clear_caches()
+        init_db()
+        end_date = Date(2024, 12, 31)
+        user_ids = generate_dataset(users=users, years=years, seed=seed, end_date=end_date)
+        days = int(365.25 * years)
+        rng = random.Random(seed)
+
+        def random_date(_=None):
+            return (end_date - timedelta(days=rng.randrange(days))).isoformat()
+
+        def random_user(_=None):
+            return rng.choice(user_ids)
+
+        dates = [random_date() for _ in range(iterations)]
+        targets = [random_user() for _ in range(iterations)]
+        habits = {user_id: get_user_habits(user_id) for user_id in user_ids}
+        connection = get_connection()
+        usernames = dict(connection.execute("SELECT id, username FROM users").fetchall())
+        notes = connection.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+
+        def save_note(i):
+            save_note_to_db(dates[i], f"benchmark note {i}", targets[i], rng.choice(RATINGS),
+                            ",".join(rng.sample(EMOTIONS, 2)), rng.choice(PEOPLE), rng.choice(WEATHER))
+
+        def load_user_habits(i):
+            user_id = targets[i]
+            return get_user_habits(user_id), get_saved_habits(user_id), get_habit_stats(user_id)
+
+        def save_selected_habits(i):
+            user_id = targets[i]
+            selected = {name: buttons.split(",")[:1 + i % 2] for _, name, buttons in habits[user_id]}
+            save_selected_habits_to_db(user_id, selected)
+
+        results = {}
+        results["save_note_to_db"] = measure(save_note, iterations)
+        results["get_note_from_db_cold"] = measure(
+            lambda i: get_note_from_db(dates[i], targets[i]), iterations,
+            prepare=lambda i: notes_cache.clear())
+        results["get_note_from_db_cached"] = measure(lambda i: get_note_from_db(dates[i], targets[i]), iterations)
+        results["login"] = measure(
+            lambda i: authenticate(usernames[targets[i]], SYNTHETIC_PASSWORD), min(iterations, LOGIN_ITERATIONS))
+        results["load_user_habits_cold"] = measure(load_user_habits, iterations,
+                                                   prepare=lambda i: habits_cache.clear())
+        results["save_selected_habits"] = measure(save_selected_habits, iterations)
+
+        close_all()
+        return {"years": years, "users": users, "notes": notes, "operations": results}
+
+
+def run_connection(reads, seed):
+    """Чтение одной заметки по ключу: новое соединение на каждый вызов (как было до
+    db_connection) против общего соединения потока."""
+    with tempfile.TemporaryDirectory() as directory:
+        set_db_path(os.path.join(directory, "connection.db"))
+        clear_caches()
+        init_db()
+        end_date = Date(2024, 12, 31)
+        user_id = generate_dataset(users=1, years=1, seed=seed, end_date=end_date)[0]
+        rng = random.Random(seed)
+        dates = [(end_date - timedelta(days=rng.randrange(365))).isoformat() for _ in range(reads)]
+        query = "SELECT note FROM notes WHERE user_id = ? AND date = ?"
+        path = get_db_path()
+
+        def connect_per_call(i):
+            connection = sqlite3.connect(path)
+            try:
+                connection.execute(query, (user_id, dates[i])).fetchone()
+            finally:
+                connection.close()
+
+        results = {
+            "read_connect_per_call": measure(connect_per_call, reads),
+            "read_shared_connection": measure(
+                lambda i: get_connection().execute(query, (user_id, dates[i])).fetchone(), reads),
+        }
+        close_all()
+    return results
+
+
+def run_search(years, users, seed):
+    """Поиск по мере ввода: запрос на каждое нажатие при наборе слов из заметок
+    (префиксы слова, затем фраза из двух слов) - через FTS5 и через запасной LIKE."""
+    with tempfile.TemporaryDirectory() as directory:
+        set_db_path(os.path.join(directory, "search.db"))
+        clear_caches()
+        init_db()
+        user_ids = generate_dataset(users=users, years=years, seed=seed, end_date=Date(2024, 12, 31))
+        rng = random.Random(seed)
+        queries = []
+        for word in NOTE_WORDS:
+            phrase = f"{word} {rng.choice(NOTE_WORDS)}"
+            user_id = rng.choice(user_ids)
+            queries.extend((user_id, phrase[:length]) for length in range(1, len(phrase) + 1))
+
+        def search(i):
+            search_notes(*queries[i])
+
+        results = {"search_as_you_type_fts": measure(search, len(queries))}
+        # SQLite без FTS5: search_notes переходит на LIKE, если таблицы notes_fts нет
+        get_connection().execute("DROP TABLE notes_fts")
+        results["search_as_you_type_like"] = measure(search, len(queries))
+        close_all()
+    for result in results.values():
+        result.update({"years": years, "users": users})
+    return results
+
+
+def run_typing(keystrokes, seed):
+    """Сеанс набора заметки по одному символу: запись на каждое нажатие против автосохранения.
+
+    Время - доля нажатия в UI-потоке (запись в БД или постановка в очередь). commits -
+    число транзакций: при synchronous=FULL каждая - это fsync журнала WAL (при NORMAL
+    синхронизация идет только на контрольных точках, но число записанных страниц
+    пропорционально тому же числу транзакций).
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        set_db_path(os.path.join(directory, "typing.db"))
+        clear_caches()
+        init_db()
+        connection = get_connection()
+        user_id = connection.execute("INSERT INTO users (username, password) VALUES ('typing', '')").lastrowid
+        connection.commit()
+        rng = random.Random(seed)
+        text = " ".join(rng.choice(NOTE_WORDS) for _ in range(keystrokes))[:keystrokes]
+
+        def session(date, type_key):
+            def keystroke(i):
+                type_key(date, text[:i + 1])
+
+            def pause(i):
+                time.sleep(TYPING_PAUSE if i and i % TYPING_BURST == 0 else TYPING_KEY_INTERVAL)
+
+            started = time.perf_counter()
+            result = measure(keystroke, keystrokes, prepare=pause)
+            return result, started
+
+        def revisions(date):
+            return connection.execute("SELECT COUNT(*) FROM note_revisions WHERE user_id = ? AND date = ?",
+                                      (user_id, date)).fetchone()[0]
+
+        direct, started = session("2024-01-01", lambda date, note: save_note_to_db(date, note, user_id, RATINGS[0]))
+        direct.update({"commits": keystrokes, "revisions": revisions("2024-01-01"),
+                       "session_s": round(time.perf_counter() - started, 3)})
+
+        autosaver = NoteAutosaver(delay=TYPING_AUTOSAVE_DELAY, max_delay=TYPING_AUTOSAVE_MAX_DELAY)
+        queued, started = session("2024-01-02", lambda date, note: autosaver.push(user_id, date, note, RATINGS[0]))
+        flushed = autosaver.flush()
+        stats = autosaver.stats()
+        saved = get_note_from_db("2024-01-02", user_id).get("note") == text
+        queued.update({"commits": stats["commits"], "rows_written": stats["rows_written"],
+                       "revisions": revisions("2024-01-02"), "session_s": round(time.perf_counter() - started, 3),
+                       "saved": flushed and saved})
+        close_all()
+    return {"typing_save_per_key": direct, "typing_autosave": queued}
+
+
+def run_journal(years, runs, seed):
+    """Экспорт журнала одного пользователя с историей в years лет в JSONL и импорт этого
+    файла новому пользователю (все записи новые) и тому же пользователю с политикой
+    overwrite (все записи конфликтуют): записей в секунду для каждого пути."""
+    with tempfile.TemporaryDirectory() as directory:
+        set_db_path(os.path.join(directory, "journal.db"))
+        clear_caches()
+        init_db()
+        user_id = generate_dataset(users=1, years=years, seed=seed, end_date=Date(2024, 12, 31))[0]
+        connection = get_connection()
+        path = os.path.join(directory, "journal.jsonl")
+        counts = {}
+
+        def export(i):
+            with open(path, "w", encoding="utf-8", newline="") as fp:
+                counts["rows"] = write_records(iter_user_records(user_id), fp, "jsonl")
+
+        def new_user(i):
+            counts["target"] = connection.execute(
+                "INSERT INTO users (username, password) VALUES (?, '')", (f"journal {i}",)).lastrowid
+            connection.commit()
+
+        def load(target, policy):
+            with open(path, encoding="utf-8", newline="") as fp:
+                stats = import_records(target, read_records(fp, "jsonl"), policy=policy)
+            counts["invalid"] = counts.get("invalid", 0) + stats["invalid"]
+
+        results = {
+            "journal_export": measure(export, runs),
+            "journal_import_new": measure(lambda i: load(counts["target"], "skip"), runs, prepare=new_user),
+            "journal_import_overwrite": measure(lambda i: load(user_id, "overwrite"), runs),
+        }
+        close_all()
+    for result in results.values():
+        result["rows"] = counts["rows"]
+        result["rows_per_s"] = round(counts["rows"] / result["mean_ms"] * 1000)
+    results["journal_import_new"]["invalid"] = counts["invalid"]
+    return results
+
+
+def run_revisions(edits, seed):
+    """Заметка, которую правят edits раз (дописывают, меняют и удаляют слова):
+    размер истории в сравнении с полными копиями и время восстановления ревизий."""
+    with tempfile.TemporaryDirectory() as directory:
+        set_db_path(os.path.join(directory, "revisions.db"))
+        clear_caches()
+        init_db()
+        connection = get_connection()
+        user_id = connection.execute("INSERT INTO users (username, password) VALUES ('revisions', '')").lastrowid
+        connection.commit()
+        rng = random.Random(seed)
+        date = "2024-06-01"
+        words = []
+        states = []  # различающиеся подряд состояния (текст, оценка): ревизия N - states[N - 1]
+
+        def edit(i):
+            action = rng.random()
+            if action < 0.7 or len(words) < 10:
+                words.append(rng.choice(NOTE_WORDS))
+            elif action < 0.9:
+                words[rng.randrange(len(words))] = rng.choice(NOTE_WORDS)
+            else:
+                start = rng.randrange(len(words))
+                del words[start:start + rng.randint(1, 5)]
+            state = (" ".join(words), rng.choice(RATINGS))
+            if not states or states[-1] != state:
+                states.append(state)
+            save_note_to_db(date, state[0], user_id, state[1])
+
+        save = measure(edit, edits)
+        stored, snapshots = connection.execute(
+            "SELECT SUM(length(data)), SUM(snapshot) FROM note_revisions WHERE user_id = ?", (user_id,)).fetchone()
+        full_copies = sum(len(text) for text, _ in states[:-1])
+        revisions = len(get_note_revisions(user_id, date))
+        targets = [rng.randint(1, revisions) for _ in range(DEFAULT_ITERATIONS)]
+        restore = measure(lambda i: get_note_revision(user_id, date, targets[i]), DEFAULT_ITERATIONS)
+        mismatches = sum(get_note_revision(user_id, date, revision)["note"] != states[revision - 1][0]
+                         for revision in range(1, revisions + 1))
+        close_all()
+
+    save.update({"revisions": revisions, "final_length": len(states[-1][0])})
+    restore.update({
+        "stored_chars": stored,
+        "full_copy_chars": full_copies,
+        "ratio": round(stored / full_copies, 3) if full_copies else None,
+        "snapshots": snapshots,
+        "mismatches": mismatches,
+    })
+    return {"revision_save": save, "revision_reconstruct": restore}
+
+
+def run_analytics(years, iterations, seed):
+    """Аналитика одного пользователя с историей в years лет: расчет с нуля и из кэша,
+    а также сброс кэша после сохранения заметки (нужен numpy)."""
+    with tempfile.TemporaryDirectory() as directory:
+        set_db_path(os.path.join(directory, "analytics.db"))
+        clear_caches()
+        init_db()
+        end_date = Date(2024, 12, 31)
+        user_id = generate_dataset(users=1, years=years, seed=seed, end_date=end_date)[0]
+        analytics = get_analytics(user_id)
+        if analytics is None:
+            close_all()
+            logger.warning("numpy не установлен, аналитика не замеряется")
+            return {}
+
+        cold = measure(lambda i: get_top_findings(user_id), iterations, prepare=lambda i: analytics_cache.clear())
+        cached = measure(lambda i: get_top_findings(user_id), iterations)
+        save_note_to_db((end_date + timedelta(days=1)).isoformat(), "", user_id, RATINGS[0])
+        stale = get_analytics(user_id).days != analytics.days + 1
+        close_all()
+
+    cold.update({"notes": analytics.days, "findings": len(analytics.top_findings())})
+    cached["stale_after_save"] = stale
+    return {"analytics_cold": cold, "analytics_cached": cached}
+
+
+def run_columns(years, iterations, seed):
+    """Просмотр всей истории одного пользователя (средняя оценка дня): запрос к SQLite
+    против столбцового снимка в np.memmap, а также полная перестройка снимка и его
+    обновление после сохранения одной заметки (нужен numpy)."""
+    with tempfile.TemporaryDirectory() as directory:
+        set_db_path(os.path.join(directory, "columns.db"))
+        clear_caches()
+        init_db()
+        end_date = Date(2024, 12, 31)
+        user_id = generate_dataset(users=1, years=years, seed=seed, end_date=end_date)[0]
+        if open_snapshot(user_id) is None:
+            close_all()
+            logger.warning("numpy не установлен, снимок заметок не замеряется")
+            return {}
+        import numpy as np
+
+        def mean_rating(ratings):
+            return float(ratings[ratings > 0].mean())
+
+        rng = random.Random(seed)
+        days = int(365.25 * years)
+        results = {}
+        results["scan_sqlite"] = measure(
+            lambda i: mean_rating(np.array(get_note_codes(user_id), dtype=np.int64)[:, 0]), iterations)
+        results["scan_memmap"] = measure(lambda i: mean_rating(open_snapshot(user_id)["rating"]), iterations)
+        results["snapshot_build"] = measure(lambda i: build_snapshot(user_id), min(iterations, LOGIN_ITERATIONS))
+        results["snapshot_refresh_after_save"] = measure(
+            lambda i: open_snapshot(user_id), iterations,
+            prepare=lambda i: save_note_to_db((end_date - timedelta(days=rng.randrange(days))).isoformat(),
+                                              f"columns {i}", user_id, rng.choice(RATINGS)))
+        results["scan_memmap"]["matches_sqlite"] = (
+            mean_rating(open_snapshot(user_id)["rating"])
+            == mean_rating(np.array(get_note_codes(user_id), dtype=np.int64)[:, 0]))
+        close_all()
+    return results
+
+
+def run_ui(months):
+    """Листание календаря на months месяцев вперед и обратно (нужен Kivy с окном).
+
+    Время кадра - обновление сетки, раскладка и один проход EventLoop.idle().
+    Отдельным проходом под tracemalloc считаются выделенная память и созданные виджеты.
+    """
+    import tracemalloc
+    from kivy.base import EventLoop
+    from kivy.uix.widget import Widget
+    from main import LifeDotsApp
+
+    EventLoop.ensure_window()
+    app = LifeDotsApp()
+    app.load_kv()
+    screen = app.build().get_screen("calendar")
+    grid = screen.ids.calendar_grid
+
+    def flip(i):
+        if i % (2 * months) < months:
+            screen.show_next_month()
+        else:
+            screen.show_prev_month()
+        grid.do_layout()
+        EventLoop.idle()
+
+    flips = 2 * months
+    result = measure(flip, flips)
+
+    created = [0]
+    original_init = Widget.__init__
+
+    def counting_init(self, **kwargs):
+        created[0] += 1
+        original_init(self, **kwargs)
+
+    Widget.__init__ = counting_init
+    tracemalloc.start()
+    try:
+        allocated = 0
+        for i in range(flips):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            flip(i)
+            allocated += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+        Widget.__init__ = original_init
+
+    result["peak_alloc_kb_per_op"] = round(allocated / flips / 1024, 2)
+    result["widgets_created"] = created[0]
+    result["grid_children"] = len(grid.children)
+    return {"calendar_flip": result, "dots_redraw": run_dots(flips)}
+
+
+def run_dots(iterations):
+    """Перерисовка вида точек на всех масштабах со случайными оценками (нужен Kivy с окном).
+
+    Время кадра - пересборка мешей и один проход EventLoop.idle(); количество
+    инструкций канвы не должно зависеть от количества точек.
+    """
+    from kivy.base import EventLoop
+    from dots_view import DotsView, LEVELS, level_period, dot_count
+
+    rng = random.Random(0)
+    view = DotsView(size=(800, 1200))
+    view.palette = {code: (code / 10, 0.5, 0.5, 1) for code in range(-1, len(RATINGS) + 1)}
+    periods = []
+    for level in LEVELS:
+        start = level_period(level, Date(1990, 6, 15) if level == "life" else Date(2024, 6, 15))[0]
+        dots = {index: rng.randint(1, len(RATINGS)) for index in range(dot_count(level, start))
+                if rng.random() < 0.8}
+        periods.append((level, start, dots))
+
+    def redraw(i):
+        view.show(*periods[i % len(periods)])
+        EventLoop.idle()
+
+    result = measure(redraw, iterations)
+    result["dots_life"] = dot_count("life", periods[0][1])
+    result["canvas_instructions"] = len(view.canvas.children)
+    return result
+
+
+def run_startup(runs):
+    """Холодный запуск приложения runs раз (нужен Kivy с окном).
+
+    Каждый запуск - отдельный процесс с пустой временной БД; приложение печатает свои
+    замеры после первого кадра экрана входа и закрывается (LIFEDOTS_STARTUP_PROBE).
+    process - от запуска процесса до получения замеров, first_frame - от импорта main
+    до первого кадра, build - время LifeDotsApp.build.
+    """
+    from main import STARTUP_PROBE_ENV, STARTUP_PROBE_PREFIX
+
+    main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    stages = {"process": [], "first_frame": [], "build": []}
+    with tempfile.TemporaryDirectory() as directory:
+        for run in range(runs):
+            env = dict(os.environ, LIFEDOTS_DB_PATH=os.path.join(directory, f"startup{run}.db"))
+            env[STARTUP_PROBE_ENV] = "1"
+            started = time.perf_counter()
+            process = subprocess.Popen([sys.executable, main_path], stdout=subprocess.PIPE,
+                                       stderr=subprocess.DEVNULL, env=env, text=True)
+            probe = None
+            for line in process.stdout:
+                if line.startswith(STARTUP_PROBE_PREFIX):
+                    stages["process"].append(time.perf_counter() - started)
+                    probe = json.loads(line[len(STARTUP_PROBE_PREFIX):])
+            process.wait()
+            if probe is None:
+                raise RuntimeError(f"Приложение завершилось без замеров запуска (код {process.returncode})")
+            stages["first_frame"].append(probe["first_frame"])
+            stages["build"].append(probe["build"])
+    return {f"startup_{stage}": summarize(timings) for stage, timings in stages.items()}
+
+
+def count_widgets():
+    """Количество живых виджетов Kivy после сборки мусора."""
+    import gc
+    from kivy.uix.widget import Widget
+
+    gc.collect()
+    return sum(1 for obj in gc.get_objects() if isinstance(obj, Widget))
+
+
+def run_leak_check(cycles):
+    """Повторяет показ всплывающих окон входа, сохранения заметки и удаления привычки
+    (нужен Kivy с окном) и сравнивает количество живых виджетов до и после."""
+    from kivy.base import EventLoop
+    from main import LifeDotsApp
+    from utils import get_popups
+
+    EventLoop.ensure_window()
+    app = LifeDotsApp()
+    app.load_kv()
+    manager = app.build()
+    login = manager.get_screen("login")
+    note = manager.get_screen("note")
+    habits = manager.get_screen("user_habits")
+    popups = get_popups()
+
+    def close(kind):
+        popups.popups[kind].dismiss(animation=False)
+        EventLoop.idle()
+
+    def cycle():
+        login.show_error("Неверное имя пользователя или пароль.")
+        close("error")
+        note.show_popup("Успех", "Данные успешно сохранены!")
+        close("info")
+        habits.show_delete_confirmation(0)
+        close("confirm")
+
+    # Первый цикл прогревает кэши текстур и шрифтов и в замер не входит
+    cycle()
+    before = count_widgets()
+    for _ in range(cycles):
+        cycle()
+    after = count_widgets()
+    return {"cycles": cycles, "widgets_before": before, "widgets_after": after, "growth": after - before}
+
+
+def compare(report, baseline, threshold):
+    """Список регрессий: операции, у которых p95 выросло больше чем в threshold раз."""
+    def results(data):
+        for size in data.get("sizes", []):
+            for name, result in size["operations"].items():
+                yield f"{name} (лет: {size['years']})", result
+        for name, result in data.get("ui", {}).items():
+            yield name, result
+        for name, result in data.get("startup", {}).items():
+            yield name, result
+        for name, result in data.get("revisions", {}).items():
+            yield name, result
+        for name, result in data.get("typing", {}).items():
+            yield name, result
+        for name, result in data.get("connection", {}).items():
+            yield name, result
+        for name, result in data.get("search", {}).items():
+            yield name, result
+        for name, result in data.get("journal", {}).items():
+            yield name, result
+        for name, result in data.get("analytics", {}).items():
+            yield name, result
+        for name, result in data.get("columns", {}).items():
+            yield name, result
+
+    previous = dict(results(baseline))
+    regressions = []
+    for key, result in results(report):
+        old = previous.get(key)
+        if (old and result["p95_ms"] > old["p95_ms"] * threshold
+                and result["p95_ms"] - old["p95_ms"] > MIN_REGRESSION_MS):
+            regressions.append(f"{key}: p95 {old['p95_ms']} -> {result['p95_ms']} мс")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк операций с БД LifeDots (отчет в JSON).")
+    parser.add_argument("--sizes", type=float, nargs="*", default=DEFAULT_SIZES,
+                        help="лет истории на пользователя (без значений - не замерять операции с БД)")
+    parser.add_argument("--users", type=int, default=DEFAULT_USERS)
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("-o", "--output", help="файл отчета (по умолчанию stdout)")
+    parser.add_argument("--baseline", help="отчет для сравнения; при регрессии код возврата 1")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--ui-months", type=int, default=0,
+                        help="пролистать календарь на столько месяцев (нужен Kivy; 0 - не замерять)")
+    parser.add_argument("--connection-reads", type=int, default=0,
+                        help="чтений заметки для сравнения соединения на вызов и общего (0 - не замерять)")
+    parser.add_argument("--search-years", type=float, default=0,
+                        help="лет истории для замера поиска по мере ввода (0 - не замерять)")
+    parser.add_argument("--typing-keys", type=int, default=0,
+                        help="нажатий в сеансе набора для замера автосохранения (0 - не замерять)")
+    parser.add_argument("--journal-years", type=float, default=0,
+                        help="лет истории для замера экспорта и импорта журнала (0 - не замерять)")
+    parser.add_argument("--revision-edits", type=int, default=0,
+                        help="правок одной заметки для замера истории ревизий (0 - не замерять)")
+    parser.add_argument("--analytics-years", type=float, default=0,
+                        help="лет истории для замера аналитики (нужен numpy; 0 - не замерять)")
+    parser.add_argument("--columns-years", type=float, default=0,
+                        help="лет истории для сравнения снимка заметок с SQLite (нужен numpy; 0 - не замерять)")
+    parser.add_argument("--startup-runs", type=int, default=0,
+                        help="холодных запусков приложения до первого кадра (нужен Kivy; 0 - не замерять)")
+    parser.add_argument("--leak-cycles", type=int, default=0,
+                        help="циклов показа всплывающих окон для проверки утечек (нужен Kivy; 0 - не проверять)")
+    args = parser.parse_args(argv)
+
+    report = {
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "sizes": [],
+    }
+    # Журнал пишется в stderr и не смешивается с JSON в stdout
+    setup_logging()
+    for years in args.sizes:
+        logger.info("Набор данных: %s польз. x %s лет", args.users, years)
+        report["sizes"].append(run_size(years, args.users, args.iterations, args.seed))
+    if args.ui_months:
+        logger.info("Календарь: %s мес. вперед и назад", args.ui_months)
+        report["ui"] = run_ui(args.ui_months)
+    if args.connection_reads:
+        logger.info("Соединения: %s чтений заметки", args.connection_reads)
+        report["connection"] = run_connection(args.connection_reads, args.seed)
+    if args.search_years:
+        logger.info("Поиск по мере ввода: %s польз. x %s лет", args.users, args.search_years)
+        report["search"] = run_search(args.search_years, args.users, args.seed)
+    if args.typing_keys:
+        logger.info("Набор заметки: %s нажатий", args.typing_keys)
+        report["typing"] = run_typing(args.typing_keys, args.seed)
+    if args.journal_years:
+        logger.info("Экспорт и импорт журнала: %s лет истории", args.journal_years)
+        report["journal"] = run_journal(args.journal_years, DEFAULT_JOURNAL_RUNS, args.seed)
+    if args.revision_edits:
+        logger.info("История заметки: %s правок", args.revision_edits)
+        report["revisions"] = run_revisions(args.revision_edits, args.seed)
+    if args.analytics_years:
+        logger.info("Аналитика: %s лет истории", args.analytics_years)
+        report["analytics"] = run_analytics(args.analytics_years, args.iterations, args.seed)
+    if args.columns_years:
+        logger.info("Снимок заметок: %s лет истории", args.columns_years)
+        report["columns"] = run_columns(args.columns_years, args.iterations, args.seed)
+    if args.startup_runs:
+        logger.info("Запуск приложения: %s раз", args.startup_runs)
+        report["startup"] = run_startup(args.startup_runs)
+    if args.leak_cycles:
+        logger.info("Проверка утечек: %s циклов всплывающих окон", args.leak_cycles)
+        report["leaks"] = run_leak_check(args.leak_cycles)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp:
+            fp.write(text)
+    else:
+        print(text)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fp:
+            regressions = compare(report, json.load(fp), args.threshold)
+    if report.get("journal", {}).get("journal_import_new", {}).get("invalid"):
+        regressions.append("импорт отклонил записи, выгруженные экспортом")
+    if report.get("typing", {}).get("typing_autosave", {}).get("saved") is False:
+        regressions.append("автосохранение не записало набранный текст")
+    if report.get("revisions", {}).get("revision_reconstruct", {}).get("mismatches"):
+        regressions.append("история заметки восстанавливается с ошибками")
+    if report.get("analytics", {}).get("analytics_cached", {}).get("stale_after_save"):
+        regressions.append("кэш аналитики не сбрасывается после сохранения заметки")
+    if report.get("columns", {}).get("scan_memmap", {}).get("matches_sqlite") is False:
+        regressions.append("снимок заметок расходится с БД")
+    if report.get("leaks", {}).get("growth", 0) > 0:
+        regressions.append(f"утечка виджетов: +{report['leaks']['growth']} за {args.leak_cycles} циклов")
+    for regression in regressions:
+        logger.error("Регрессия: %s", regression)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
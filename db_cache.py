@@ -0,0 +1,95 @@
+import threading
+from collections import OrderedDict
+
+# Размеры кэшей по умолчанию
+NOTES_CACHE_SIZE = 512
+HABITS_CACHE_SIZE = 32
+ANALYTICS_CACHE_SIZE = 8
+
+
+class LRUCache:
+    """Ограниченный LRU-кэш со счетчиками попаданий и промахов.
+
+    generation увеличивается при каждом сбросе: читатель запоминает его до запроса к БД
+    и передает в put, чтобы не положить в кэш данные, устаревшие из-за записи во время запроса.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+
+    def get(self, key, default=None):
+        """Возвращает значение по ключу и отмечает его как недавно использованное."""
+        with self.lock:
+            if key in self.data:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return self.data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value, generation=None):
+        """Сохраняет значение, вытесняя самое старое при переполнении.
+
+        Если передан generation и с тех пор кэш сбрасывался, значение не сохраняется.
+        """
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def invalidate(self, key):
+        """Удаляет один ключ из кэша."""
+        with self.lock:
+            self.generation += 1
+            self.data.pop(key, None)
+
+    def invalidate_user(self, user_id):
+        """Удаляет все ключи пользователя (ключ - user_id или кортеж, начинающийся с него)."""
+        with self.lock:
+            self.generation += 1
+            for key in [k for k in self.data if k == user_id or (isinstance(k, tuple) and k[0] == user_id)]:
+                del self.data[key]
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.data.clear()
+
+    def stats(self):
+        """Возвращает счетчики кэша."""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self.data),
+                "maxsize": self.maxsize,
+            }
+
+
+# Заметки: (user_id, date) -> словарь заметки ({} - заметки нет)
+notes_cache = LRUCache(NOTES_CACHE_SIZE)
+# Привычки: (user_id, "habits") -> [(id, name, buttons)], (user_id, "saved") -> {habit_name: set(buttons)}
+habits_cache = LRUCache(HABITS_CACHE_SIZE)
+# Аналитика: user_id -> analytics.HistoryAnalytics (сбрасывается при любой записи заметок пользователя)
+analytics_cache = LRUCache(ANALYTICS_CACHE_SIZE)
+
+
+def get_cache_stats():
+    """Счетчики всех кэшей репозитория."""
+    return {"notes": notes_cache.stats(), "habits": habits_cache.stats(), "analytics": analytics_cache.stats()}
+
+
+def clear_caches():
+    notes_cache.clear()
+    habits_cache.clear()
+    analytics_cache.clear()
@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import threading
+
+import metrics
+from log_setup import get_logger
+
+logger = get_logger("db_connection")
+
+# Путь к базе данных по умолчанию (можно переопределить переменной окружения LIFEDOTS_DB_PATH)
+DEFAULT_DB_PATH = "app_data.db"
+
+# Размер кэша подготовленных выражений для каждого соединения
+CACHED_STATEMENTS = 128
+
+# Прагмы, применяемые к каждому новому соединению
+PRAGMAS = (
+    ("journal_mode", "WAL"),     # читатели не блокируют писателя
+    ("synchronous", "NORMAL"),   # в режиме WAL безопасно и без fsync на каждый commit
+    ("temp_store", "MEMORY"),
+    ("cache_size", -8000),       # ~8 МБ страничного кэша
+)
+
+_db_path = os.environ.get("LIFEDOTS_DB_PATH", DEFAULT_DB_PATH)
+_local = threading.local()
+_lock = threading.Lock()
+_connections = []  # Все открытые соединения, чтобы закрыть их при выходе
+_generation = 0    # Увеличивается при close_all, чтобы потоки переоткрыли свои соединения
+
+
+def get_db_path():
+    """Возвращает путь к текущей базе данных."""
+    return _db_path
+
+
+def set_db_path(path):
+    """Меняет путь к базе данных и закрывает все открытые соединения."""
+    global _db_path
+    close_all()
+    _db_path = path
+
+
+def open_connection(path):
+    """Открывает соединение и применяет к нему прагмы.
+
+    Соединения, открытые напрямую (например, со второй базой при синхронизации),
+    не попадают в список потоков и закрываются вызывающим кодом."""
+    connection = sqlite3.connect(path, cached_statements=CACHED_STATEMENTS, check_same_thread=False)
+    cursor = connection.cursor()
+    for name, value in PRAGMAS:
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+    if metrics.is_enabled():
+        connection.set_trace_callback(metrics.statement_tracer(connection))
+    return connection
+
+
+def _on_metrics_toggle(enabled):
+    """Включает или снимает подсчет выражений на уже открытых соединениях."""
+    with _lock:
+        connections = list(_connections)
+    for connection in connections:
+        connection.set_trace_callback(metrics.statement_tracer(connection) if enabled else None)
+
+
+metrics.add_toggle_hook(_on_metrics_toggle)
+
+
+def get_connection():
+    """Возвращает долгоживущее соединение текущего потока, открывая его при первом обращении."""
+    connection = getattr(_local, "connection", None)
+    if connection is not None and _local.generation == _generation:
+        return connection
+
+    connection = open_connection(_db_path)
+    _local.connection = connection
+    _local.generation = _generation
+    with _lock:
+        _connections.append(connection)
+    return connection
+
+
+def close_connection():
+    """Закрывает соединение текущего потока."""
+    connection = getattr(_local, "connection", None)
+    if connection is None:
+        return
+    _local.connection = None
+    with _lock:
+        if connection in _connections:
+            _connections.remove(connection)
+    connection.close()
+
+
+def close_all():
+    """Закрывает соединения всех потоков (при выходе из приложения или смене базы)."""
+    global _generation
+    with _lock:
+        connections = list(_connections)
+        _connections.clear()
+        _generation += 1
+    for connection in connections:
+        try:
+            connection.close()
+        except sqlite3.Error as e:
+            logger.error("Ошибка при закрытии соединения: %s", e)
+    _local.connection = None
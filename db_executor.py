@@ -0,0 +1,69 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from kivy.clock import Clock
+
+from log_setup import get_logger
+
+logger = get_logger("db_executor")
+
+# Один рабочий поток: запросы выполняются строго по очереди (удаление -> перезагрузка списка и т.п.)
+DB_WORKERS = 1
+
+
+class DBExecutor:
+    """Выполняет операции с БД в фоновом потоке и возвращает результат в UI-поток."""
+
+    def __init__(self, workers=DB_WORKERS):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lifedots-db")
+
+    def submit(self, func, *args, callback=None, error_callback=None, **kwargs):
+        """Запускает func(*args, **kwargs) в фоне и возвращает Future.
+
+        callback(result) и error_callback(exception) вызываются в UI-потоке через Clock.schedule_once.
+        """
+        future = self.pool.submit(func, *args, **kwargs)
+        if callback is not None or error_callback is not None:
+            future.add_done_callback(partial(self._schedule_delivery, callback, error_callback))
+        return future
+
+    async def run(self, func, *args, **kwargs):
+        """Вариант для asyncio: result = await db_executor.run(func, ...)."""
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait)
+
+    def _schedule_delivery(self, callback, error_callback, future):
+        Clock.schedule_once(partial(self._deliver, callback, error_callback, future))
+
+    def _deliver(self, callback, error_callback, future, dt):
+        error = future.exception()
+        if error is not None:
+            if error_callback is not None:
+                error_callback(error)
+            else:
+                logger.error("Ошибка фоновой операции с БД: %s", error, exc_info=error)
+            return
+        if callback is not None:
+            callback(future.result())
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Общий исполнитель запросов приложения (создается при первом обращении)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = DBExecutor()
+        return _executor
+
+
+def run_in_background(func, *args, callback=None, error_callback=None, **kwargs):
+    """Короткая форма get_executor().submit(...)."""
+    return get_executor().submit(func, *args, callback=callback, error_callback=error_callback, **kwargs)
@@ -1,225 +1,812 @@
+import calendar
+import re
+from datetime import date as Date, timedelta
 import sqlite3
-from kivy.app import App
+from db_connection import get_connection
+from db_migrations import migrate
+from db_cache import notes_cache, habits_cache, analytics_cache
+from log_setup import get_logger, setup_logging
+from metrics import timed
+from rollups import PERIODS, period_start, note_rollup_deltas, apply_rollup_deltas
+from revisions import revision_rows, reconstruct
+from vocabulary import RATINGS, EMOTIONS, PEOPLE, WEATHER, encode_code, decode_code, encode_mask, encode_note, decode_note
 
+logger = get_logger("db_manager")
+
+@timed("db")
 def init_db():
+    """Приводит схему БД к актуальной версии (см. db_migrations)."""
     try:
-        print("[INFO] Запуск создания базы данных...")
-        create_user_table()
-        create_notes_table()
-        update_notes_table()
-        create_habits_table()
-        create_saved_habits_table()
-        print("[INFO] Все таблицы обновлены.")
-    except Exception as e:
-        print("[ERROR] Ошибка при инициализации БД:", e)
-
-# Функция для создания таблицы пользовательских привычек
-def create_habits_table():
-    """Создает таблицу с пользовательскими привычками."""
-    try:
-        connection = sqlite3.connect("app_data.db")
-        cursor = connection.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS habits (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                buttons TEXT NOT NULL,
-                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-        """)
+        migrate(get_connection())
+    except sqlite3.Error as e:
+        logger.error("Ошибка при инициализации БД: %s", e)
+
+@timed("db")
+def save_note_to_db(date, note, user_id, day_rating=None, emotions=None, people=None, weather=None):
+    """Сохраняет или обновляет данные заметки. Возвращает True при успехе."""
+    if user_id is None:
+        logger.error("Текущий пользователь не установлен.")
+        return False
+
+    saved = save_notes_to_db([(user_id, date, note, day_rating, emotions, people, weather)])
+    if saved:
+        logger.debug("Данные для %s пользователя %s сохранены.", date, user_id)
+    return saved
+
+@timed("db")
+def save_notes_to_db(rows):
+    """Сохраняет пачку заметок одной транзакцией (одним commit).
+
+    rows - последовательность кортежей (user_id, date, note, day_rating, emotions, people, weather),
+    где оценка, эмоции, люди и погода - подписи кнопок (они кодируются через vocabulary).
+    Возвращает True при успехе.
+    """
+    encoded = [(user_id, date, note) + encode_note(*labels) for user_id, date, note, *labels in rows]
+    connection = get_connection()
+    cursor = connection.cursor()
+    try:
+        write_notes(cursor, encoded)
         connection.commit()
+        return True
     except sqlite3.Error as e:
-        print("[ERROR] Ошибка при создании таблицы habits:", e)
+        connection.rollback()
+        logger.error("Ошибка при сохранении заметки: %s", e)
+        return False
     finally:
-        connection.close()
+        for row in encoded:
+            notes_cache.invalidate((row[0], row[1]))
+            analytics_cache.invalidate(row[0])
+
+# Максимальное число дат в одном IN (...) (лимит параметров SQLite по умолчанию - 999)
+IN_CHUNK_SIZE = 500
+
+# Запись заметки: обновляем строку, если для этой даты и пользователя она уже существует
+UPSERT_NOTE_SQL = """
+    INSERT INTO notes (user_id, date, note, rating_code, emotions_mask, people_mask, weather_code)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, date) DO UPDATE SET
+        note = excluded.note,
+        rating_code = excluded.rating_code,
+        emotions_mask = excluded.emotions_mask,
+        people_mask = excluded.people_mask,
+        weather_code = excluded.weather_code
+"""
+
+@timed("db")
+def fetch_notes_by_dates(cursor, user_id, dates):
+    """Существующие заметки пользователя за даты (с кодами):
+    {date: (note, rating_code, emotions_mask, people_mask, weather_code)}."""
+    dates = list(dates)
+    existing = {}
+    for i in range(0, len(dates), IN_CHUNK_SIZE):
+        chunk = dates[i:i + IN_CHUNK_SIZE]
+        cursor.execute(f"""
+            SELECT date, note, rating_code, emotions_mask, people_mask, weather_code FROM notes
+            WHERE user_id = ? AND date IN ({",".join("?" * len(chunk))})
+        """, [user_id] + chunk)
+        for row in cursor.fetchall():
+            existing[row[0]] = row[1:]
+    return existing
+
+def _same_note(old, new):
+    """Совпадают ли состояния заметки (note, коды...); пустой текст и NULL считаются равными."""
+    return (old[0] or "") == (new[0] or "") and tuple(old[1:]) == tuple(new[1:])
+
+def _next_revisions(cursor, user_id, dates):
+    """Номера следующих ревизий заметок за даты: {date: номер}."""
+    dates = list(dates)
+    numbers = {date: 1 for date in dates}
+    for i in range(0, len(dates), IN_CHUNK_SIZE):
+        chunk = dates[i:i + IN_CHUNK_SIZE]
+        cursor.execute(f"""
+            SELECT date, MAX(revision) FROM note_revisions
+            WHERE user_id = ? AND date IN ({",".join("?" * len(chunk))})
+            GROUP BY date
+        """, [user_id] + chunk)
+        for date, revision in cursor.fetchall():
+            numbers[date] = revision + 1
+    return numbers
+
+INSERT_REVISION_SQL = """
+    INSERT INTO note_revisions (user_id, date, revision, snapshot, data,
+                                rating_code, emotions_mask, people_mask, weather_code)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+@timed("db")
+def write_notes(cursor, rows):
+    """Пишет заметки в текущей транзакции (без commit) и обновляет агрегаты настроения.
+
+    rows - кортежи (user_id, date, note, rating_code, emotions_mask, people_mask, weather_code);
+    для повторяющихся (user_id, date) остается последняя строка. Прежние коды дней читаются
+    одним запросом на пачку, чтобы вычесть их вклад из агрегатов. Неизмененные заметки
+    не перезаписываются, а прежнее состояние измененных сохраняется в note_revisions.
+    """
+    latest = {(row[0], row[1]): tuple(row) for row in rows}
+    dates_by_user = {}
+    for user_id, date in latest:
+        dates_by_user.setdefault(user_id, []).append(date)
+
+    rollup_deltas = {}
+    revisions = []
+    for user_id, dates in dates_by_user.items():
+        existing = fetch_notes_by_dates(cursor, user_id, dates)
+        changed = []
+        for date in dates:
+            old = existing.get(date)
+            if old is not None:
+                if _same_note(old, latest[(user_id, date)][2:]):
+                    del latest[(user_id, date)]
+                    continue
+                changed.append(date)
+                note_rollup_deltas(rollup_deltas, user_id, date, old[1:], -1)
+            note_rollup_deltas(rollup_deltas, user_id, date, latest[(user_id, date)][3:], +1)
+        if changed:
+            numbers = _next_revisions(cursor, user_id, changed)
+            revisions.extend(revision_rows(user_id, date, numbers[date], existing[date], latest[(user_id, date)][2:])
+                             for date in changed)
 
-def create_saved_habits_table():
-    """Создает таблицу для сохраненных привычек."""
+    cursor.executemany(UPSERT_NOTE_SQL, latest.values())
+    cursor.executemany(INSERT_REVISION_SQL, revisions)
+    apply_rollup_deltas(cursor, rollup_deltas)
+
+@timed("db")
+def delete_notes(cursor, user_id, dates):
+    """Удаляет заметки пользователя за даты в текущей транзакции (без commit).
+
+    Последнее состояние каждой заметки остается в истории целиком, агрегаты пересчитываются.
+    """
+    existing = fetch_notes_by_dates(cursor, user_id, dates)
+    if not existing:
+        return
+    numbers = _next_revisions(cursor, user_id, existing)
+    rollup_deltas = {}
+    for date, old in existing.items():
+        note_rollup_deltas(rollup_deltas, user_id, date, old[1:], -1)
+    cursor.executemany("DELETE FROM notes WHERE user_id = ? AND date = ?", [(user_id, date) for date in existing])
+    cursor.executemany(INSERT_REVISION_SQL,
+                       [revision_rows(user_id, date, numbers[date], old, None) for date, old in existing.items()])
+    apply_rollup_deltas(cursor, rollup_deltas)
+    for date in existing:
+        notes_cache.invalidate((user_id, date))
+    analytics_cache.invalidate(user_id)
+
+@timed("db")
+def get_note_revisions(user_id, date):
+    """Список ревизий заметки от новых к старым: [{"revision", "replaced_at", "day_rating", "snapshot", "stored_size"}].
+
+    replaced_at - когда это состояние было заменено следующим; текущий текст заметки в список не входит.
+    """
+    connection = get_connection()
+    cursor = connection.cursor()
     try:
-        connection = sqlite3.connect("app_data.db")
-        cursor = connection.cursor()
-        print("[INFO] Создание таблицы saved_habits...")
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS saved_habits (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                habit_name TEXT NOT NULL,
-                selected_buttons TEXT NOT NULL,
-                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-        """)
-        connection.commit()
-        print("[INFO] Таблица saved_habits создана или уже существует.")
+            SELECT revision, replaced_at, rating_code, snapshot, length(data) FROM note_revisions
+            WHERE user_id = ? AND date = ?
+            ORDER BY revision DESC
+        """, (user_id, date))
+        rows = cursor.fetchall()
     except sqlite3.Error as e:
-        print("[ERROR] Ошибка при создании таблицы saved_habits:", e)
-    finally:
-        connection.close()
+        logger.error("Ошибка при загрузке истории заметки: %s", e)
+        return []
+    return [{"revision": revision, "replaced_at": replaced_at, "day_rating": decode_code(rating_code, RATINGS),
+             "snapshot": bool(snapshot), "stored_size": size}
+            for revision, replaced_at, rating_code, snapshot, size in rows]
 
+@timed("db")
+def get_note_revision(user_id, date, revision):
+    """Состояние заметки в ревизии revision (как get_note_from_db) или {}, если ревизии нет.
 
-# Функция для создания таблицы пользователей
-def create_user_table():
+    Восстановление идет от ближайшего более нового снимка (или текущей заметки) и
+    применяет не больше REVISION_SNAPSHOT_INTERVAL - 1 дельт.
+    """
+    connection = get_connection()
+    cursor = connection.cursor()
     try:
-        connection = sqlite3.connect("app_data.db")
-        cursor = connection.cursor()
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL UNIQUE,
-                password TEXT NOT NULL
-            )
-        """)
+            SELECT MIN(revision) FROM note_revisions
+            WHERE user_id = ? AND date = ? AND revision >= ? AND snapshot = 1
+        """, (user_id, date, revision))
+        snapshot = cursor.fetchone()[0]
+        current_text = ""
+        if snapshot is None:
+            cursor.execute("SELECT note FROM notes WHERE user_id = ? AND date = ?", (user_id, date))
+            row = cursor.fetchone()
+            if row is None:
+                return {}
+            current_text = row[0] or ""
+        cursor.execute("""
+            SELECT revision, snapshot, data, rating_code, emotions_mask, people_mask, weather_code
+            FROM note_revisions
+            WHERE user_id = ? AND date = ? AND revision >= ? AND (? IS NULL OR revision <= ?)
+            ORDER BY revision DESC
+        """, (user_id, date, revision, snapshot, snapshot))
+        chain = cursor.fetchall()
+    except sqlite3.Error as e:
+        logger.error("Ошибка при загрузке ревизии заметки: %s", e)
+        return {}
+    if not chain or chain[-1][0] != revision:
+        return {}
+    text = reconstruct(current_text, [(is_snapshot, data) for _, is_snapshot, data, *_ in chain])
+    return note_row_to_dict((text,) + tuple(chain[-1][3:]))
+
+@timed("db")
+def restore_note_revision(user_id, date, revision):
+    """Делает ревизию текущим состоянием заметки (текущее уходит в историю).
+
+    Возвращает восстановленную заметку или {}, если ревизии нет.
+    """
+    note_data = get_note_revision(user_id, date, revision)
+    if not note_data:
+        return {}
+    row = (user_id, date, note_data["note"]) + encode_note(
+        note_data["day_rating"], note_data["emotions"], note_data["people"], note_data["weather"])
+    connection = get_connection()
+    cursor = connection.cursor()
+    try:
+        write_notes(cursor, [row])
         connection.commit()
     except sqlite3.Error as e:
-        print("Ошибка при подключении к базе данных:", e)
+        connection.rollback()
+        logger.error("Ошибка при восстановлении ревизии заметки: %s", e)
+        return {}
     finally:
-        connection.close()
+        notes_cache.invalidate((user_id, date))
+        analytics_cache.invalidate(user_id)
+    return note_data
+
+@timed("db")
+def get_note_from_db(date, user_id=None):
+    if user_id is None:
+        from kivy.app import App  # Импорт здесь: db_manager используется и без UI (journal_io)
+        user_id = App.get_running_app().current_user_id
+    logger.debug("Получение заметки для user_id=%s, date=%s", user_id, date)
+
+    if user_id is None:
+        logger.error("Пользователь не вошел в систему.")
+        return {}
+
+    cached = notes_cache.get((user_id, date))
+    if cached is not None:
+        return dict(cached)
 
-# Функция для добавления пользователя
-def save_user_to_db(username, password):
+    generation = notes_cache.generation
+    connection = get_connection()
+    cursor = connection.cursor()
     try:
-        connection = sqlite3.connect("app_data.db")
-        cursor = connection.cursor()
-        cursor.execute("SELECT password FROM users WHERE username = ?", (username,))
-        existing_user = cursor.fetchone()
+        cursor.execute("""
+            SELECT note, rating_code, emotions_mask, people_mask, weather_code
+            FROM notes
+            WHERE user_id = ? AND date = ?
+        """, (user_id, date))
+        result = cursor.fetchone()
+
+        logger.debug("Результат запроса: %s", result)
+
+        note_data = note_row_to_dict(result) if result else {}
+        notes_cache.put((user_id, date), note_data, generation)
+        return dict(note_data)
 
-        if existing_user:
-            if existing_user[0] == password:
-                return "Пользователь уже существует с этим паролем."
-            else:
-                return "Пользователь существует, но пароль не совпадает."
-        else:
-            cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, password))
-            connection.commit()
-            return "Пользователь успешно зарегистрирован!"
     except sqlite3.Error as e:
-        print("Ошибка при добавлении пользователя:", e)
-        return "Ошибка при добавлении пользователя."
-    finally:
-        connection.close()
+        logger.error("Ошибка при загрузке заметки: %s", e)
+        return {}
+
+def note_row_to_dict(row):
+    """Преобразует строку (note, rating_code, emotions_mask, people_mask, weather_code) в словарь заметки."""
+    note_data = {"note": row[0] if row[0] else ""}
+    note_data.update(decode_note(*row[1:]))
+    return note_data
 
-# Функция для создания таблицы заметок
-def create_notes_table():
-    """Создает таблицу заметок, если она еще не существует."""
+@timed("db")
+def get_notes_for_range(user_id, start_date, end_date):
+    """Возвращает заметки пользователя за период [start_date, end_date] одним запросом.
+
+    Даты в формате YYYY-MM-DD; результат - словарь {дата: заметка}.
+    Запрос идет по индексу UNIQUE(user_id, date).
+    """
+    if user_id is None:
+        return {}
+
+    generation = notes_cache.generation
+    connection = get_connection()
+    cursor = connection.cursor()
     try:
-        connection = sqlite3.connect("app_data.db")
-        cursor = connection.cursor()
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS notes (
-                date TEXT NOT NULL,
-                note TEXT,
-                user_id INTEGER NOT NULL,
-                day_rating TEXT,
-                emotions TEXT,
-                people TEXT,
-                weather TEXT,
-                PRIMARY KEY (user_id, date),
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
-        connection.commit()
+            SELECT date, note, rating_code, emotions_mask, people_mask, weather_code
+            FROM notes
+            WHERE user_id = ? AND date BETWEEN ? AND ?
+        """, (user_id, start_date, end_date))
+        notes = {row[0]: note_row_to_dict(row[1:]) for row in cursor.fetchall()}
     except sqlite3.Error as e:
-        print("Ошибка при создании таблицы заметок:", e)
-    finally:
-        connection.close()
+        logger.error("Ошибка при загрузке заметок за период: %s", e)
+        return {}
 
-# Функция для обновления таблицы заметок, добавляя недостающие колонки
-def update_notes_table():
-    """Обновляет таблицу заметок, добавляя недостающие колонки."""
-    connection = sqlite3.connect("app_data.db")
-    cursor = connection.cursor()
+    # Прогреваем кэш отдельных дней
+    for date, note_data in notes.items():
+        notes_cache.put((user_id, date), note_data, generation)
+    return {date: dict(note_data) for date, note_data in notes.items()}
+
+@timed("db")
+def get_notes_for_month(user_id, year, month):
+    """Возвращает заметки пользователя за месяц: {дата: заметка}."""
+    last_day = calendar.monthrange(year, month)[1]
+    return get_notes_for_range(user_id, f"{year:04d}-{month:02d}-01", f"{year:04d}-{month:02d}-{last_day:02d}")
+
+@timed("db")
+def find_notes_by_codes(user_id, day_rating=None, emotions=(), people=(), weather=None,
+                        start_date=None, end_date=None):
+    """Возвращает даты заметок, где выбраны все указанные эмоции и люди (и оценка/погода, если заданы).
+
+    Фильтрация идет целочисленными операциями над масками по покрывающему индексу
+    idx_notes_user_codes, без разбора строк.
+    """
+    emotions_mask = encode_mask(emotions, EMOTIONS)
+    people_mask = encode_mask(people, PEOPLE)
+    query = """
+        SELECT date FROM notes
+        WHERE user_id = ? AND date BETWEEN ? AND ?
+          AND (emotions_mask & ?) = ? AND (people_mask & ?) = ?
+    """
+    params = [user_id, start_date or "0000-00-00", end_date or "9999-99-99",
+              emotions_mask, emotions_mask, people_mask, people_mask]
+    if day_rating:
+        query += " AND rating_code = ?"
+        params.append(encode_code(day_rating, RATINGS))
+    if weather:
+        query += " AND weather_code = ?"
+        params.append(encode_code(weather, WEATHER))
+    query += " ORDER BY date"
 
-    # Проверяем и добавляем колонку day_rating
+    connection = get_connection()
+    cursor = connection.cursor()
     try:
-        cursor.execute("ALTER TABLE notes ADD COLUMN day_rating TEXT")
-    except sqlite3.OperationalError:
-        print("Колонка 'day_rating' уже существует.")
+        cursor.execute(query, params)
+        return [row[0] for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        logger.error("Ошибка при поиске заметок: %s", e)
+        return []
+
+# Маркеры начала и конца совпадения в сниппетах результатов поиска
+SNIPPET_START = "\x02"
+SNIPPET_END = "\x03"
+SEARCH_PAGE_SIZE = 20
+
+def build_fts_query(text):
+    """Превращает ввод пользователя в безопасный запрос FTS5.
+
+    Все слова должны встречаться в заметке; последнее слово ищется по префиксу (ввод еще не закончен).
+    """
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return ""
+    terms = [f'"{word}"' for word in words[:-1]] + [f'"{words[-1]}"*']
+    return " ".join(terms)
+
+def escape_like(text):
+    """Экранирует \\, % и _ для LIKE ... ESCAPE '\\': ввод ищется как обычный текст."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+@timed("db")
+def search_notes(user_id, text, start_date=None, end_date=None, day_rating=None,
+                 limit=SEARCH_PAGE_SIZE, offset=0):
+    """Полнотекстовый поиск по заметкам пользователя.
+
+    Возвращает (results, has_more), где results - список словарей
+    {"date", "snippet", "day_rating"} в порядке релевантности (bm25). Совпадения в сниппете
+    обрамлены SNIPPET_START/SNIPPET_END.
+    """
+    fts_query = build_fts_query(text)
+    if user_id is None or not fts_query:
+        return [], False
+
+    filters = " AND n.date BETWEEN ? AND ?"
+    filter_params = [start_date or "0000-00-00", end_date or "9999-99-99"]
+    if day_rating:
+        filters += " AND n.rating_code = ?"
+        filter_params.append(encode_code(day_rating, RATINGS))
 
-    # Проверяем и добавляем колонку emotions
+    connection = get_connection()
+    cursor = connection.cursor()
     try:
-        cursor.execute("ALTER TABLE notes ADD COLUMN emotions TEXT")
-    except sqlite3.OperationalError:
-        print("Колонка 'emotions' уже существует.")
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'notes_fts'")
+        if cursor.fetchone():
+            cursor.execute(f"""
+                SELECT n.date, snippet(notes_fts, 0, ?, ?, '…', 12), n.rating_code
+                FROM notes_fts
+                JOIN notes n ON n.id = notes_fts.rowid
+                WHERE notes_fts MATCH ? AND n.user_id = ?{filters}
+                ORDER BY bm25(notes_fts)
+                LIMIT ? OFFSET ?
+            """, [SNIPPET_START, SNIPPET_END, fts_query, user_id] + filter_params + [limit + 1, offset])
+        else:
+            # SQLite без FTS5: поиск подстроки без ранжирования
+            cursor.execute(f"""
+                SELECT n.date, substr(n.note, 1, 120), n.rating_code
+                FROM notes n
+                WHERE n.note LIKE ? ESCAPE '\\' AND n.user_id = ?{filters}
+                ORDER BY n.date DESC
+                LIMIT ? OFFSET ?
+            """, [f"%{escape_like(text.strip())}%", user_id] + filter_params + [limit + 1, offset])
+        rows = cursor.fetchall()
+    except sqlite3.Error as e:
+        logger.error("Ошибка при поиске заметок: %s", e)
+        return [], False
+
+    results = [
+        {"date": date, "snippet": snippet or "", "day_rating": decode_code(rating_code, RATINGS)}
+        for date, snippet, rating_code in rows[:limit]
+    ]
+    return results, len(rows) > limit
+
+@timed("db")
+def get_user_habits(user_id):
+    """Возвращает привычки пользователя: список (id, name, buttons)."""
+    cached = habits_cache.get((user_id, "habits"))
+    if cached is not None:
+        return list(cached)
 
-    # Проверяем и добавляем колонку people
+    generation = habits_cache.generation
+    connection = get_connection()
+    cursor = connection.cursor()
     try:
-        cursor.execute("ALTER TABLE notes ADD COLUMN people TEXT")
-    except sqlite3.OperationalError:
-        print("Колонка 'people' уже существует.")
+        cursor.execute("SELECT id, name, buttons FROM habits WHERE user_id = ?", (user_id,))
+        habits = cursor.fetchall()
+    except sqlite3.Error as e:
+        logger.error("Ошибка при загрузке привычек: %s", e)
+        return []
+    habits_cache.put((user_id, "habits"), habits, generation)
+    return list(habits)
+
+@timed("db")
+def get_saved_habits(user_id):
+    """Возвращает выбранные кнопки привычек: {habit_name: set(кнопок)}."""
+    cached = habits_cache.get((user_id, "saved"))
+    if cached is not None:
+        return {name: set(buttons) for name, buttons in cached.items()}
 
-    # Проверяем и добавляем колонку weather
+    generation = habits_cache.generation
+    connection = get_connection()
+    cursor = connection.cursor()
     try:
-        cursor.execute("ALTER TABLE notes ADD COLUMN weather TEXT")
-    except sqlite3.OperationalError:
-        print("Колонка 'weather' уже существует.")
+        cursor.execute("SELECT habit_name, selected_buttons FROM saved_habits WHERE user_id = ?", (user_id,))
+        rows = cursor.fetchall()
+    except sqlite3.Error as e:
+        logger.error("Ошибка при загрузке сохраненных привычек: %s", e)
+        return {}
 
-    connection.commit()
-    connection.close()
+    saved = {}
+    for habit_name, selected_buttons in rows:
+        saved[habit_name] = set(selected_buttons.split(','))
+    habits_cache.put((user_id, "saved"), saved, generation)
+    return {name: set(buttons) for name, buttons in saved.items()}
 
-def save_note_to_db(date, note, user_id, day_rating=None, emotions=None, people=None, weather=None):
-    """Сохраняет или обновляет данные заметки."""
-    if user_id is None:
-        print("Ошибка: текущий пользователь не установлен.")
-        return
+@timed("db")
+def add_habit_to_db(user_id, name, button_names):
+    """Добавляет привычку. Возвращает False, если такая привычка уже есть."""
+    connection = get_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT id FROM habits WHERE user_id = ? AND name = ?", (user_id, name))
+        if cursor.fetchone():
+            return False
+        cursor.execute("INSERT INTO habits (user_id, name, buttons) VALUES (?, ?, ?)",
+                       (user_id, name, ",".join(button_names)))
+        connection.commit()
+        return True
+    except sqlite3.Error as e:
+        connection.rollback()
+        logger.error("Ошибка при сохранении привычки: %s", e)
+        return False
+    finally:
+        habits_cache.invalidate((user_id, "habits"))
 
-    connection = sqlite3.connect("app_data.db")
+@timed("db")
+def delete_habit_from_db(user_id, habit_id):
+    """Удаляет привычку пользователя."""
+    connection = get_connection()
     cursor = connection.cursor()
     try:
-        # Запрос с заменой данных, если уже существует запись для этой даты и пользователя
-        cursor.execute("""
-            INSERT OR REPLACE INTO notes (user_id, date, note, day_rating, emotions, people, weather)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (user_id, date, note, day_rating, emotions, people, weather))
+        cursor.execute("DELETE FROM habits WHERE user_id = ? AND id = ?", (user_id, habit_id))
+        cursor.execute("DELETE FROM habit_log WHERE user_id = ? AND habit_id = ?", (user_id, habit_id))
+        cursor.execute("DELETE FROM habit_stats WHERE user_id = ? AND habit_id = ?", (user_id, habit_id))
+        connection.commit()
+    except sqlite3.Error as e:
+        connection.rollback()
+        logger.error("Ошибка при удалении привычки: %s", e)
+    finally:
+        habits_cache.invalidate((user_id, "habits"))
 
+@timed("db")
+def save_selected_habits_to_db(user_id, selected_habits):
+    """Перезаписывает выбранные кнопки привычек: {habit_name: [кнопки]}.
+
+    Меняются только строки, которые отличаются от сохраненных: так журнал
+    синхронизации (sync_log) получает записи лишь о реально измененных привычках.
+    """
+    selected = {habit: ",".join(buttons) for habit, buttons in selected_habits.items() if buttons}
+    connection = get_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT habit_name, selected_buttons FROM saved_habits WHERE user_id = ?", (user_id,))
+        existing = dict(cursor.fetchall())
+        cursor.executemany(
+            "DELETE FROM saved_habits WHERE user_id = ? AND habit_name = ?",
+            [(user_id, habit) for habit in existing if habit not in selected]
+        )
+        cursor.executemany(
+            "UPDATE saved_habits SET selected_buttons = ? WHERE user_id = ? AND habit_name = ?",
+            [(buttons, user_id, habit) for habit, buttons in selected.items()
+             if habit in existing and existing[habit] != buttons]
+        )
+        cursor.executemany(
+            "INSERT INTO saved_habits (user_id, habit_name, selected_buttons) VALUES (?, ?, ?)",
+            [(user_id, habit, buttons) for habit, buttons in selected.items() if habit not in existing]
+        )
         connection.commit()
-        print(f"Данные для {date} пользователя {user_id} сохранены.")
     except sqlite3.Error as e:
-        print("Ошибка при сохранении заметки:", e)
+        connection.rollback()
+        logger.error("Ошибка при сохранении выбранных привычек: %s", e)
     finally:
-        connection.close()
+        habits_cache.invalidate((user_id, "saved"))
 
-def get_note_from_db(date):
-    app = App.get_running_app()
-    user_id = app.current_user_id
-    print(f"[DEBUG] Получение заметки для user_id={user_id}, date={date}")
+@timed("db")
+def get_mood_stats(user_id, period, date):
+    """Статистика настроения за период (week, month или year), содержащий дату date.
 
-    if user_id is None:
-        print("[ERROR] User is not logged in!")
+    Читает только строки агрегатов одного периода по первичному ключу. Возвращает
+    {"period_start", "notes", "ratings": {оценка: n}, "emotions": {эмоция: n}, "weather": {погода: n}}.
+    """
+    if period not in PERIODS:
+        raise ValueError(f"Неизвестный период: {period}")
+    start = period_start(date, period)
+    stats = {"period_start": start, "notes": 0, "ratings": {}, "emotions": {}, "weather": {}}
+
+    connection = get_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            SELECT metric, code, count FROM mood_rollups
+            WHERE user_id = ? AND period = ? AND period_start = ?
+        """, (user_id, period, start))
+        rows = cursor.fetchall()
+    except sqlite3.Error as e:
+        logger.error("Ошибка при загрузке статистики настроения: %s", e)
+        return stats
+
+    for metric, code, count in rows:
+        if metric == "notes":
+            stats["notes"] = count
+        elif metric == "rating":
+            stats["ratings"][decode_code(code, RATINGS)] = count
+        elif metric == "weather":
+            stats["weather"][decode_code(code, WEATHER)] = count
+        elif metric == "emotion":
+            stats["emotions"][decode_code(code, EMOTIONS)] = count
+    return stats
+
+# Номер точки для get_rating_dots: день от начала периода или неделя "жизни в неделях"
+# (строка - год от начала периода, 52 недели в строке, последняя неделя года включает 1-2 лишних дня)
+DOT_BUCKETS = {
+    "day": "CAST(julianday(date) - julianday(:start) AS INTEGER)",
+    "week": ("(CAST(strftime('%Y', date) AS INTEGER) - CAST(strftime('%Y', :start) AS INTEGER)) * 52"
+             " + MIN(51, (CAST(strftime('%j', date) AS INTEGER) - 1) / 7)"),
+}
+
+@timed("db")
+def get_rating_dots(user_id, start_date, end_date, bucket="day"):
+    """Оценки дней за период одним агрегирующим запросом: {номер точки: код оценки}.
+
+    Для bucket="week" код - округленная средняя оценка недели. Дни без оценки
+    в результат не попадают. Запрос читает только покрывающий индекс idx_notes_user_codes.
+    """
+    if bucket not in DOT_BUCKETS:
+        raise ValueError(f"Неизвестная группировка: {bucket}")
+    connection = get_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT {DOT_BUCKETS[bucket]} AS dot, CAST(ROUND(AVG(rating_code)) AS INTEGER)
+            FROM notes
+            WHERE user_id = :user_id AND date BETWEEN :start AND :end AND rating_code > 0
+            GROUP BY dot
+        """, {"user_id": user_id, "start": start_date, "end": end_date})
+        return dict(cursor.fetchall())
+    except sqlite3.Error as e:
+        logger.error("Ошибка при загрузке оценок для точек: %s", e)
         return {}
 
-    connection = sqlite3.connect("app_data.db")
+@timed("db")
+def get_note_codes(user_id):
+    """Коды всех заметок пользователя: [(rating_code, emotions_mask, people_mask, weather_code)].
+
+    Читается только покрывающий индекс idx_notes_user_codes.
+    """
+    connection = get_connection()
     cursor = connection.cursor()
     try:
-        cursor.execute(""" 
-            SELECT note, day_rating, emotions, people, weather 
-            FROM notes 
-            WHERE user_id = ? AND date = ? 
-        """, (user_id, date))
-        result = cursor.fetchone()
+        cursor.execute("""
+            SELECT rating_code, emotions_mask, people_mask, weather_code FROM notes WHERE user_id = ?
+        """, (user_id,))
+        return cursor.fetchall()
+    except sqlite3.Error as e:
+        logger.error("Ошибка при загрузке кодов заметок: %s", e)
+        return []
+
+@timed("db")
+def get_first_note_date(user_id):
+    """Дата самой ранней заметки пользователя (None, если заметок нет)."""
+    connection = get_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT MIN(date) FROM notes WHERE user_id = ?", (user_id,))
+        return cursor.fetchone()[0]
+    except sqlite3.Error as e:
+        logger.error("Ошибка при загрузке даты первой заметки: %s", e)
+        return None
+
+def _shift_date(date, days):
+    return (Date.fromisoformat(date) + timedelta(days=days)).isoformat()
 
-        print(f"[DEBUG] Результат запроса: {result}")
-
-        if result:
-            return {
-                "note": result[0] if result[0] else "",
-                "day_rating": result[1] if result[1] else "",
-                "emotions": result[2] if result[2] else "",
-                "people": result[3] if result[3] else "",
-                "weather": result[4] if result[4] else ""
-            }
-        print(result)
+def _run_length_ending_at(cursor, user_id, habit_id, date):
+    """Длина серии отмеченных дней подряд, заканчивающейся датой date (0, если день не отмечен).
+
+    Читает журнал по индексу назад от date и останавливается на первом пропуске,
+    поэтому стоимость пропорциональна длине серии, а не всей истории.
+    """
+    cursor.execute("""
+        SELECT DISTINCT date FROM habit_log
+        WHERE user_id = ? AND habit_id = ? AND date <= ?
+        ORDER BY date DESC
+    """, (user_id, habit_id, date))
+    length = 0
+    expected = date
+    for (logged_date,) in cursor:
+        if logged_date != expected:
+            break
+        length += 1
+        expected = _shift_date(expected, -1)
+    return length
+
+def _apply_day_done(cursor, user_id, habit_id, date, stats):
+    """Обновляет счетчики, когда день date стал отмеченным."""
+    days_done, first_date, last_date, streak = stats
+    days_done += 1
+    if first_date is None or date < first_date:
+        first_date = date
+
+    if last_date is None or date > last_date:
+        streak = streak + 1 if last_date == _shift_date(date, -1) else 1
+        last_date = date
+    elif date == _shift_date(last_date, -(streak - 1) - 1):
+        # День примыкает к началу текущей серии - серия может слиться с более ранней
+        streak += 1 + _run_length_ending_at(cursor, user_id, habit_id, _shift_date(date, -1))
+    return days_done, first_date, last_date, streak
+
+def _apply_day_undone(cursor, user_id, habit_id, date, stats):
+    """Обновляет счетчики, когда с дня date сняли последнюю отметку."""
+    days_done, first_date, last_date, streak = stats
+    days_done -= 1
+    if days_done <= 0:
+        return 0, None, None, 0
+
+    if date == first_date:
+        cursor.execute("SELECT MIN(date) FROM habit_log WHERE user_id = ? AND habit_id = ?", (user_id, habit_id))
+        first_date = cursor.fetchone()[0]
+
+    if date == last_date:
+        cursor.execute("SELECT MAX(date) FROM habit_log WHERE user_id = ? AND habit_id = ?", (user_id, habit_id))
+        last_date = cursor.fetchone()[0]
+        streak = _run_length_ending_at(cursor, user_id, habit_id, last_date)
+    elif _shift_date(last_date, -(streak - 1)) <= date < last_date:
+        # Серия разорвана: остается только ее часть после date
+        streak = (Date.fromisoformat(last_date) - Date.fromisoformat(date)).days
+    return days_done, first_date, last_date, streak
+
+@timed("db")
+def set_habit_mark(user_id, habit_id, date, button, marked):
+    """Отмечает (marked=True) или снимает отметку кнопки привычки за день.
+
+    Счетчики habit_stats обновляются инкрементально в той же транзакции.
+    Возвращает актуальную статистику привычки (см. get_habit_stats).
+    """
+    connection = get_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            SELECT COUNT(*), SUM(button = ?) FROM habit_log
+            WHERE user_id = ? AND habit_id = ? AND date = ?
+        """, (button, user_id, habit_id, date))
+        buttons_marked, already_marked = cursor.fetchone()
+        if bool(already_marked) == marked:
+            return get_habit_stats(user_id).get(habit_id)
+
+        if marked:
+            cursor.execute("INSERT INTO habit_log (user_id, habit_id, date, button) VALUES (?, ?, ?, ?)",
+                           (user_id, habit_id, date, button))
+        else:
+            cursor.execute("DELETE FROM habit_log WHERE user_id = ? AND habit_id = ? AND date = ? AND button = ?",
+                           (user_id, habit_id, date, button))
+
+        # Счетчики меняются, только если день стал отмеченным или перестал им быть
+        if (marked and buttons_marked == 0) or (not marked and buttons_marked == 1):
+            cursor.execute("""
+                SELECT days_done, first_date, last_date, current_streak FROM habit_stats
+                WHERE habit_id = ?
+            """, (habit_id,))
+            stats = cursor.fetchone() or (0, None, None, 0)
+            if marked:
+                stats = _apply_day_done(cursor, user_id, habit_id, date, stats)
+            else:
+                stats = _apply_day_undone(cursor, user_id, habit_id, date, stats)
+            cursor.execute("""
+                INSERT OR REPLACE INTO habit_stats (habit_id, user_id, days_done, first_date, last_date, current_streak)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (habit_id, user_id) + tuple(stats))
+
+        connection.commit()
+    except sqlite3.Error as e:
+        connection.rollback()
+        logger.error("Ошибка при отметке привычки: %s", e)
+    return get_habit_stats(user_id).get(habit_id)
+
+@timed("db")
+def get_habit_marks(user_id, date):
+    """Отметки привычек за день: {habit_id: set(кнопок)}."""
+    connection = get_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT habit_id, button FROM habit_log WHERE user_id = ? AND date = ?", (user_id, date))
+        rows = cursor.fetchall()
+    except sqlite3.Error as e:
+        logger.error("Ошибка при загрузке отметок привычек: %s", e)
         return {}
+    marks = {}
+    for habit_id, button in rows:
+        marks.setdefault(habit_id, set()).add(button)
+    return marks
+
+@timed("db")
+def get_habit_stats(user_id, today=None):
+    """Статистика привычек пользователя без просмотра журнала.
 
+    Возвращает {habit_id: {"days_done", "first_date", "last_date", "current_streak",
+    "streak_active", "completion_rate"}}. Серия активна, если последний отмеченный день -
+    сегодня или вчера; доля выполнения считается от первого отмеченного дня до сегодня.
+    """
+    today = today or Date.today().isoformat()
+    connection = get_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            SELECT habit_id, days_done, first_date, last_date, current_streak
+            FROM habit_stats WHERE user_id = ?
+        """, (user_id,))
+        rows = cursor.fetchall()
     except sqlite3.Error as e:
-        print("[ERROR] Ошибка при загрузке заметки:", e)
+        logger.error("Ошибка при загрузке статистики привычек: %s", e)
         return {}
-    finally:
-        connection.close()
+
+    stats = {}
+    for habit_id, days_done, first_date, last_date, streak in rows:
+        if first_date:
+            period = (Date.fromisoformat(max(today, last_date)) - Date.fromisoformat(first_date)).days + 1
+        else:
+            period = 0
+        stats[habit_id] = {
+            "days_done": days_done,
+            "first_date": first_date,
+            "last_date": last_date,
+            "current_streak": streak,
+            "streak_active": bool(last_date) and last_date >= _shift_date(today, -1),
+            "completion_rate": days_done / period if period else 0.0,
+        }
+    return stats
 
 if __name__ == "__main__":
-    print("[INFO] Запуск инициализации базы данных...")
+    setup_logging()
+    logger.info("Запуск инициализации базы данных...")
     init_db()
-    print("[INFO] Скрипт завершил выполнение.")
+    logger.info("Скрипт завершил выполнение.")
 
 
 
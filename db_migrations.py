@@ -0,0 +1,413 @@
+import sqlite3
+
+from vocabulary import VOCABULARIES, encode_note
+from log_setup import get_logger
+from rollups import note_rollup_deltas, apply_rollup_deltas
+
+logger = get_logger("db_migrations")
+
+# Колонки заметок, которые добавлялись в старые базы через ALTER TABLE
+NOTE_EXTRA_COLUMNS = ("day_rating", "emotions", "people", "weather")
+
+
+def _table_columns(cursor, table):
+    """Возвращает список колонок таблицы (пустой, если таблицы нет)."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cursor.fetchall()]
+
+
+def _create_notes_table(cursor, table="notes"):
+    cursor.execute(f"""
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            note TEXT,
+            day_rating TEXT,
+            emotions TEXT,
+            people TEXT,
+            weather TEXT,
+            UNIQUE(user_id, date),
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    """)
+
+
+def migration_1_base_schema(cursor):
+    """Базовая схема: пользователи, заметки, привычки и сохраненные привычки.
+
+    Приводит к одному виду обе старые схемы заметок: из main.init_db (id + UNIQUE,
+    колонки дописывались через ALTER TABLE) и из db_manager (PRIMARY KEY (user_id, date)).
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL
+        )
+    """)
+
+    columns = _table_columns(cursor, "notes")
+    if not columns:
+        _create_notes_table(cursor)
+    elif "id" not in columns:
+        # Старая схема с составным первичным ключом - пересоздаем таблицу
+        _create_notes_table(cursor, "notes_new")
+        copied = ["user_id", "date", "note"] + [c for c in NOTE_EXTRA_COLUMNS if c in columns]
+        column_list = ", ".join(copied)
+        cursor.execute(f"INSERT INTO notes_new ({column_list}) SELECT {column_list} FROM notes")
+        cursor.execute("DROP TABLE notes")
+        cursor.execute("ALTER TABLE notes_new RENAME TO notes")
+    else:
+        for column in NOTE_EXTRA_COLUMNS:
+            if column not in columns:
+                cursor.execute(f"ALTER TABLE notes ADD COLUMN {column} TEXT")
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS habits (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            buttons TEXT NOT NULL,
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS saved_habits (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            habit_name TEXT NOT NULL,
+            selected_buttons TEXT NOT NULL,
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    """)
+
+
+def migration_2_user_indexes(cursor):
+    """Индексы по user_id для выборок привычек текущего пользователя."""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_habits_user ON habits (user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_saved_habits_user ON saved_habits (user_id)")
+
+
+def migration_3_note_codes(cursor):
+    """Компактные коды вместо строк: оценка и погода - код, эмоции и люди - битовые маски.
+
+    Строковые колонки остаются в схеме для совместимости, но очищаются: источником
+    данных становятся коды, а подписи берутся из таблицы vocabulary. Значения, которых
+    нет в словаре, не получают кода и остаются в строковой колонке, чтобы не потерять данные.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS vocabulary (
+            kind TEXT NOT NULL,
+            code INTEGER NOT NULL,
+            label TEXT NOT NULL,
+            PRIMARY KEY (kind, code)
+        )
+    """)
+    cursor.executemany(
+        "INSERT OR REPLACE INTO vocabulary (kind, code, label) VALUES (?, ?, ?)",
+        [(kind, i + 1, label) for kind, labels in VOCABULARIES.items() for i, label in enumerate(labels)]
+    )
+
+    for column in ("rating_code", "emotions_mask", "people_mask", "weather_code"):
+        cursor.execute(f"ALTER TABLE notes ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+
+    cursor.execute("SELECT id, day_rating, emotions, people, weather FROM notes")
+    updates = []
+    unknown_rows = 0
+    for note_id, *labels in cursor.fetchall():
+        unknown = tuple(_unknown_labels(value, vocabulary) for value, vocabulary in zip(labels, VOCABULARIES.values()))
+        if any(unknown):
+            unknown_rows += 1
+            logger.warning("Заметка %s: значения не из словаря оставлены в текстовых колонках: %s",
+                           note_id, [value for value in unknown if value])
+        updates.append(encode_note(*labels) + unknown + (note_id,))
+    cursor.executemany(
+        "UPDATE notes SET rating_code = ?, emotions_mask = ?, people_mask = ?, weather_code = ?, "
+        "day_rating = ?, emotions = ?, people = ?, weather = ? WHERE id = ?",
+        updates
+    )
+    logger.info("Заметок переведено на коды: %s, из них со значениями не из словаря: %s", len(updates), unknown_rows)
+
+    # Покрывающий индекс: фильтры по кодам за период не читают страницы с текстом заметок
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_notes_user_codes
+        ON notes (user_id, date, rating_code, emotions_mask, people_mask, weather_code)
+    """)
+
+
+def _unknown_labels(value, vocabulary):
+    """Подписи из строки через запятую, которых нет в словаре (через запятую), или None."""
+    if not value:
+        return None
+    return ",".join(label for label in value.split(",") if label and label not in vocabulary) or None
+
+
+def migration_4_notes_fts(cursor):
+    """Полнотекстовый индекс FTS5 по тексту заметок, синхронизируемый триггерами.
+
+    Если SQLite собран без FTS5, индекс не создается и поиск работает через LIKE.
+    """
+    try:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+                note,
+                content='notes',
+                content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        logger.warning("FTS5 недоступен, полнотекстовый индекс не создан: %s", e)
+        return
+
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN
+            INSERT INTO notes_fts (rowid, note) VALUES (new.id, new.note);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN
+            INSERT INTO notes_fts (notes_fts, rowid, note) VALUES ('delete', old.id, old.note);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE OF note ON notes BEGIN
+            INSERT INTO notes_fts (notes_fts, rowid, note) VALUES ('delete', old.id, old.note);
+            INSERT INTO notes_fts (rowid, note) VALUES (new.id, new.note);
+        END
+    """)
+    cursor.execute("INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')")
+
+
+def migration_5_habit_log(cursor):
+    """Журнал отметок привычек по дням и поддерживаемые счетчики серий."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS habit_log (
+            user_id INTEGER NOT NULL,
+            habit_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            button TEXT NOT NULL,
+            PRIMARY KEY (user_id, habit_id, date, button),
+            FOREIGN KEY(habit_id) REFERENCES habits(id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    """)
+    # current_streak - длина серии дней подряд, заканчивающейся last_date
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS habit_stats (
+            habit_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            days_done INTEGER NOT NULL DEFAULT 0,
+            first_date TEXT,
+            last_date TEXT,
+            current_streak INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY(habit_id) REFERENCES habits(id) ON DELETE CASCADE
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_habit_stats_user ON habit_stats (user_id)")
+
+
+def migration_6_mood_rollups(cursor):
+    """Агрегаты настроения по неделям, месяцам и годам с заполнением из существующих заметок."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS mood_rollups (
+            user_id INTEGER NOT NULL,
+            period TEXT NOT NULL,
+            period_start TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            code INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, period, period_start, metric, code)
+        ) WITHOUT ROWID
+    """)
+
+    _fill_mood_rollups(cursor)
+
+
+def _fill_mood_rollups(cursor, metric=None):
+    """Заполняет агрегаты настроения по всем заметкам (только метрику metric, если указана).
+
+    Возвращает количество записанных строк агрегатов.
+    """
+    cursor.execute("""
+        SELECT user_id, date, rating_code, emotions_mask, people_mask, weather_code FROM notes
+    """)
+    deltas = {}
+    for user_id, date, *codes in cursor.fetchall():
+        note_rollup_deltas(deltas, user_id, date, codes, +1)
+    if metric is not None:
+        deltas = {key: delta for key, delta in deltas.items() if key[3] == metric}
+    apply_rollup_deltas(cursor, deltas)
+    return len(deltas)
+
+
+# Синхронизируемые таблицы: сущность журнала -> (таблица, колонка естественного ключа)
+SYNC_TABLES = {
+    "note": ("notes", "date"),
+    "habit": ("habits", "name"),
+    "saved_habit": ("saved_habits", "habit_name"),
+}
+
+
+def _sync_log_statement(entity, row, key_column, deleted, condition=""):
+    """Запись в журнал изменений из триггера: прежняя запись ключа заменяется новой
+    (с новым seq), время - следующее значение логических часов реплики."""
+    return f"""
+        DELETE FROM sync_log WHERE entity = '{entity}' AND key = {row}.{key_column}
+            AND username = (SELECT username FROM users WHERE id = {row}.user_id){condition};
+        INSERT INTO sync_log (entity, username, key, clock, replica, deleted)
+            SELECT '{entity}', u.username, {row}.{key_column}, s.clock, s.replica_id, {deleted}
+            FROM users u, sync_state s WHERE u.id = {row}.user_id{condition};
+    """
+
+
+def migration_7_sync_log(cursor):
+    """Журнал изменений для синхронизации реплик (см. sync.py).
+
+    sync_state - идентификатор реплики и логические часы Лэмпорта; sync_log - последнее
+    изменение каждого ключа (пользователь задается именем, т.к. id на устройствах разные);
+    sync_peers - до какого места журнала обменялись с каждой другой репликой.
+    Триггеры пишут журнал при любом изменении notes, habits и saved_habits, кроме
+    применения чужих изменений (sync_state.applying = 1).
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sync_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            replica_id TEXT NOT NULL,
+            clock INTEGER NOT NULL DEFAULT 0,
+            applying INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO sync_state (id, replica_id, clock) VALUES (1, lower(hex(randomblob(8))), 1)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sync_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            username TEXT NOT NULL,
+            key TEXT NOT NULL,
+            clock INTEGER NOT NULL,
+            replica TEXT NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (entity, username, key)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sync_peers (
+            peer_id TEXT PRIMARY KEY,
+            sent_seq INTEGER NOT NULL DEFAULT 0,
+            received_seq INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+    for entity, (table, key_column) in SYNC_TABLES.items():
+        # Существующие данные попадают в журнал с часами 1, чтобы первая синхронизация их передала
+        cursor.execute(f"""
+            INSERT OR IGNORE INTO sync_log (entity, username, key, clock, replica, deleted)
+            SELECT '{entity}', u.username, t.{key_column}, 1, s.replica_id, 0
+            FROM {table} t JOIN users u ON u.id = t.user_id, sync_state s
+        """)
+        condition = "WHEN (SELECT applying FROM sync_state) = 0"
+        tick = "UPDATE sync_state SET clock = clock + 1;"
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS sync_{table}_insert AFTER INSERT ON {table} {condition} BEGIN
+                {tick}
+                {_sync_log_statement(entity, "new", key_column, 0)}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS sync_{table}_update AFTER UPDATE ON {table} {condition} BEGIN
+                {tick}
+                {_sync_log_statement(entity, "old", key_column, 1,
+                                     f" AND (old.{key_column} IS NOT new.{key_column} OR old.user_id IS NOT new.user_id)")}
+                {_sync_log_statement(entity, "new", key_column, 0)}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS sync_{table}_delete AFTER DELETE ON {table} {condition} BEGIN
+                {tick}
+                {_sync_log_statement(entity, "old", key_column, 1)}
+            END
+        """)
+
+
+def migration_8_note_revisions(cursor):
+    """История заметок: прежние состояния дельтами относительно следующего состояния (см. revisions.py)."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS note_revisions (
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            revision INTEGER NOT NULL,
+            replaced_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime')),
+            snapshot INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            rating_code INTEGER NOT NULL DEFAULT 0,
+            emotions_mask INTEGER NOT NULL DEFAULT 0,
+            people_mask INTEGER NOT NULL DEFAULT 0,
+            weather_code INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, date, revision),
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    """)
+
+
+def migration_9_emotion_rollup_codes(cursor):
+    """Коды эмоций в агрегатах настроения - 1..N, как у оценки, погоды и таблицы vocabulary.
+
+    Раньше в code хранился номер бита маски (0..N-1). Строки эмоций пересчитываются по
+    заметкам заново, а не сдвигаются: если миграция 6 выполнялась в том же обновлении,
+    коды в них уже новые.
+    """
+    cursor.execute("DELETE FROM mood_rollups WHERE metric = 'emotion'")
+    removed = cursor.rowcount
+    written = _fill_mood_rollups(cursor, metric="emotion")
+    logger.info("Агрегаты эмоций пересчитаны: удалено строк %s, записано %s", removed, written)
+
+
+# Упорядоченный список миграций: миграция N переводит базу с версии N-1 на версию N
+MIGRATIONS = (
+    migration_1_base_schema,
+    migration_2_user_indexes,
+    migration_3_note_codes,
+    migration_4_notes_fts,
+    migration_5_habit_log,
+    migration_6_mood_rollups,
+    migration_7_sync_log,
+    migration_8_note_revisions,
+    migration_9_emotion_rollup_codes,
+)
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(connection):
+    """Читает версию схемы из PRAGMA user_version."""
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(connection):
+    """Применяет недостающие миграции в одной транзакции и возвращает версию схемы.
+
+    Для актуальной базы это одно чтение PRAGMA user_version.
+    """
+    version = get_schema_version(connection)
+    if version >= SCHEMA_VERSION:
+        return version
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        # Версию перечитываем под блокировкой: базу мог обновить другой процесс
+        version = get_schema_version(connection)
+        if version >= SCHEMA_VERSION:
+            connection.rollback()
+            return version
+        for step in MIGRATIONS[version:]:
+            logger.info("Применение миграции: %s", step.__name__)
+            step(cursor)
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        connection.commit()
+    except sqlite3.Error:
+        connection.rollback()
+        raise
+    return SCHEMA_VERSION
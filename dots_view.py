@@ -0,0 +1,200 @@
+import calendar
+from datetime import date as Date, timedelta
+
+from kivy.graphics import Color, Mesh
+from kivy.properties import DictProperty, ListProperty, NumericProperty, ObjectProperty, OptionProperty
+from kivy.uix.widget import Widget
+
+# Масштабы вида точек от крупного к мелкому
+LEVELS = ("life", "year", "month")
+# Строк (лет) в виде "жизнь в неделях"
+LIFE_YEARS = 90
+WEEKS_PER_ROW = 52
+# Индексы Mesh - 16-битные, поэтому точки делятся на меши по MESH_DOTS (по 4 вершины на точку)
+MESH_DOTS = 16000
+# Доля ячейки, которую занимает точка
+DOT_FILL = 0.8
+# Коды точек без оценки: прошедший день без заметки и день в будущем
+NO_RATING = 0
+FUTURE = -1
+
+
+def level_layout(level, start):
+    """Сетка масштаба: (столбцов, строк, смещение первой точки, по столбцам).
+
+    По столбцам (column_major) точки идут сверху вниз, затем слева направо:
+    так год рисуется неделями-столбцами по 7 дней.
+    """
+    if level == "life":
+        return WEEKS_PER_ROW, LIFE_YEARS, 0, False
+    if level == "year":
+        shift = start.weekday()
+        days = 366 if calendar.isleap(start.year) else 365
+        return (days + shift + 6) // 7, 7, shift, True
+    if level == "month":
+        return 7, 6, start.weekday(), False
+    raise ValueError(f"Неизвестный масштаб: {level}")
+
+
+def level_period(level, anchor):
+    """Первый и последний день периода масштаба, содержащего дату anchor.
+
+    Для "life" anchor - начало первого года жизни.
+    """
+    if level == "life":
+        start = anchor.replace(month=1, day=1)
+        return start, start.replace(year=start.year + LIFE_YEARS) - timedelta(days=1)
+    if level == "year":
+        start = anchor.replace(month=1, day=1)
+        return start, start.replace(month=12, day=31)
+    if level == "month":
+        start = anchor.replace(day=1)
+        return start, start.replace(day=calendar.monthrange(start.year, start.month)[1])
+    raise ValueError(f"Неизвестный масштаб: {level}")
+
+
+def dot_count(level, start):
+    """Количество точек периода: недель для "life", дней для остальных масштабов."""
+    if level == "life":
+        return WEEKS_PER_ROW * LIFE_YEARS
+    _, end = level_period(level, start)
+    return (end - start).days + 1
+
+
+def dot_date(level, start, index):
+    """Первый день, который представляет точка index."""
+    if level == "life":
+        year, week = divmod(index, WEEKS_PER_ROW)
+        return start.replace(year=start.year + year) + timedelta(days=7 * week)
+    return start + timedelta(days=index)
+
+
+def dot_index(level, start, day):
+    """Номер точки, в которую попадает день day (как в db_manager.get_rating_dots)."""
+    if level == "life":
+        return (day.year - start.year) * WEEKS_PER_ROW + min(WEEKS_PER_ROW - 1, (day.timetuple().tm_yday - 1) // 7)
+    return (day - start).days
+
+
+def dot_cell(index, layout):
+    """Столбец и строка (сверху вниз) точки index в сетке layout."""
+    columns, rows, shift, column_major = layout
+    position = index + shift
+    if column_major:
+        return position // rows, position % rows
+    return position % columns, position // columns
+
+
+class DotsView(Widget):
+    """Сетка цветных точек (дней или недель), нарисованная несколькими Mesh.
+
+    На каждый цвет - свой Color и Mesh с квадратами всех точек этого цвета, поэтому
+    количество инструкций на канве не зависит от количества точек, а кадры без
+    изменений данных ничего не перестраивают.
+
+    События: on_dot_press(index) - нажатие на точку, on_zoom(step, index) - колесо
+    мыши (step=1 - приблизить, -1 - отдалить; index - точка под курсором или None).
+    """
+    __events__ = ("on_dot_press", "on_zoom")
+
+    level = OptionProperty("year", options=LEVELS)
+    start = ObjectProperty(Date.today().replace(month=1, day=1))  # первый день периода
+    today = ObjectProperty(Date.today())
+    palette = DictProperty()  # код оценки (а также NO_RATING и FUTURE) -> rgba
+    count = NumericProperty(0)  # точек в периоде
+    layout = ListProperty([1, 1, 0, False])
+
+    def __init__(self, **kwargs):
+        self.dots = {}  # номер точки -> код оценки (точки без оценки отсутствуют)
+        self.meshes = {}  # код -> [(Color, Mesh), ...]
+        super().__init__(**kwargs)
+        self.bind(pos=self.redraw, size=self.redraw, palette=self.redraw)
+
+    def show(self, level, start, dots):
+        """Показывает период масштаба level, начинающийся с start, с оценками dots."""
+        self.level = level
+        self.start = start
+        self.count = dot_count(level, start)
+        self.layout = list(level_layout(level, start))
+        self.dots = dots
+        self.redraw()
+
+    def cell_size(self):
+        columns, rows = self.layout[0], self.layout[1]
+        return min(self.width / columns, self.height / rows)
+
+    def origin(self):
+        """Левый верхний угол сетки (сетка центрируется в виджете)."""
+        columns, rows = self.layout[0], self.layout[1]
+        cell = self.cell_size()
+        return (self.x + (self.width - cell * columns) / 2,
+                self.top - (self.height - cell * rows) / 2)
+
+    def dot_at(self, x, y):
+        """Номер точки под координатами (в системе родителя) или None."""
+        columns, rows, shift, column_major = self.layout
+        cell = self.cell_size()
+        if not cell:
+            return None
+        left, top = self.origin()
+        column, row = int((x - left) // cell), int((top - y) // cell)
+        if not (0 <= column < columns and 0 <= row < rows):
+            return None
+        position = column * rows + row if column_major else row * columns + column
+        index = position - shift
+        return index if 0 <= index < self.count else None
+
+    def redraw(self, *args):
+        """Пересобирает вершины мешей; инструкции канвы добавляются, только если их не хватает."""
+        cell = self.cell_size()
+        left, top = self.origin()
+        side = cell * DOT_FILL
+        margin = (cell - side) / 2
+        # Точки после сегодняшней - будущее
+        last_past = dot_index(self.level, self.start, self.today)
+
+        quads = {}  # код -> координаты вершин
+        for index in range(self.count):
+            code = self.dots.get(index) or (FUTURE if index > last_past else NO_RATING)
+            column, row = dot_cell(index, self.layout)
+            x = left + column * cell + margin
+            y = top - (row + 1) * cell + margin
+            quads.setdefault(code, []).extend(
+                (x, y, 0, 0, x + side, y, 0, 0, x + side, y + side, 0, 0, x, y + side, 0, 0))
+
+        for code in set(self.meshes) | set(quads):
+            self.update_meshes(code, quads.get(code, []))
+
+    def update_meshes(self, code, vertices):
+        """Раскладывает вершины цвета code по мешам (не больше MESH_DOTS точек в каждом)."""
+        rgba = self.palette.get(code, (0, 0, 0, 0))
+        chunk_size = MESH_DOTS * 16
+        chunks = [vertices[i:i + chunk_size] for i in range(0, len(vertices), chunk_size)]
+        meshes = self.meshes.setdefault(code, [])
+        while len(meshes) < len(chunks):
+            with self.canvas:
+                meshes.append((Color(rgba=rgba), Mesh(mode="triangles")))
+        for i, (color, mesh) in enumerate(meshes):
+            chunk = chunks[i] if i < len(chunks) else []
+            color.rgba = rgba
+            mesh.vertices = chunk
+            mesh.indices = [base + offset for base in range(0, len(chunk) // 4, 4) for offset in (0, 1, 2, 2, 3, 0)]
+
+    def on_touch_down(self, touch):
+        if not self.collide_point(*touch.pos):
+            return super().on_touch_down(touch)
+        index = self.dot_at(*touch.pos)
+        if touch.is_mouse_scrolling:
+            # Прокрутка колесом вверх ("scrolldown" в Kivy) приближает
+            self.dispatch("on_zoom", 1 if touch.button == "scrolldown" else -1, index)
+            return True
+        if index is not None:
+            self.dispatch("on_dot_press", index)
+            return True
+        return super().on_touch_down(touch)
+
+    def on_dot_press(self, index):
+        pass
+
+    def on_zoom(self, step, index):
+        pass
@@ -0,0 +1,374 @@
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+import time
+from datetime import date as Date
+
+from db_connection import get_connection, set_db_path
+from db_cache import notes_cache, habits_cache, analytics_cache
+from db_manager import init_db, fetch_notes_by_dates, write_notes
+from log_setup import get_logger, setup_logging
+from vocabulary import (RATINGS, EMOTIONS, PEOPLE, WEATHER, encode_code, decode_code, encode_mask,
+                        decode_mask)
+
+logger = get_logger("journal_io")
+
+# Размер пачки строк при экспорте (память не зависит от объема истории)
+EXPORT_CHUNK_SIZE = 500
+# Размер пачки записей при импорте (одна пачка - один executemany)
+IMPORT_CHUNK_SIZE = 1000
+
+CONFLICT_POLICIES = ("skip", "overwrite", "merge")
+FORMATS = ("jsonl", "csv")
+
+# Колонки CSV: у заметок заполнены date..weather, у привычек и выбранных кнопок - name и buttons
+CSV_FIELDS = ["type", "date", "note", "day_rating", "emotions", "people", "weather", "name", "buttons"]
+
+
+def iter_user_records(user_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """Генератор записей журнала пользователя: заметки, привычки и выбранные кнопки привычек.
+
+    Строки читаются пачками по ключу (keyset pagination), поэтому в памяти
+    одновременно находится не больше chunk_size строк.
+    """
+    cursor = get_connection().cursor()
+
+    last_date = ""
+    while True:
+        cursor.execute("""
+            SELECT date, note, rating_code, emotions_mask, people_mask, weather_code FROM notes
+            WHERE user_id = ? AND date > ?
+            ORDER BY date
+            LIMIT ?
+        """, (user_id, last_date, chunk_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        for date, note, rating_code, emotions_mask, people_mask, weather_code in rows:
+            yield {
+                "type": "note",
+                "date": date,
+                "note": note or "",
+                "day_rating": decode_code(rating_code, RATINGS),
+                "emotions": decode_mask(emotions_mask, EMOTIONS),
+                "people": decode_mask(people_mask, PEOPLE),
+                "weather": decode_code(weather_code, WEATHER),
+            }
+        last_date = rows[-1][0]
+
+    for table, name_column, buttons_column, record_type in (
+            ("habits", "name", "buttons", "habit"),
+            ("saved_habits", "habit_name", "selected_buttons", "saved_habit")):
+        last_id = 0
+        while True:
+            cursor.execute(f"""
+                SELECT id, {name_column}, {buttons_column} FROM {table}
+                WHERE user_id = ? AND id > ?
+                ORDER BY id
+                LIMIT ?
+            """, (user_id, last_id, chunk_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            for _, name, buttons in rows:
+                yield {"type": record_type, "name": name, "buttons": buttons.split(",") if buttons else []}
+            last_id = rows[-1][0]
+
+
+def write_records(records, fp, fmt="jsonl"):
+    """Пишет записи в файл в формате JSONL или CSV. Возвращает количество записей."""
+    count = 0
+    if fmt == "jsonl":
+        for record in records:
+            fp.write(json.dumps(record, ensure_ascii=False))
+            fp.write("\n")
+            count += 1
+    elif fmt == "csv":
+        writer = csv.DictWriter(fp, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        for record in records:
+            row = dict(record)
+            for field in ("emotions", "people", "buttons"):
+                if field in row:
+                    row[field] = ",".join(row[field])
+            writer.writerow(row)
+            count += 1
+    else:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    return count
+
+
+def read_records(fp, fmt="jsonl"):
+    """Генератор записей из файла JSONL или CSV.
+
+    Строки JSONL отдаются неразобранными: их разбирает parse_record при импорте, чтобы
+    одна испорченная строка считалась неверной записью, а не прерывала чтение файла.
+    """
+    if fmt == "jsonl":
+        for line in fp:
+            if line.strip():
+                yield line
+    elif fmt == "csv":
+        for row in csv.DictReader(fp):
+            record = {key: value for key, value in row.items() if value not in (None, "")}
+            for field in ("emotions", "people", "buttons"):
+                if field in record:
+                    record[field] = record[field].split(",")
+            yield record
+    else:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+
+
+def _check_labels(labels, vocabulary, field):
+    for label in labels:
+        if label not in vocabulary:
+            raise ValueError(f"неизвестное значение {field}: {label!r}")
+
+
+def parse_record(record):
+    """Запись из строки JSONL (уже разобранные записи возвращаются как есть). Ошибки - ValueError."""
+    if isinstance(record, str):
+        return json.loads(record)  # json.JSONDecodeError - подкласс ValueError
+    return record
+
+
+def validate_record(record):
+    """Проверяет запись импорта и приводит ее к единому виду. Ошибки - ValueError."""
+    if not isinstance(record, dict):
+        raise ValueError("запись должна быть объектом")
+    record_type = record.get("type")
+
+    if record_type == "note":
+        date = record.get("date")
+        try:
+            # fromisoformat принимает и "20240103", и недели ISO - храним только YYYY-MM-DD,
+            # иначе заметку не найдут выборки по диапазону дат
+            date = Date.fromisoformat(date).isoformat()
+        except (TypeError, ValueError):
+            raise ValueError(f"неверная дата: {date!r}")
+        emotions = _as_list(record.get("emotions"))
+        people = _as_list(record.get("people"))
+        day_rating = record.get("day_rating") or ""
+        weather = record.get("weather") or ""
+        _check_labels(emotions, EMOTIONS, "emotions")
+        _check_labels(people, PEOPLE, "people")
+        _check_labels([day_rating] if day_rating else [], RATINGS, "day_rating")
+        _check_labels([weather] if weather else [], WEATHER, "weather")
+        return {"type": "note", "date": date, "note": str(record.get("note") or ""),
+                "day_rating": day_rating, "emotions": emotions, "people": people, "weather": weather}
+
+    if record_type in ("habit", "saved_habit"):
+        name = str(record.get("name") or "").strip()
+        buttons = [str(button).strip() for button in _as_list(record.get("buttons"))]
+        if not name:
+            raise ValueError("не указано название привычки")
+        if not buttons or any(not button for button in buttons):
+            raise ValueError(f"пустые кнопки у привычки {name!r}")
+        return {"type": record_type, "name": name, "buttons": buttons}
+
+    raise ValueError(f"неизвестный тип записи: {record_type!r}")
+
+
+def _as_list(value):
+    """Список значений из списка или строки через запятую; другие типы - ValueError."""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return value.split(",") if value else []
+    if isinstance(value, list):
+        return value
+    raise ValueError(f"ожидался список, получено: {value!r}")
+
+
+def _merge_note(existing, imported):
+    """Объединяет существующую и импортируемую заметку (политика merge)."""
+    old_note, old_rating, old_emotions, old_people, old_weather = existing
+    new_note, new_rating, new_emotions, new_people, new_weather = imported
+    if not old_note:
+        note = new_note
+    elif not new_note or new_note in old_note:
+        note = old_note
+    else:
+        note = old_note + "\n" + new_note
+    return (note, old_rating or new_rating, old_emotions | new_emotions, old_people | new_people,
+            old_weather or new_weather)
+
+
+def _merge_buttons(existing, imported):
+    return existing + [button for button in imported if button not in existing]
+
+
+def import_records(user_id, records, policy="skip", chunk_size=IMPORT_CHUNK_SIZE):
+    """Импортирует записи пользователю одной транзакцией.
+
+    records - словари или строки JSONL (см. read_records). policy при конфликте с
+    существующими данными: skip - оставить существующее, overwrite - заменить
+    импортируемым, merge - объединить. Неверные записи (в том числе неразбираемые
+    строки) пропускаются с сообщением. При любой другой ошибке транзакция
+    откатывается целиком. Возвращает словарь со счетчиками.
+    """
+    if policy not in CONFLICT_POLICIES:
+        raise ValueError(f"Неизвестная политика конфликтов: {policy}")
+
+    stats = {"notes": 0, "habits": 0, "saved_habits": 0, "skipped": 0, "invalid": 0}
+    connection = get_connection()
+    cursor = connection.cursor()
+
+    # Привычек немного - состояние держим в памяти и пишем в конце
+    cursor.execute("SELECT name, buttons FROM habits WHERE user_id = ?", (user_id,))
+    existing_habits = {name: buttons.split(",") for name, buttons in cursor.fetchall()}
+    cursor.execute("SELECT habit_name, selected_buttons FROM saved_habits WHERE user_id = ?", (user_id,))
+    existing_saved = {name: buttons.split(",") for name, buttons in cursor.fetchall()}
+    habit_changes = {}
+    saved_changes = {}
+
+    def import_notes(notes):
+        existing = fetch_notes_by_dates(cursor, user_id, [note["date"] for note in notes])
+        rows = []
+        for note in notes:
+            imported = (note["note"], encode_code(note["day_rating"], RATINGS), encode_mask(note["emotions"], EMOTIONS),
+                        encode_mask(note["people"], PEOPLE), encode_code(note["weather"], WEATHER))
+            old = existing.get(note["date"])
+            if old is not None and policy == "skip":
+                stats["skipped"] += 1
+                continue
+            if old is not None and policy == "merge":
+                imported = _merge_note(old, imported)
+            existing[note["date"]] = imported
+            rows.append((user_id, note["date"]) + imported)
+        write_notes(cursor, rows)
+        stats["notes"] += len(rows)
+
+    def import_habit(record, existing_state, changes, counter):
+        name, buttons = record["name"], record["buttons"]
+        current = changes.get(name, existing_state.get(name))
+        if current is not None:
+            if policy == "skip":
+                stats["skipped"] += 1
+                return
+            if policy == "merge":
+                buttons = _merge_buttons(current, buttons)
+        changes[name] = buttons
+        stats[counter] += 1
+
+    try:
+        cursor.execute("BEGIN")
+        notes = []
+        for number, record in enumerate(records, 1):
+            try:
+                record = validate_record(parse_record(record))
+            except ValueError as e:
+                logger.warning("Запись %s пропущена: %s", number, e)
+                stats["invalid"] += 1
+                continue
+
+            if record["type"] == "note":
+                notes.append(record)
+                if len(notes) >= chunk_size:
+                    import_notes(notes)
+                    notes = []
+            elif record["type"] == "habit":
+                import_habit(record, existing_habits, habit_changes, "habits")
+            else:
+                import_habit(record, existing_saved, saved_changes, "saved_habits")
+        if notes:
+            import_notes(notes)
+
+        cursor.executemany(
+            "INSERT INTO habits (user_id, name, buttons) VALUES (?, ?, ?)",
+            [(user_id, name, ",".join(buttons)) for name, buttons in habit_changes.items()
+             if name not in existing_habits]
+        )
+        cursor.executemany(
+            "UPDATE habits SET buttons = ? WHERE user_id = ? AND name = ?",
+            [(",".join(buttons), user_id, name) for name, buttons in habit_changes.items()
+             if name in existing_habits]
+        )
+        cursor.executemany("DELETE FROM saved_habits WHERE user_id = ? AND habit_name = ?",
+                           [(user_id, name) for name in saved_changes])
+        cursor.executemany(
+            "INSERT INTO saved_habits (user_id, habit_name, selected_buttons) VALUES (?, ?, ?)",
+            [(user_id, name, ",".join(buttons)) for name, buttons in saved_changes.items()]
+        )
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        notes_cache.invalidate_user(user_id)
+        habits_cache.invalidate_user(user_id)
+        analytics_cache.invalidate_user(user_id)
+    return stats
+
+
+def get_user_id(username):
+    """ID пользователя по имени или None."""
+    cursor = get_connection().cursor()
+    cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
+    result = cursor.fetchone()
+    return result[0] if result else None
+
+
+def _detect_format(path, fmt):
+    if fmt:
+        return fmt
+    return "csv" if path and path.lower().endswith(".csv") else "jsonl"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Экспорт и импорт журнала LifeDots (JSONL/CSV).")
+    parser.add_argument("--db", help="путь к базе данных (по умолчанию app_data.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="выгрузить журнал пользователя")
+    export_parser.add_argument("username")
+    export_parser.add_argument("-o", "--output", help="файл (по умолчанию stdout)")
+    export_parser.add_argument("--format", choices=FORMATS)
+
+    import_parser = commands.add_parser("import", help="загрузить журнал пользователю")
+    import_parser.add_argument("username")
+    import_parser.add_argument("input", help="файл JSONL или CSV")
+    import_parser.add_argument("--format", choices=FORMATS)
+    import_parser.add_argument("--policy", choices=CONFLICT_POLICIES, default="skip",
+                               help="что делать с уже существующими записями")
+
+    args = parser.parse_args(argv)
+    setup_logging()
+    if args.db:
+        set_db_path(args.db)
+    init_db()
+
+    user_id = get_user_id(args.username)
+    if user_id is None:
+        logger.error("Пользователь %r не найден.", args.username)
+        return 1
+
+    started = time.perf_counter()
+    if args.command == "export":
+        fmt = _detect_format(args.output, args.format)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8", newline="") as fp:
+                count = write_records(iter_user_records(user_id), fp, fmt)
+        else:
+            count = write_records(iter_user_records(user_id), sys.stdout, fmt)
+        summary = f"Экспортировано записей: {count}"
+    else:
+        fmt = _detect_format(args.input, args.format)
+        try:
+            with open(args.input, encoding="utf-8", newline="") as fp:
+                stats = import_records(user_id, read_records(fp, fmt), policy=args.policy)
+        except (sqlite3.Error, csv.Error, UnicodeDecodeError) as e:
+            logger.error("Импорт отменен, изменения откатаны: %s", e)
+            return 1
+        count = stats["notes"] + stats["habits"] + stats["saved_habits"]
+        summary = f"Импортировано: {stats}"
+
+    elapsed = time.perf_counter() - started
+    logger.info("%s за %.2f с (%.0f записей/с)", summary, elapsed, count / elapsed if elapsed else 0)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
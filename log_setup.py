@@ -0,0 +1,85 @@
+import logging
+import logging.handlers
+import os
+
+# Все логгеры приложения - потомки "lifedots" (lifedots.db_manager, lifedots.main, ...)
+ROOT_LOGGER = "lifedots"
+
+# Общий уровень: LIFEDOTS_LOG_LEVEL=DEBUG|INFO|WARNING|ERROR (по умолчанию INFO)
+LOG_LEVEL_ENV = "LIFEDOTS_LOG_LEVEL"
+# Уровни отдельных модулей: LIFEDOTS_LOG_LEVELS="db_manager=DEBUG,main=WARNING"
+LOG_LEVELS_ENV = "LIFEDOTS_LOG_LEVELS"
+# Файл журнала с ротацией (по умолчанию не пишется)
+LOG_FILE_ENV = "LIFEDOTS_LOG_FILE"
+
+DEFAULT_LEVEL = "INFO"
+LOG_FILE_MAX_BYTES = 1024 * 1024
+LOG_FILE_BACKUPS = 3
+
+CONSOLE_FORMAT = "[%(levelname)s] %(message)s"
+FILE_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+
+def get_logger(module):
+    """Логгер модуля приложения: get_logger("db_manager") -> lifedots.db_manager."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{module}")
+
+
+def parse_levels(text):
+    """Разбирает строку "модуль=УРОВЕНЬ,..." в словарь {модуль: уровень}."""
+    levels = {}
+    for item in (text or "").split(","):
+        if "=" not in item:
+            continue
+        module, level = item.split("=", 1)
+        levels[module.strip()] = level.strip().upper()
+    return levels
+
+
+def _known_level(level, source, problems):
+    """Имя уровня, если оно известно logging; иначе DEFAULT_LEVEL и запись в problems."""
+    if isinstance(logging.getLevelName(level), int):
+        return level
+    problems.append((source, level))
+    return DEFAULT_LEVEL
+
+
+def setup_logging(level=None, module_levels=None, log_file=None):
+    """Настраивает логирование приложения (повторный вызов заменяет настройки).
+
+    Параметры по умолчанию берутся из переменных окружения LIFEDOTS_LOG_LEVEL,
+    LIFEDOTS_LOG_LEVELS и LIFEDOTS_LOG_FILE. Сообщения форматируются лениво
+    (logger.debug("... %s", value)), поэтому выключенные уровни почти ничего не стоят.
+    Неизвестные имена уровней заменяются на DEFAULT_LEVEL с предупреждением в журнале.
+    """
+    problems = []
+    level = _known_level((level or os.environ.get(LOG_LEVEL_ENV) or DEFAULT_LEVEL).upper(), LOG_LEVEL_ENV, problems)
+    if module_levels is None:
+        module_levels = parse_levels(os.environ.get(LOG_LEVELS_ENV))
+    module_levels = {module: _known_level(module_level.upper(), f"{LOG_LEVELS_ENV} ({module})", problems)
+                     for module, module_level in module_levels.items()}
+    log_file = log_file or os.environ.get(LOG_FILE_ENV)
+
+    logger = logging.getLogger(ROOT_LOGGER)
+    logger.setLevel(level)
+    # Не передаем записи корневому логгеру, чтобы они не дублировались обработчиками Kivy
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+    logger.addHandler(console)
+
+    if log_file:
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS, encoding="utf-8")
+        file_handler.setFormatter(logging.Formatter(FILE_FORMAT))
+        logger.addHandler(file_handler)
+
+    for module, module_level in module_levels.items():
+        get_logger(module).setLevel(module_level)
+    for source, unknown in problems:
+        logger.warning("Неизвестный уровень журнала %r в %s, используется %s", unknown, source, DEFAULT_LEVEL)
+    return logger
@@ -1,15 +1,37 @@
+import time
+
+# Отсчет времени запуска (до импорта Kivy и остальных модулей)
+STARTED_AT = time.perf_counter()
+
 import kivy
+import json
+import os
 from kivy.app import App
-from kivy.uix.screenmanager import ScreenManager, Screen
+from kivy.clock import Clock
+from kivy.core.window import Window
+from kivy.uix.screenmanager import ScreenManager, Screen, ScreenManagerException
 from kivy.uix.textinput import TextInput
-from kivy.uix.popup import Popup
-import sqlite3
-from db_manager import get_note_from_db, save_note_to_db
+from db_manager import (get_note_from_db, save_note_to_db, init_db, get_notes_for_month, get_user_habits,
+                        add_habit_to_db, delete_habit_from_db, save_selected_habits_to_db,
+                        search_notes, SNIPPET_START, SNIPPET_END, set_habit_mark, get_habit_marks, get_habit_stats,
+                        get_rating_dots, get_first_note_date)
+from dots_view import DotsView, LEVELS, NO_RATING, FUTURE, level_period, dot_date
+from analytics import get_top_findings, describe_finding
+from vocabulary import RATINGS
+from kivy.utils import escape_markup
+from db_connection import close_all
+from db_cache import get_cache_stats
+from autosave import NoteAutosaver
+from db_executor import run_in_background, get_executor
+from auth import authenticate, register_user
+from metrics import instrument_screen_manager, save_report, timed, registry
+from log_setup import get_logger, setup_logging
+from utils import get_popups
 import re
 import locale
-from kivy.properties import StringProperty, ObjectProperty
-import hashlib
-from datetime import datetime, timedelta
+from kivy.properties import StringProperty, ObjectProperty, NumericProperty, BooleanProperty
+from kivy.metrics import dp
+from datetime import date as Date, datetime, timedelta
 from kivy.uix.button import Button
 from kivy.uix.label import Label
 from kivy.uix.gridlayout import GridLayout
@@ -20,44 +42,10 @@ from kivy.lang import Builder
 from kivy.uix.slider import Slider
 from functools import partial
 
-locale.setlocale(locale.LC_TIME, 'Russian_Russia.1251')
-
-def init_db():
-    connection = sqlite3.connect("app_data.db")
-    cursor = connection.cursor()
-
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL UNIQUE,
-            password TEXT NOT NULL
-        )
-        """)
-
-    # Таблица заметок с уникальным сочетанием user_id и date
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS notes (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        date TEXT NOT NULL,
-        note TEXT,
-        UNIQUE(user_id, date),
-        FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
-    )
-    """)
-
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS habits (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            buttons TEXT NOT NULL,
-            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
-        )
-        """)
+setup_logging()
+logger = get_logger("main")
 
-    connection.commit()
-    connection.close()
+locale.setlocale(locale.LC_TIME, 'Russian_Russia.1251')
 
 # Экран входа
 class LoginScreen(Screen):
@@ -75,114 +63,37 @@ class LoginScreen(Screen):
             self.show_error("Пожалуйста, заполните все поля.")
             return
 
-        # Проверка существования пользователя и правильности пароля
-        if not self.validate_user(username, password):
+        # Проверка пользователя выполняется в фоне, чтобы не блокировать интерфейс
+        self.error_message = "Проверка..."
+        run_in_background(authenticate, username, password, callback=self.on_login_result,
+                          error_callback=self.on_login_error)
+
+    def on_login_result(self, user_id):
+        """Результат проверки пользователя (в UI-потоке)."""
+        self.error_message = ""
+        if user_id is None:
             self.show_error("Неверное имя пользователя или пароль.")
             return
 
         # Успешный вход
         self.show_success("Вход успешен!")
-
-        # Устанавливаем current_user_id
-        connection = sqlite3.connect("app_data.db")
-        cursor = connection.cursor()
-        cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
-        result = cursor.fetchone()
-        connection.close()
-
-        if result:
-            user_id = result[0]
-            App.get_running_app().on_user_login(user_id)  # Устанавливаем ID пользователя в приложении
+        App.get_running_app().on_user_login(user_id)  # Устанавливаем ID пользователя в приложении
 
         # Переход на экран календаря
         self.manager.current = 'calendar'
 
-    def validate_user(self, username, password):
-        """Проверка существования пользователя и пароля в базе данных."""
-        connection = sqlite3.connect("app_data.db")
-        cursor = connection.cursor()
-        cursor.execute("SELECT password FROM users WHERE username = ?", (username,))
-        result = cursor.fetchone()
-        connection.close()
-
-        if result:
-            stored_password = result[0]
-            # Сравниваем введённый пароль с хэшированным паролем в базе
-            return self.check_password(stored_password, password)
-        return False
-
-    def check_password(self, stored_password, password):
-        """Проверка правильности пароля."""
-        return stored_password == self.hash_password(password)
-
-    def hash_password(self, password):
-        """Хэширование пароля с использованием SHA256."""
-        return hashlib.sha256(password.encode()).hexdigest()
+    def on_login_error(self, error):
+        """Проверка не выполнилась из-за ошибки БД (в UI-потоке)."""
+        self.error_message = ""
+        self.show_error("Не удалось выполнить вход: ошибка базы данных.")
 
     def show_error(self, message):
-        """Показывает окно ошибки с кастомным стилем."""
-        popup = self.create_popup("ErrorPopup", message)
-        popup.open()
+        """Показывает окно ошибки."""
+        get_popups().show_error(message)
 
     def show_success(self, message):
-        """Показывает окно успеха с кастомным стилем."""
-        popup = self.create_popup("SuccessPopup", message)
-        popup.open()
-
-    def create_popup(self, popup_class, message):
-        """Создаёт окно с уведомлением и применяет стили."""
-
-        # Цвета из палитры
-        light_brown = (0.949, 0.808, 0.635, 1)  # светлый бежевый
-        dark_brown = (0.251, 0.161, 0.078, 1)  # темно-коричневый
-        button_brown = (0.451, 0.298, 0.161, 1)  # коричневый
-        light_brown_button = (0.851, 0.675, 0.510, 1)  # светлый оттенок коричневого
-
-        if popup_class == "ErrorPopup":
-            popup = Popup(title="Ошибка", size_hint=(0.8, 0.4), background_color=light_brown)
-            content = BoxLayout(orientation="vertical", padding=10, spacing=20)
-
-            # Создание и стилизация текста сообщения
-            label = Label(
-                text=message,
-                color=(1, 1, 1, 1),
-                font_size='18sp',
-                halign='center',
-                valign='middle'
-            )
-            content.add_widget(label)
-
-            # Кнопка закрытия попапа
-            close_button = Button(text="Закрыть", background_normal='', background_color=dark_brown,
-                                  color=(1, 1, 1, 1))
-            close_button.bind(on_press=popup.dismiss)
-            content.add_widget(close_button)
-
-            popup.content = content
-
-        elif popup_class == "SuccessPopup":
-            popup = Popup(title="Успех", size_hint=(0.8, 0.4), background_color=light_brown)
-            content = BoxLayout(orientation="vertical", padding=10, spacing=20)
-
-            # Создание и стилизация текста сообщения
-            label = Label(
-                text=message,
-                color=(1, 1, 1, 1),
-                font_size='18sp',
-                halign='center',
-                valign='middle'
-            )
-            content.add_widget(label)
-
-            # Кнопка закрытия попапа
-            close_button = Button(text="Закрыть", background_normal='', background_color=dark_brown,
-                                  color=(1, 1, 1, 1))
-            close_button.bind(on_press=popup.dismiss)
-            content.add_widget(close_button)
-
-            popup.content = content
-
-        return popup
+        """Показывает окно успеха."""
+        get_popups().show_info("Успех", message)
 
 # Экран регистрации
 class RegistrationScreen(Screen):
@@ -205,31 +116,32 @@ class RegistrationScreen(Screen):
             )
             return
 
-        # Сохраняем нового пользователя в базу данных
-        hashed_password = self.hash_password(password)
-        connection = sqlite3.connect("app_data.db")
-        cursor = connection.cursor()
-        try:
-            cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed_password))
-            connection.commit()
-
-            # Получаем ID нового пользователя и устанавливаем current_user_id
-            cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
-            result = cursor.fetchone()
-            if result:
-                App.get_running_app().current_user_id = result[0]  # Устанавливаем ID нового пользователя
-                print(f"Регистрация успешна. ID пользователя: {result[0]}")
-
-            # Очищаем поля ввода
-            self.ids.username_input.text = ""
-            self.ids.password_input.text = ""
-
-            # Переходим на экран календаря
-            self.manager.current = 'calendar'
-        except sqlite3.IntegrityError:
+        # Хэширование пароля и запись выполняются в фоне, чтобы не блокировать интерфейс
+        self.error_message = "Регистрация..."
+        run_in_background(register_user, username, password, callback=self.on_registered,
+                          error_callback=self.on_register_error)
+
+    def on_registered(self, user_id):
+        """Результат регистрации (в UI-потоке)."""
+        self.error_message = ""
+        if user_id is None:
             self.show_error("Имя пользователя уже занято.")
-        finally:
-            connection.close()
+            return
+
+        App.get_running_app().current_user_id = user_id  # Устанавливаем ID нового пользователя
+        logger.info("Регистрация успешна. ID пользователя: %s", user_id)
+
+        # Очищаем поля ввода
+        self.ids.username_input.text = ""
+        self.ids.password_input.text = ""
+
+        # Переходим на экран календаря
+        self.manager.current = 'calendar'
+
+    def on_register_error(self, error):
+        """Регистрация не выполнилась из-за ошибки БД (в UI-потоке)."""
+        self.error_message = ""
+        self.show_error("Не удалось зарегистрироваться: ошибка базы данных.")
 
     def validate_username(self, username):
         # Проверка имени пользователя с использованием букв латиницы и кириллицы
@@ -244,89 +156,53 @@ class RegistrationScreen(Screen):
             )
         )
 
-    def hash_password(self, password):
-        return hashlib.sha256(password.encode()).hexdigest()
-
-    def save_to_db(self, username, password):
-        """Сохраняет пользователя в базу данных с хэшированным паролем."""
-        hashed_password = self.hash_password(password) # Хэшируем пароль перед сохранением
-        connection = sqlite3.connect("app_data.db")
-        cursor = connection.cursor()
-        try:
-            cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed_password))
-            connection.commit()
-            self.show_success("Регистрация прошла успешно!")
-            return True
-        except sqlite3.IntegrityError:
-            self.show_error("Имя пользователя уже занято.")
-            return False
-        finally:
-            connection.close()
-
     def show_error(self, message):
-        """Показывает окно ошибки с кастомным стилем."""
-        popup = self.create_popup("ErrorPopup", message)
-        popup.open()
+        """Показывает окно ошибки."""
+        get_popups().show_error(message)
 
     def show_success(self, message):
-        """Показывает окно успеха с кастомным стилем."""
-        popup = self.create_popup("SuccessPopup", message)
-        popup.open()
-
-    def create_popup(self, popup_class, message):
-        """Создаёт окно с уведомлением и применяет стили."""
-
-        # Цвета из палитры
-        light_brown = (0.949, 0.808, 0.635, 1)  # светлый бежевый
-        dark_brown = (0.251, 0.161, 0.078, 1)  # темно-коричневый
-        button_brown = (0.451, 0.298, 0.161, 1)  # коричневый
-        light_brown_button = (0.851, 0.675, 0.510, 1)  # светлый оттенок коричневого
-
-        if popup_class == "ErrorPopup":
-            popup = Popup(title="Ошибка", size_hint=(0.8, 0.4), background_color=light_brown)
-            content = BoxLayout(orientation="vertical", padding=10, spacing=20)
-
-            # Создание и стилизация текста сообщения
-            label = Label(
-                text=message,
-                color=(1, 1, 1, 1),  # Белый цвет текста для ошибок
-                font_size='18sp',
-                halign='center',
-                valign='middle'
-            )
-            content.add_widget(label)
-
-            # Кнопка закрытия попапа
-            close_button = Button(text="Закрыть", background_normal='', background_color=dark_brown,
-                                  color=(1, 1, 1, 1))
-            close_button.bind(on_press=popup.dismiss)
-            content.add_widget(close_button)
-
-            popup.content = content
-
-        elif popup_class == "SuccessPopup":
-            popup = Popup(title="Успех", size_hint=(0.8, 0.4), background_color=light_brown)
-            content = BoxLayout(orientation="vertical", padding=10, spacing=20)
-
-            # Создание и стилизация текста сообщения
-            label = Label(
-                text=message,
-                color=(1, 1, 1, 1),  # Белый цвет текста для успеха
-                font_size='18sp',
-                halign='center',
-                valign='middle'
-            )
-            content.add_widget(label)
+        """Показывает окно успеха."""
+        get_popups().show_info("Успех", message)
+
+# Цвета дней календаря по оценке дня
+RATING_COLORS = {
+    "Замечательно": (0.298, 0.686, 0.314, 1),
+    "Хорошо": (0.553, 0.765, 0.290, 1),
+    "Обычно": (0.949, 0.761, 0.196, 1),
+    "Грустно": (0.400, 0.553, 0.827, 1),
+    "Плохо": (0.827, 0.322, 0.290, 1),
+}
+# Фон обычного дня и сегодняшнего дня без оценки
+DAY_COLOR = (0.851, 0.675, 0.510, 1)
+TODAY_COLOR = (0.451, 0.298, 0.161, 1)
+
+# Ячеек в сетке календаря: 6 недель по 7 дней - хватает для любого месяца
+CALENDAR_CELLS = 42
+DAY_LABELS = tuple(str(day) for day in range(1, 32))
+
 
-            # Кнопка закрытия попапа
-            close_button = Button(text="Закрыть", background_normal='', background_color=button_brown,
-                                  color=(1, 1, 1, 1))
-            close_button.bind(on_press=popup.dismiss)
-            content.add_widget(close_button)
+class DayCell(Button):
+    """Ячейка сетки календаря. Создается один раз и переиспользуется при смене месяца."""
+    date = StringProperty("")  # YYYY-MM-DD; пустая строка - ячейка вне месяца
 
-            popup.content = content
 
-        return popup
+class MonthPrefetcher:
+    """Загружает заметки за месяц в фоновом потоке и отдает результат в UI-поток."""
+
+    def __init__(self):
+        self.pending = set()  # (user_id, year, month), которые уже в очереди
+
+    def request(self, user_id, year, month, callback):
+        """Ставит месяц в очередь загрузки; callback(key, notes) вызывается в UI-потоке."""
+        key = (user_id, year, month)
+        if key in self.pending:
+            return
+        self.pending.add(key)
+        run_in_background(get_notes_for_month, *key, callback=partial(self._deliver, key, callback))
+
+    def _deliver(self, key, callback, notes):
+        self.pending.discard(key)
+        callback(key, notes)
 
 
 # Экран главного окна с календарем
@@ -336,6 +212,13 @@ class CalendarScreen(Screen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.current_date = datetime.today()
+        self.month_notes = {}  # (user_id, year, month) -> {дата: заметка}
+        self.prefetcher = MonthPrefetcher()
+        self.day_cells = []  # Пул из CALENDAR_CELLS ячеек, создается при первой отрисовке
+        self.display_calendar(self.current_date)
+
+    def on_pre_enter(self):
+        """Перерисовывает месяц при входе (например, после входа пользователя)."""
         self.display_calendar(self.current_date)
 
     def display_calendar(self, date):
@@ -343,8 +226,8 @@ class CalendarScreen(Screen):
         if isinstance(date, str):
             date = datetime.strptime(date, "%Y-%m-%d")  # Преобразуем строку в datetime
 
-        calendar_grid = self.ids.calendar_grid  # Сетка календаря
-        calendar_grid.clear_widgets()
+        if not self.day_cells:
+            self.create_day_cells()
 
         # Обновляем название месяца
         self.ids.month_label.text = date.strftime("%B %Y")  # Например, "Февраль 2025"
@@ -354,24 +237,68 @@ class CalendarScreen(Screen):
         last_day_of_month = (first_day_of_month + timedelta(days=32)).replace(day=1) - timedelta(days=1)
         start_day = first_day_of_month.weekday()  # День недели первого дня месяца (0 — понедельник)
 
-        # Пустые ячейки до первого дня месяца
-        for _ in range(start_day):
-            calendar_grid.add_widget(Label())
-
-        # Дни месяца
-        today = datetime.today()
-        for day in range(1, last_day_of_month.day + 1):
-            day_date = first_day_of_month.replace(day=day)
-            day_button = Button(
-                text=str(day),
-                size_hint_y=None,
-                height=50,
-                background_color=(0.851, 0.675, 0.510, 1) if day_date.date() != today.date() else (
-                    0.451, 0.298, 0.161, 1),  # светло-коричневый фон для дней, кроме сегодняшнего
-                color=(1, 1, 1, 1),
-            )
-            day_button.bind(on_press=self.on_day_selected)
-            calendar_grid.add_widget(day_button)
+        # Заметки месяца из кэша (если еще не загружены - дни рисуются без оценок)
+        notes = self.get_month_notes(first_day_of_month) or {}
+
+        # Ячейки только обновляются: виджеты не создаются и не удаляются
+        today = datetime.today().strftime("%Y-%m-%d")
+        month_prefix = first_day_of_month.strftime("%Y-%m-")
+        for index, cell in enumerate(self.day_cells):
+            day = index - start_day + 1
+            if not 1 <= day <= last_day_of_month.day:
+                # Ячейка до первого или после последнего дня месяца
+                cell.text = ""
+                cell.date = ""
+                cell.disabled = True
+                cell.opacity = 0
+                continue
+
+            day_date = f"{month_prefix}{day:02d}"
+            rating = notes.get(day_date, {}).get("day_rating")
+            cell.text = DAY_LABELS[day - 1]
+            cell.date = day_date
+            cell.background_color = RATING_COLORS.get(rating) or (TODAY_COLOR if day_date == today else DAY_COLOR)
+            cell.bold = day_date == today
+            cell.disabled = False
+            cell.opacity = 1
+
+        # Заранее подгружаем соседние месяцы
+        self.get_month_notes(first_day_of_month - timedelta(days=1))
+        self.get_month_notes(first_day_of_month + timedelta(days=32))
+
+    def create_day_cells(self):
+        """Создает ячейки сетки календаря (один раз на экран)."""
+        calendar_grid = self.ids.calendar_grid
+        for _ in range(CALENDAR_CELLS):
+            cell = DayCell(size_hint_y=None, height=50, color=(1, 1, 1, 1))
+            cell.bind(on_press=self.on_day_selected)
+            calendar_grid.add_widget(cell)
+            self.day_cells.append(cell)
+
+    def get_month_notes(self, date):
+        """Возвращает заметки месяца из кэша или ставит месяц в фоновую загрузку."""
+        user_id = App.get_running_app().current_user_id
+        if user_id is None:
+            return None
+        key = (user_id, date.year, date.month)
+        if key not in self.month_notes:
+            self.prefetcher.request(user_id, date.year, date.month, self.on_month_loaded)
+        return self.month_notes.get(key)
+
+    def on_month_loaded(self, key, notes):
+        """Сохраняет загруженный месяц и перерисовывает его, если он сейчас на экране."""
+        self.month_notes[key] = notes
+        user_id, year, month = key
+        if (user_id == App.get_running_app().current_user_id
+                and (year, month) == (self.current_date.year, self.current_date.month)):
+            self.display_calendar(self.current_date)
+
+    def remember_note(self, user_id, date, note_data):
+        """Обновляет кэш месяца после сохранения заметки."""
+        day = datetime.strptime(date, "%Y-%m-%d")
+        notes = self.month_notes.get((user_id, day.year, day.month))
+        if notes is not None:
+            notes[date] = note_data
 
     def show_prev_month(self, instance=None):
         """Переход на предыдущий месяц."""
@@ -385,14 +312,263 @@ class CalendarScreen(Screen):
 
     def on_day_selected(self, instance):
         """Обработка выбора дня."""
-        day = int(instance.text)
-        selected_date = self.current_date.replace(day=day)
-        print(f"Переход на экран заметок для даты: {selected_date.strftime('%Y-%m-%d')}")
+        date = instance.date
+        if not date:
+            return
+        selected_date = datetime.strptime(date, "%Y-%m-%d")
+        logger.debug("Переход на экран заметок для даты: %s", date)
+        self.manager.current = 'note'
+        # Если месяц уже загружен, заметка берется из кэша без обращения к БД
+        notes = self.get_month_notes(selected_date)
+        if notes is not None:
+            self.manager.get_screen('note').set_date(date, notes.get(date, {}))
+        else:
+            self.manager.get_screen('note').set_date(date)
+
+
+class SearchScreen(Screen):
+    """Полнотекстовый поиск по заметкам с постраничной подгрузкой результатов."""
+    status = StringProperty("")
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.query = None  # (текст, с даты, по дату, оценка) текущего поиска
+        self.offset = 0
+
+    def start_search(self):
+        """Запускает новый поиск по введенному тексту и фильтрам."""
+        text = self.ids.search_input.text.strip()
+        if not text:
+            return
+        rating = self.ids.rating_filter.text
+        self.query = (
+            text,
+            self.parse_date(self.ids.start_date_input.text),
+            self.parse_date(self.ids.end_date_input.text),
+            rating if rating in RATINGS else None,
+        )
+        self.offset = 0
+        self.ids.results_layout.clear_widgets()
+        self.load_next_page()
+
+    def parse_date(self, text):
+        """Дата фильтра в формате ГГГГ-ММ-ДД (пустое или неверное значение - без фильтра)."""
+        try:
+            return datetime.strptime(text.strip(), "%Y-%m-%d").strftime("%Y-%m-%d")
+        except ValueError:
+            return None
+
+    def load_next_page(self):
+        """Загружает следующую страницу результатов в фоне."""
+        if self.query is None:
+            return
+        self.ids.more_button.disabled = True
+        self.status = "Поиск..."
+        text, start_date, end_date, rating = self.query
+        run_in_background(search_notes, App.get_running_app().current_user_id, text,
+                          start_date, end_date, rating, offset=self.offset,
+                          callback=partial(self.on_page_loaded, self.query))
+
+    def on_page_loaded(self, query, result):
+        """Добавляет страницу результатов в список (в UI-потоке)."""
+        if query is not self.query:  # Пользователь уже начал другой поиск
+            return
+        results, has_more = result
+        for item in results:
+            result_button = Button(
+                text=f"[b]{item['date']}[/b]  {item['day_rating']}\n{self.format_snippet(item['snippet'])}",
+                markup=True,
+                size_hint_y=None,
+                height=70,
+                halign='left',
+                valign='middle',
+                background_color=RATING_COLORS.get(item['day_rating'], (0.851, 0.675, 0.510, 1)),
+                color=(0.251, 0.161, 0.078, 1),
+            )
+            result_button.bind(size=lambda btn, size: setattr(btn, 'text_size', (size[0] - 20, None)))
+            result_button.bind(on_press=partial(self.open_note, item['date']))
+            self.ids.results_layout.add_widget(result_button)
+
+        self.offset += len(results)
+        self.status = f"Найдено: {self.offset}{'+' if has_more else ''}" if self.offset else "Ничего не найдено"
+        self.ids.more_button.disabled = not has_more
+
+    def format_snippet(self, snippet):
+        """Выделяет совпадения в сниппете разметкой Kivy."""
+        return (escape_markup(snippet)
+                .replace(SNIPPET_START, "[b][color=#734c29]")
+                .replace(SNIPPET_END, "[/color][/b]"))
+
+    def open_note(self, date, instance):
+        """Открывает найденную заметку."""
         self.manager.current = 'note'
-        self.manager.get_screen('note').set_date(selected_date.strftime("%Y-%m-%d"))
+        self.manager.get_screen('note').set_date(date)
+
+    def go_back(self):
+        self.manager.current = 'calendar'
+
+
+# Контейнеры кнопок формы заметки в lifedots.kv по группам значений
+OPTION_CONTAINERS = {
+    "rating": "day_buttons",
+    "emotion": "emotion_buttons",
+    "people": "people_buttons",
+    "weather": "weather_container",
+}
+OPTION_SELECTED_COLOR = (0.451, 0.298, 0.161, 1)
+OPTION_COLOR = (0.949, 0.808, 0.635, 1)
+
+
+# Цвет точек будущих дней в виде точек
+FUTURE_DOT_COLOR = (0.851, 0.675, 0.510, 0.35)
+# Заголовки масштабов вида точек
+DOTS_TITLES = {"life": "Жизнь по неделям", "year": "%Y", "month": "%B %Y"}
+
+
+class DotsScreen(Screen):
+    """Вид "точек жизни": каждый день (или неделя) - точка цвета оценки дня.
+
+    Масштабы: жизнь по неделям, год и месяц; нажатие на точку или прокрутка колесом
+    приближает, в масштабе месяца нажатие открывает заметку дня. Данные периода
+    загружаются одним агрегирующим запросом get_rating_dots.
+    """
+    level = StringProperty("year")  # масштаб: life, year или month
+    title = StringProperty("")
+    status = StringProperty("")
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.anchor = datetime.today().date()  # дата внутри показываемого периода
+        self.life_start = {}  # user_id -> первый год "жизни" (год первой заметки)
+        self.loaded = {}  # (user_id, масштаб, начало периода) -> точки
+        self.requested = None
+
+    def on_kv_post(self, base_widget):
+        super().on_kv_post(base_widget)
+        palette = {RATINGS.index(rating) + 1: color for rating, color in RATING_COLORS.items()}
+        palette[NO_RATING] = DAY_COLOR
+        palette[FUTURE] = FUTURE_DOT_COLOR
+        self.ids.dots_view.palette = palette
+
+    def on_pre_enter(self):
+        """Оценки могли измениться на экране заметки, поэтому загруженные периоды сбрасываются."""
+        self.loaded.clear()
+        self.load()
+
+    def period_start(self, user_id):
+        if self.level == "life":
+            return self.life_start.get(user_id)
+        return level_period(self.level, self.anchor)[0]
+
+    def load(self):
+        """Показывает период из кэша или загружает его в фоне."""
+        user_id = App.get_running_app().current_user_id
+        start = self.period_start(user_id)
+        key = (user_id, self.level, start)
+        if start is not None and key in self.loaded:
+            self.show_dots(key, self.loaded[key])
+            return
+        self.requested = key
+        self.status = "Загрузка..."
+        run_in_background(self.fetch_dots, user_id, self.level, start, callback=self.on_dots_loaded)
+
+    def fetch_dots(self, user_id, level, start):
+        """Выполняется в фоновом потоке: ((user_id, масштаб, начало), точки)."""
+        if start is None:
+            first_date = get_first_note_date(user_id)
+            start = Date.fromisoformat(first_date) if first_date else datetime.today().date()
+            start = start.replace(month=1, day=1)
+        end = level_period(level, start)[1]
+        bucket = "week" if level == "life" else "day"
+        return (user_id, level, start), get_rating_dots(user_id, start.isoformat(), end.isoformat(), bucket)
+
+    def on_dots_loaded(self, result):
+        key, dots = result
+        user_id, level, start = key
+        if level == "life":
+            self.life_start[user_id] = start
+        self.loaded[key] = dots
+        # Пока шла загрузка, пользователь мог перейти к другому периоду
+        if self.requested is not None and self.requested[:2] == key[:2] and self.requested[2] in (None, start):
+            self.show_dots(key, dots)
+
+    def show_dots(self, key, dots):
+        _, level, start = key
+        self.status = ""
+        self.requested = None
+        self.title = DOTS_TITLES[level] if level == "life" else start.strftime(DOTS_TITLES[level])
+        self.ids.dots_view.show(level, start, dots)
+
+    def set_level(self, level, anchor=None):
+        if level not in LEVELS:
+            return
+        self.level = level
+        if anchor is not None:
+            self.anchor = anchor
+        self.load()
+
+    def zoom(self, step, index=None):
+        """Переход на соседний масштаб; при приближении - к периоду точки index."""
+        position = LEVELS.index(self.level) + step
+        if not 0 <= position < len(LEVELS):
+            return
+        view = self.ids.dots_view
+        anchor = dot_date(view.level, view.start, index) if index is not None and step > 0 else None
+        self.set_level(LEVELS[position], anchor)
+
+    def on_dot_press(self, index):
+        """Нажатие на точку: приближение, а в масштабе месяца - переход к заметке дня."""
+        if self.level != "month":
+            self.zoom(1, index)
+            return
+        view = self.ids.dots_view
+        date = dot_date(view.level, view.start, index).isoformat()
+        self.manager.current = 'note'
+        self.manager.get_screen('note').set_date(date)
+
+    def shift_period(self, direction):
+        """Предыдущий (-1) или следующий (1) год или месяц."""
+        if self.level == "year":
+            self.anchor = self.anchor.replace(year=self.anchor.year + direction, month=1, day=1)
+        elif self.level == "month":
+            month = self.anchor.year * 12 + self.anchor.month - 1 + direction
+            self.anchor = Date(month // 12, month % 12 + 1, 1)
+        else:
+            return
+        self.load()
+
+    def go_back(self):
+        self.manager.current = 'calendar'
+
+
+class AnalyticsScreen(Screen):
+    """Главные находки по всей истории: как эмоции, люди и погода связаны с настроением."""
+    status = StringProperty("")
+
+    def on_pre_enter(self):
+        """Находки пересчитываются в фоне, только если заметки менялись (иначе берутся из кэша)."""
+        self.status = "Загрузка..."
+        self.ids.findings_layout.clear_widgets()
+        run_in_background(get_top_findings, App.get_running_app().current_user_id, callback=self.show_findings)
+
+    def show_findings(self, findings):
+        if findings is None:
+            self.status = "Для аналитики нужен пакет numpy"
+            return
+        self.status = "" if findings else "Пока слишком мало заметок для выводов"
+        for finding in findings:
+            label = Label(text=describe_finding(finding), size_hint_y=None, height=60,
+                          halign='left', valign='middle', color=(0.251, 0.161, 0.078, 1))
+            label.bind(size=lambda lbl, size: setattr(lbl, 'text_size', (size[0] - 20, None)))
+            self.ids.findings_layout.add_widget(label)
+
+    def go_back(self):
+        self.manager.current = 'calendar'
 
 
 class NoteScreen(Screen):
+    autosave_enabled = True  # Автосохранение изменений в фоне вместо записи по кнопке
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.saved_blocks_layout = None
@@ -402,16 +578,50 @@ class NoteScreen(Screen):
         self.emotions = set()
         self.people = set()
         self.weather = None
+        self.loading = False  # Заполнение формы из БД не должно запускать автосохранение
         self.add_widget(self.layout)
 
+    def on_kv_post(self, base_widget):
+        super().on_kv_post(base_widget)
+        self.ids.note_input.bind(text=self.on_note_text)
+        self.index_option_buttons()
+
+    def on_note_text(self, instance, value):
+        """Ввод текста заметки."""
+        self.schedule_autosave()
+
+    def on_leave(self):
+        """При уходе с экрана гарантированно записываем накопленные изменения."""
+        if not App.get_running_app().autosaver.flush():
+            logger.error("Автосохранение не удалось, изменения остались в очереди.")
+
     def go_back(self, instance=None):
         """Переход на экран календаря."""
         self.manager.current = 'calendar'
 
-    def set_date(self, date):
-        """Устанавливает дату и загружает данные из БД."""
+    def set_date(self, date, note_data=None):
+        """Устанавливает дату и загружает данные из БД (если они не переданы из календаря)."""
         self.date = date
-        note_data = get_note_from_db(self.date)  # Должна быть функция получения данных
+        if note_data is None:
+            # Заметки нет в кэше календаря - загружаем в фоне, пока форма заблокирована
+            self.loading = True
+            self.ids.note_input.disabled = True
+            self.ids.note_input.hint_text = "Загрузка..."
+            run_in_background(get_note_from_db, date, App.get_running_app().current_user_id,
+                              callback=partial(self.on_note_loaded, date))
+            return
+        self.fill_form(note_data)
+
+    def on_note_loaded(self, date, note_data):
+        """Заметка загружена в фоне (в UI-потоке)."""
+        self.ids.note_input.disabled = False
+        self.ids.note_input.hint_text = "Введите заметку"
+        if date == self.date:  # Пользователь мог уже выбрать другой день
+            self.fill_form(note_data)
+
+    def fill_form(self, note_data):
+        """Заполняет форму данными заметки."""
+        self.loading = True
         if note_data:
             self.ids.note_input.text = note_data.get('note', '')
             self.day_rating = note_data.get('day_rating')
@@ -424,45 +634,41 @@ class NoteScreen(Screen):
             self.emotions = set()
             self.people = set()
             self.weather = None
+        self.loading = False
         self.update_buttons()
 
-    def add_day_buttons(self):
-        """Добавляет кнопки для рейтинга дня в day_buttons."""
-        ratings = ["Замечательно", "Хорошо", "Обычно", "Грустно", "Плохо"]
-        for rating in ratings:
-            button = Button(text=rating)
-            button.bind(on_press=self.set_day_rating)  # Привязываем обработчик для кнопок
-            self.ids.day_buttons.add_widget(button)  # Добавляем кнопку в контейнер day_buttons
+    def index_option_buttons(self):
+        """Запоминает кнопки формы из kv по группам: {группа: {подпись: кнопка}}.
+
+        Дерево виджетов формы не меняется за все время жизни экрана: при нажатиях
+        обновляется только цвет затронутых кнопок.
+        """
+        self.option_buttons = {
+            group: {button.text: button for button in self.ids[container].children}
+            for group, container in OPTION_CONTAINERS.items() if container in self.ids
+        }
+
+    def is_selected(self, group, label):
+        if group == "rating":
+            return label == self.day_rating
+        if group == "weather":
+            return label == self.weather
+        return label in (self.emotions if group == "emotion" else self.people)
+
+    def render_option(self, group, label):
+        """Перекрашивает одну кнопку группы по текущему состоянию формы."""
+        button = self.option_buttons.get(group, {}).get(label)
+        if button is None:
+            return
+        color = OPTION_SELECTED_COLOR if self.is_selected(group, label) else OPTION_COLOR
+        if tuple(button.background_color) != color:
+            button.background_color = color
 
     def update_buttons(self):
-        """Обновляет цвет кнопок на основе сохраненных данных."""
-        brown_color = (0.451, 0.298, 0.161, 1)
-        gray_color = (0.949, 0.808, 0.635, 1)
-
-        self.ids.day_buttons.clear_widgets()  # Очистка существующих кнопок
-
-        # Добавляем кнопки заново с обновленным состоянием
-        self.add_day_buttons()
-
-        # Проверка наличия id в kv-файле
-        if 'day_buttons' in self.ids:
-            for btn in self.ids.day_buttons.children:
-                btn.background_color = brown_color if btn.text == self.day_rating else gray_color
-
-        if 'emotion_buttons' in self.ids:
-            for btn in self.ids.emotion_buttons.children:
-                btn.background_color = brown_color if btn.text in self.emotions else gray_color
-
-        if 'people_buttons' in self.ids:
-            for btn in self.ids.people_buttons.children:
-                btn.background_color = brown_color if btn.text in self.people else gray_color
-
-        if 'weather_container' in self.ids:
-            for btn in self.ids.weather_container.children:
-                btn.background_color = brown_color if btn.text == self.weather else gray_color
-
-        self.canvas.ask_update()
-        print([btn.text for btn in self.ids.day_buttons.children])
+        """Перекрашивает все кнопки формы (после загрузки заметки)."""
+        for group, buttons in self.option_buttons.items():
+            for label in buttons:
+                self.render_option(group, label)
 
     def save_note(self, instance=None):
         """Сохраняет заметку в БД."""
@@ -470,43 +676,93 @@ class NoteScreen(Screen):
             self.show_popup("Ошибка", "Дата не установлена!")
             return
 
-        note = self.ids.note_input.text.strip()
-        save_note_to_db(
+        app = App.get_running_app()
+        if self.autosave_enabled:
+            # Изменения уже в очереди автосохранения - дописываем их немедленно
+            self.schedule_autosave()
+            if not app.autosaver.flush():
+                get_popups().show_error("Не удалось сохранить заметку. Изменения остались в очереди "
+                                        "автосохранения, запись будет повторена.")
+                return
+        else:
+            note_data = self.get_note_data()
+            saved = save_note_to_db(
+                self.date,
+                note_data["note"],
+                app.current_user_id,
+                day_rating=self.day_rating,
+                emotions=note_data["emotions"],
+                people=note_data["people"],
+                weather=self.weather
+            )
+            if not saved:
+                get_popups().show_error("Не удалось сохранить заметку.")
+                return
+            self.manager.get_screen('calendar').remember_note(app.current_user_id, self.date, note_data)
+        self.show_popup("Успех", "Данные успешно сохранены!")
+
+    def get_note_data(self):
+        """Текущее состояние формы в виде словаря заметки."""
+        return {
+            "note": self.ids.note_input.text.strip(),
+            "day_rating": self.day_rating or "",
+            "emotions": ",".join(self.emotions),
+            "people": ",".join(self.people),
+            "weather": self.weather or "",
+        }
+
+    def schedule_autosave(self):
+        """Отправляет текущее состояние заметки в фоновую очередь записи."""
+        if not self.autosave_enabled or self.loading or not self.date:
+            return
+        app = App.get_running_app()
+        note_data = self.get_note_data()
+        app.autosaver.push(
+            app.current_user_id,
             self.date,
-            note,
-            App.get_running_app().current_user_id,
+            note_data["note"],
             day_rating=self.day_rating,
-            emotions=",".join(self.emotions),
-            people=",".join(self.people),
+            emotions=note_data["emotions"],
+            people=note_data["people"],
             weather=self.weather
         )
-        self.show_popup("Успех", "Данные успешно сохранены!")
+        self.manager.get_screen('calendar').remember_note(app.current_user_id, self.date, note_data)
 
+    @timed("ui", name="note.set_day_rating")
     def set_day_rating(self, button):
         """Устанавливает рейтинг дня (одна кнопка)."""
-        self.day_rating = button.text
-        self.update_buttons()
+        previous, self.day_rating = self.day_rating, button.text
+        self.render_option("rating", previous)
+        self.render_option("rating", self.day_rating)
+        self.schedule_autosave()
 
+    @timed("ui", name="note.toggle_emotion")
     def toggle_emotion(self, button):
         """Добавляет или удаляет эмоцию."""
         if button.text in self.emotions:
             self.emotions.remove(button.text)
         else:
             self.emotions.add(button.text)
-        self.update_buttons()
+        self.render_option("emotion", button.text)
+        self.schedule_autosave()
 
+    @timed("ui", name="note.toggle_people")
     def toggle_people(self, button):
         """Добавляет или удаляет человека."""
         if button.text in self.people:
             self.people.remove(button.text)
         else:
             self.people.add(button.text)
-        self.update_buttons()
+        self.render_option("people", button.text)
+        self.schedule_autosave()
 
+    @timed("ui", name="note.set_weather")
     def set_weather(self, button):
         """Устанавливает погоду (одна кнопка)."""
-        self.weather = button.text
-        self.update_buttons()
+        previous, self.weather = self.weather, button.text
+        self.render_option("weather", previous)
+        self.render_option("weather", self.weather)
+        self.schedule_autosave()
 
     def go_to_user_habits(self):
         """Переход на экран пользовательских привычек."""
@@ -514,17 +770,11 @@ class NoteScreen(Screen):
 
     def load_habits(self):
         user_id = App.get_running_app().current_user_id
-        connection = sqlite3.connect("app_data.db")
-        cursor = connection.cursor()
-
-        cursor.execute("SELECT name, buttons FROM habits WHERE user_id = ?", (user_id,))
-        habits = cursor.fetchall()
-
-        connection.close()
+        habits = get_user_habits(user_id)
 
         self.saved_blocks_layout.clear_widgets()
 
-        for name, buttons in habits:
+        for _, name, buttons in habits:
             block_label = Label(text=f"Привычка: {name}", font_size='18sp')
             self.saved_blocks_layout.add_widget(block_label)
 
@@ -534,218 +784,185 @@ class NoteScreen(Screen):
                 self.saved_blocks_layout.add_widget(btn)
 
     def show_popup(self, title, message):
-        """Показывает всплывающее окно с кастомным стилем."""
-
-        # Цвета из вашей палитры
-        light_brown = (0.949, 0.808, 0.635, 1)  # светлый бежевый
-        dark_brown = (0.251, 0.161, 0.078, 1)  # темно-коричневый
-        button_brown = (0.451, 0.298, 0.161, 1)  # коричневый
-        light_brown_button = (0.851, 0.675, 0.510, 1)  # светлый оттенок коричневого
-
-        # Контент для попапа
-        content = BoxLayout(orientation='vertical', padding=10, spacing=20)
-
-        # Создание и стилизация текста сообщения
-        label = Label(
-            text=message,
-            color=(1, 1, 1, 1),  # Белый цвет текста для контраста
-            font_size='18sp',  # Увеличиваем размер шрифта
-            halign='center',  # Центрируем текст
-            valign='middle'  # Центрируем по вертикали
-        )
-        content.add_widget(label)
-
-        # Кнопка закрытия попапа
-        close_button = Button(text="Закрыть", background_normal='', background_color=dark_brown, color=(1, 1, 1, 1))
-        close_button.bind(on_press=lambda x: self.dismiss_popup())
-        content.add_widget(close_button)
-
-        # Попап с настроенным стилем
-        self.popup = Popup(
-            title=title,
-            content=content,
-            size_hint=(0.6, 0.4),
-            background_color=light_brown,
-            auto_dismiss=True
-        )
-        self.popup.open()
+        """Показывает сообщение; после закрытия возвращает на экран календаря."""
+        get_popups().show_info(title, message, on_close=self.go_back)
+
+
+class HabitHeaderRow(BoxLayout):
+    """Строка списка привычек: название с серией и кнопка удаления (вид RecycleView)."""
+    habit = StringProperty("")
+    habit_id = NumericProperty(0)
+    title = StringProperty("")
+
+
+class HabitToggleRow(Button):
+    """Строка списка привычек: кнопка отметки (вид RecycleView)."""
+    habit = StringProperty("")
+    button_name = StringProperty("")
+    selected = BooleanProperty(False)
+
+
+# Высота строк списка привычек
+HABIT_HEADER_HEIGHT = 50
+HABIT_BUTTON_HEIGHT = 40
 
-    def dismiss_popup(self):
-        """Закрывает всплывающее окно и возвращает на экран NoteScreen."""
-        if hasattr(self, 'popup') and self.popup:
-            self.popup.dismiss()
-            # Переключаемся на экран календаря или другой экран
-            self.manager.current = 'calendar'  # Или на нужный экран
 
 class UserHabitsScreen(Screen):
+    status = StringProperty("")  # Текст в заголовке во время загрузки
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        # Модель списка: строится из результата запроса, виджеты создает RecycleView
+        self.habits = []  # [(id, name, buttons)]
+        self.habit_stats = {}
+        self.selected_habits = {}  # habit_name -> {кнопка: выбрана}
+        self.habit_ids = {}  # habit_name -> id для журнала отметок
+        self.header_rows = {}  # habit_name -> индекс строки заголовка в data
+        self.button_rows = {}  # (habit_name, кнопка) -> индекс строки в data
 
     def on_kv_post(self, base_widget):
         super().on_kv_post(base_widget)
         self.create_button = self.ids.get("create_button", None)
-        print(f"Create button найден: {self.create_button}")  # Проверка
+        logger.debug("Create button найден: %s", self.create_button)
 
     def show_delete_confirmation(self, habit_id):
         """Показывает окно подтверждения для удаления привычки."""
-        # Создаем окно подтверждения
-        popup_content = BoxLayout(orientation='vertical', padding=10)
-
-        confirmation_label = Label(text="Вы уверены, что хотите удалить эту привычку?", size_hint_y=None, height=40)
-        popup_content.add_widget(confirmation_label)
-
-        # Кнопка "Да"
-        yes_button = Button(text="Да", size_hint_y=None, height=40)
-        yes_button.bind(on_press=lambda instance: self.confirm_delete_habit(habit_id))
-
-        # Кнопка "Нет"
-        no_button = Button(text="Нет", size_hint_y=None, height=40)
-        no_button.bind(on_press=self.close_popup)
-
-        popup_content.add_widget(yes_button)
-        popup_content.add_widget(no_button)
-
-        # Создаем popup
-        self.delete_popup = Popup(title="Подтвердите удаление", content=popup_content, size_hint=(None, None),
-                                  size=(400, 200))
-        self.delete_popup.open()
-
-    def confirm_delete_habit(self, habit_id, instance=None):
-        """Подтверждает удаление привычки из БД."""
-        user_id = App.get_running_app().current_user_id
-        connection = sqlite3.connect("app_data.db")
-        cursor = connection.cursor()
-
-        cursor.execute("DELETE FROM habits WHERE user_id = ? AND id = ?", (user_id, habit_id))
-
-        connection.commit()
-        connection.close()
-
-        self.load_user_habits()  # Обновляем список привычек
-        self.close_popup()  # Закрываем окно подтверждения
-
-    def close_popup(self, instance=None):
-        """Закрывает окно подтверждения."""
-        self.delete_popup.dismiss()
+        get_popups().show_confirm("Подтвердите удаление", "Вы уверены, что хотите удалить эту привычку?",
+                                  on_confirm=partial(self.delete_habit, habit_id))
 
     def load_user_habits(self):
-        """Загружает пользовательские привычки из БД."""
+        """Загружает пользовательские привычки из БД (в фоне)."""
         user_id = App.get_running_app().current_user_id
-        connection = sqlite3.connect("app_data.db")
-        cursor = connection.cursor()
-
-        cursor.execute("SELECT id, name, buttons FROM habits WHERE user_id = ?", (user_id,))
-        habits = cursor.fetchall()
-
-        # Загружаем сохраненные привычки и их состояния
-        cursor.execute("SELECT habit_name, selected_buttons FROM saved_habits WHERE user_id = ?", (user_id,))
-        saved_habits = cursor.fetchall()
-
-        connection.close()
-
-        # Преобразуем сохраненные привычки в словарь для быстрого доступа
-        saved_habits_dict = {}
-        for habit_name, selected_buttons in saved_habits:
-            saved_habits_dict[habit_name] = set(selected_buttons.split(','))
-
-        habits_layout = self.ids.user_habits_layout
-        habits_layout.clear_widgets()
-
-        self.selected_habits = {}  # Очистка состояния
-
+        if not self.habits:
+            self.status = "Загрузка..."
+        run_in_background(self.fetch_user_habits, user_id, self.get_log_date(), callback=self.show_user_habits)
+
+    def fetch_user_habits(self, user_id, date):
+        """Выполняется в фоновом потоке: привычки, их отметки за день date и серии."""
+        # Отметки за день из журнала: {habit_id: set(кнопок)} - те же, что переключает toggle_habit
+        return get_user_habits(user_id), get_habit_marks(user_id, date), get_habit_stats(user_id)
+
+    def show_user_habits(self, result):
+        """Строит модель списка по загруженным данным (в UI-потоке)."""
+        habits, marks, habit_stats = result
+        self.status = ""
+        self.habits = habits
+        self.habit_stats = habit_stats
+        self.selected_habits = {}
         for habit_id, name, buttons in habits:
-            print(f"[DEBUG] Добавляем привычку: {name} с кнопками {buttons}")
-            habit_box = BoxLayout(orientation='horizontal', size_hint_y=None, height=50, spacing=10)
-
-            habit_label = Label(text=f"[b]{name}[/b]", markup=True, font_size='18sp', size_hint_x=0.6)
-            delete_button = Button(text="Удалить", size_hint_x=0.4, background_color=(1, 0, 0, 1))
-            delete_button.bind(on_press=lambda instance: self.show_delete_confirmation(habit_id))
-
-            habit_box.add_widget(habit_label)
-            habit_box.add_widget(delete_button)
-
-            habits_layout.add_widget(habit_box)
-
-            button_names = buttons.split(',')
-            self.selected_habits[name] = {btn_name: btn_name in saved_habits_dict.get(name, []) for btn_name in
-                                          button_names}
-
-            for btn_name in button_names:
-                btn = Button(text=btn_name, size_hint_y=None, height=40)
-                btn.background_color = (0, 1, 0, 1) if self.selected_habits[name][btn_name] else (1, 1, 1, 1)
-                btn.bind(on_press=partial(self.toggle_habit, btn, name))  # Исправлено
-                habits_layout.add_widget(btn)
+            saved = marks.get(habit_id, set())
+            self.selected_habits[name] = {btn_name: btn_name in saved for btn_name in buttons.split(',')}
+        self.build_rows()
+
+    def build_rows(self):
+        """Пересобирает данные RecycleView из модели: заголовок привычки и по строке на кнопку."""
+        rows = []
+        self.habit_ids = {}
+        self.header_rows = {}
+        self.button_rows = {}
+        for habit_id, name, _ in self.habits:
+            self.habit_ids[name] = habit_id
+            self.header_rows[name] = len(rows)
+            rows.append({
+                "viewclass": "HabitHeaderRow",
+                "size": (None, dp(HABIT_HEADER_HEIGHT)),
+                "habit": name,
+                "habit_id": habit_id,
+                "title": self.format_habit_title(name, self.habit_stats.get(habit_id)),
+            })
+            for btn_name, selected in self.selected_habits[name].items():
+                self.button_rows[(name, btn_name)] = len(rows)
+                rows.append({
+                    "viewclass": "HabitToggleRow",
+                    "size": (None, dp(HABIT_BUTTON_HEIGHT)),
+                    "habit": name,
+                    "button_name": btn_name,
+                    "selected": selected,
+                })
+        self.ids.habits_view.data = rows
+
+    def update_row(self, index, **changes):
+        """Меняет одну строку данных: RecycleView обновит только ее вид."""
+        data = self.ids.habits_view.data
+        data[index] = dict(data[index], **changes)
 
     def delete_habit(self, habit_id):
         """Удаляет привычку из БД."""
         user_id = App.get_running_app().current_user_id
-        connection = sqlite3.connect("app_data.db")
-        cursor = connection.cursor()
+        run_in_background(delete_habit_from_db, user_id, habit_id,
+                          callback=lambda result: self.on_habit_deleted(habit_id))
 
-        cursor.execute("DELETE FROM habits WHERE user_id = ? AND id = ?", (user_id, habit_id))
-
-        connection.commit()
-        connection.close()
-
-        self.load_user_habits()  # Обновляем список привычек
+    def on_habit_deleted(self, habit_id):
+        """Убирает удаленную привычку из модели без повторной загрузки (в UI-потоке)."""
+        for _, name, _ in self.habits:
+            if self.habit_ids.get(name) == habit_id:
+                self.selected_habits.pop(name, None)
+        self.habits = [habit for habit in self.habits if habit[0] != habit_id]
+        self.build_rows()
 
     def on_pre_enter(self):
         """Автоматически загружает привычки при входе в экран."""
         self.load_user_habits()
 
-    def toggle_habit(self, button, habit, *args):
+    def toggle_habit(self, habit, button_name):
         """Переключает состояние кнопки (выбрана/не выбрана)."""
         if habit not in self.selected_habits:
-            print(f"[ERROR] Habit '{habit}' не найден в self.selected_habits")
+            logger.error("Привычка %r не найдена в self.selected_habits", habit)
             return
 
-        if button.text not in self.selected_habits[habit]:
-            print(f"[ERROR] Кнопка '{button.text}' отсутствует в self.selected_habits[{habit}]")
+        if button_name not in self.selected_habits[habit]:
+            logger.error("Кнопка %r отсутствует в self.selected_habits[%s]", button_name, habit)
             return
 
-        print(f"[DEBUG] self.selected_habits = {self.selected_habits}")
-        print(f"[DEBUG] habit = {habit}, button.text = {button.text}")
+        logger.debug("habit = %s, button = %s", habit, button_name)
 
-        current_state = self.selected_habits[habit][button.text]
-        button.background_color = (0, 1, 0, 1) if not current_state else (1, 1, 1, 1)
-        self.selected_habits[habit][button.text] = not current_state
+        selected = not self.selected_habits[habit][button_name]
+        self.selected_habits[habit][button_name] = selected
+        self.update_row(self.button_rows[(habit, button_name)], selected=selected)
 
-    def save_selected_habits(self):
-        """Сохраняет выбранные кнопки в БД."""
-        user_id = App.get_running_app().current_user_id
-        connection = sqlite3.connect("app_data.db")
-        cursor = connection.cursor()
+        # Отмечаем кнопку в журнале за день, открытый в заметках (или за сегодня)
+        run_in_background(set_habit_mark, App.get_running_app().current_user_id, self.habit_ids[habit],
+                          self.get_log_date(), button_name, selected,
+                          callback=partial(self.on_habit_stats, habit))
+
+    def get_log_date(self):
+        """Дата, за которую отмечаются привычки."""
+        return self.manager.get_screen('note').date or datetime.today().strftime("%Y-%m-%d")
 
-        cursor.execute("DELETE FROM saved_habits WHERE user_id = ?", (user_id,))
+    def on_habit_stats(self, habit, stats):
+        """Обновляет серию в заголовке привычки после отметки (в UI-потоке)."""
+        if habit in self.header_rows:
+            self.habit_stats[self.habit_ids[habit]] = stats
+            self.update_row(self.header_rows[habit], title=self.format_habit_title(habit, stats))
 
-        for habit, buttons in self.selected_habits.items():
-            selected_buttons = [btn for btn, selected in buttons.items() if selected]
-            if selected_buttons:
-                cursor.execute("INSERT INTO saved_habits (user_id, habit_name, selected_buttons) VALUES (?, ?, ?)",
-                               (user_id, habit, ",".join(selected_buttons)))
+    def format_habit_title(self, name, stats):
+        """Заголовок привычки с текущей серией и долей выполнения."""
+        if not stats or not stats["days_done"]:
+            return f"[b]{name}[/b]"
+        streak = stats["current_streak"] if stats["streak_active"] else 0
+        return f"[b]{name}[/b]  серия: {streak}, {stats['completion_rate']:.0%}"
 
-        connection.commit()
-        connection.close()
+    def save_selected_habits(self):
+        """Сохраняет выбранные кнопки в БД."""
+        user_id = App.get_running_app().current_user_id
+        selected = {
+            habit: [btn for btn, selected in buttons.items() if selected]
+            for habit, buttons in self.selected_habits.items()
+        }
+        run_in_background(save_selected_habits_to_db, user_id, selected, callback=self.on_habits_saved)
 
-        self.load_user_habits()  # Обновляем UI после сохранения
+    def on_habits_saved(self, result):
+        """Выбранные привычки записаны (в UI-потоке)."""
+        # Модель уже совпадает с сохраненным состоянием - перезагружать список не нужно
 
         # Показываем сообщение об успешном сохранении
         self.show_popup("Успех", "Выбранные привычки сохранены!")
 
-        print("Выбранные привычки сохранены!")
+        logger.info("Выбранные привычки сохранены.")
 
     def show_popup(self, title, message):
         """Показывает всплывающее окно с сообщением."""
-        content = BoxLayout(orientation='vertical')
-        content.add_widget(Label(text=message))
-
-        close_button = Button(text="Закрыть", size_hint=(1, 0.3))
-        content.add_widget(close_button)
-
-        popup = Popup(title=title, content=content, size_hint=(0.6, 0.4))
-        close_button.bind(on_press=popup.dismiss)
-
-        popup.open()
+        get_popups().show_info(title, message)
 
     def go_back_note_habit_form(self):
         """Переход на экран создания привычки."""
@@ -779,7 +996,7 @@ class HabitFormScreen(Screen):
                 self.create_button.text = "Save Block"
                 self.create_button.on_press = self.save_block
             else:
-                print("Ошибка: self.create_button не инициализирован!")
+                logger.error("self.create_button не инициализирован!")
 
     def save_block(self):
         block_name = self.ids.block_name_input.text.strip()
@@ -790,25 +1007,16 @@ class HabitFormScreen(Screen):
             return
 
         user_id = App.get_running_app().current_user_id
-        connection = sqlite3.connect("app_data.db")
-        cursor = connection.cursor()
 
-        # Проверяем, есть ли уже такая привычка у пользователя
-        cursor.execute("SELECT id FROM habits WHERE user_id = ? AND name = ?", (user_id, block_name))
-        existing_habit = cursor.fetchone()
+        # Сохраняем новую привычку в фоне, если такой еще нет у пользователя
+        run_in_background(add_habit_to_db, user_id, block_name, button_names, callback=self.on_block_saved)
 
-        if existing_habit:
+    def on_block_saved(self, added):
+        """Результат сохранения привычки (в UI-потоке)."""
+        if not added:
             self.show_popup("Ошибка", "Такая привычка уже существует!")
-            connection.close()
             return
 
-        # Сохраняем новую привычку
-        cursor.execute("INSERT INTO habits (user_id, name, buttons) VALUES (?, ?, ?)",
-                       (user_id, block_name, ",".join(button_names)))
-
-        connection.commit()
-        connection.close()
-
         # Обновляем UserHabitsScreen
         self.manager.get_screen('user_habits').load_user_habits()
 
@@ -816,62 +1024,146 @@ class HabitFormScreen(Screen):
 
     def show_popup(self, title, message):
         """Показывает всплывающее окно с ошибкой"""
-        content = BoxLayout(orientation='vertical')
-        content.add_widget(Label(text=message))
+        get_popups().show_info(title, message)
 
-        close_button = Button(text="Закрыть", size_hint=(1, 0.3))
-        content.add_widget(close_button)
+    def go_back_note_screen(self):
+        self.manager.current = 'note'
 
-        popup = Popup(title=title, content=content, size_hint=(0.6, 0.4))
-        close_button.bind(on_press=popup.dismiss)
+class LazyScreenManager(ScreenManager):
+    """ScreenManager, который создает экран при первом переходе на него.
 
-        popup.open()
+    Экраны регистрируются фабриками (register); get_screen, а через него и
+    присваивание current, создают экран при первом обращении.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.factories = {}  # имя экрана -> фабрика factory(name=...)
+
+    def register(self, name, factory):
+        self.factories[name] = factory
+
+    def is_built(self, name):
+        return super().has_screen(name)
+
+    def has_screen(self, name):
+        return name in self.factories or self.is_built(name)
+
+    def get_screen(self, name):
+        if not self.is_built(name) and name in self.factories:
+            self.build_screen(name)
+        return super().get_screen(name)
+
+    def build_screen(self, name):
+        """Создает зарегистрированный экран и добавляет его в менеджер."""
+        if name not in self.factories:
+            raise ScreenManagerException(f"No Screen with name \"{name}\".")
+        started = time.perf_counter()
+        screen = self.factories[name](name=name)
+        self.add_widget(screen)
+        elapsed = time.perf_counter() - started
+        registry.observe("lifedots_screen_build_seconds", elapsed, screen=name)
+        logger.debug("Экран %s создан за %.1f мс", name, elapsed * 1000)
+        return screen
+
+    def prewarm(self, names, interval=0):
+        """Заранее создает экраны names, по одному за кадр (через interval секунд друг за другом)."""
+        pending = [name for name in names if not self.is_built(name)]
+
+        def build_next(dt):
+            while pending:
+                name = pending.pop(0)
+                if not self.is_built(name):
+                    self.build_screen(name)
+                    break
+            if pending:
+                Clock.schedule_once(build_next, interval)
+
+        if pending:
+            Clock.schedule_once(build_next, interval)
+
+
+# Экраны, которые создаются заранее после первого кадра (вероятные следующие после входа)
+PREWARM_SCREENS = ("calendar", "note")
+# Пауза между созданием прогреваемых экранов, чтобы не занимать подряд несколько кадров (секунды)
+PREWARM_INTERVAL = 0.1
+# Если переменная задана, приложение печатает замеры запуска и закрывается после первого кадра
+STARTUP_PROBE_ENV = "LIFEDOTS_STARTUP_PROBE"
+STARTUP_PROBE_PREFIX = "STARTUP "
 
-    def go_back_note_screen(self):
-        self.manager.current = 'note'
 
 # Главное приложение
 class LifeDotsApp(App):
     def build(self):
+        build_started = time.perf_counter()
         self.saved_blocks = []
         self.current_user_id = None
-        init_db()
-
-        # Создаем экземпляр ScreenManager
-        sm = ScreenManager()
-
-        # Создаем экраны
-        login_screen = LoginScreen(name='login', on_user_login=self.on_user_login)
-        registration_screen = RegistrationScreen(name='registration')
-        calendar_screen = CalendarScreen(name='calendar')
-        note_screen = NoteScreen(name='note')
-        user_habits = UserHabitsScreen(name='user_habits')
-        habit_form = HabitFormScreen(name='habit_form')
-
-        # Добавляем экраны в ScreenManager
-        sm.add_widget(login_screen)
-        sm.add_widget(registration_screen)
-        sm.add_widget(calendar_screen)
-        sm.add_widget(note_screen)
-        sm.add_widget(user_habits)
-        sm.add_widget(habit_form)
-
-        # Устанавливаем экран по умолчанию
+        self.startup = {"imports": build_started - STARTED_AT}
+        # Миграции выполняются в потоке БД: все запросы идут через ту же очередь
+        # (вход, загрузка месяца) и выполнятся уже после init_db
+        self.db_ready = run_in_background(init_db)
+        self.autosaver = NoteAutosaver()
+
+        sm = LazyScreenManager()
+        sm.register('login', LoginScreen)
+        sm.register('registration', RegistrationScreen)
+        sm.register('calendar', CalendarScreen)
+        sm.register('note', NoteScreen)
+        sm.register('user_habits', UserHabitsScreen)
+        sm.register('habit_form', HabitFormScreen)
+        sm.register('search', SearchScreen)
+        sm.register('dots', DotsScreen)
+        sm.register('analytics', AnalyticsScreen)
+
+        # Замеры переходов между экранами (работают, только если метрики включены)
+        instrument_screen_manager(sm)
+
+        # При старте создается только экран входа
         sm.current = 'login'
 
+        self.startup["build"] = time.perf_counter() - build_started
+        Window.bind(on_flip=self.on_first_frame)
         return sm
 
+    def on_first_frame(self, window):
+        """Первый кадр нарисован: фиксирует время запуска и прогревает следующие экраны."""
+        Window.unbind(on_flip=self.on_first_frame)
+        self.startup["first_frame"] = time.perf_counter() - STARTED_AT
+        registry.observe("lifedots_startup_seconds", self.startup["first_frame"], stage="first_frame")
+        logger.info("Первый кадр через %.0f мс после запуска (build: %.0f мс)",
+                    self.startup["first_frame"] * 1000, self.startup["build"] * 1000)
+
+        if os.environ.get(STARTUP_PROBE_ENV):
+            print(STARTUP_PROBE_PREFIX + json.dumps(self.startup), flush=True)
+            self.stop()
+            return
+        Clock.schedule_once(lambda dt: get_popups().prepare(), PREWARM_INTERVAL)
+        self.root.prewarm(PREWARM_SCREENS, PREWARM_INTERVAL)
+
     def save_block(self, block_name, button_names):
         """Сохраняет новый блок с кнопками"""
         new_block = {'name': block_name, 'buttons': button_names}
         self.saved_blocks.append(new_block)
-        # Обновить экран NoteScreen
-        note_screen = self.root.get_screen('note')
-        note_screen.update_saved_blocks()
 
     def on_user_login(self, user_id):
         self.current_user_id = user_id
-        print(f"Пользователь {user_id} вошел в систему.")
+        logger.info("Пользователь %s вошел в систему.", user_id)
+
+    def on_pause(self):
+        """Перед сворачиванием приложения записываем несохраненные изменения."""
+        self.autosaver.flush()
+        return True
+
+    def on_stop(self):
+        """Закрывает соединения с БД при выходе из приложения."""
+        self.autosaver.flush()
+        logger.info("Статистика кэша БД: %s", get_cache_stats())
+        logger.info("Статистика автосохранения: %s", self.autosaver.stats())
+        metrics_file = save_report()
+        if metrics_file:
+            logger.info("Метрики сохранены в %s", metrics_file)
+        get_executor().shutdown()
+        close_all()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,234 @@
+import json
+import os
+import threading
+import time
+from functools import wraps
+
+# Метрики включаются переменной окружения LIFEDOTS_METRICS=1 (или вызовом enable()).
+# В выключенном состоянии обертки делают только одну проверку флага.
+METRICS_ENV = "LIFEDOTS_METRICS"
+# Файл, в который приложение сохраняет метрики при выходе
+METRICS_FILE_ENV = "LIFEDOTS_METRICS_FILE"
+DEFAULT_METRICS_FILE = "metrics.json"
+
+# Верхние границы корзин гистограмм времени (секунды)
+BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class MetricsRegistry:
+    """Счетчики и гистограммы времени в памяти процесса.
+
+    Метрика определяется именем и набором меток: inc("x_total", op="save") и
+    inc("x_total", op="load") - два разных ряда.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.counters = {}    # (имя, метки) -> значение
+        self.histograms = {}  # (имя, метки) -> [количество, сумма, счетчики по корзинам]
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0, 0.0, [0] * len(BUCKETS)]
+            histogram[0] += 1
+            histogram[1] += seconds
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[2][i] += 1
+                    break
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def snapshot(self):
+        """Текущие значения в виде словаря (для JSON)."""
+        with self.lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            histograms = []
+            for (name, labels), (count, total, buckets) in sorted(self.histograms.items()):
+                histograms.append({
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": count,
+                    "sum": total,
+                    "mean": total / count if count else 0.0,
+                    "buckets": dict(zip([str(bound) for bound in BUCKETS], buckets)),
+                })
+        return {"timestamp": time.time(), "counters": counters, "histograms": histograms}
+
+    def dump_json(self, path):
+        """Сохраняет снимок метрик в JSON-файл."""
+        with open(path, "w", encoding="utf-8") as fp:
+            json.dump(self.snapshot(), fp, ensure_ascii=False, indent=2)
+
+    def to_prometheus(self):
+        """Метрики в текстовом формате Prometheus."""
+        snapshot = self.snapshot()
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for counter in snapshot["counters"]:
+            declare(counter["name"], "counter")
+            lines.append(f"{counter['name']}{_format_labels(counter['labels'])} {counter['value']}")
+        for histogram in snapshot["histograms"]:
+            name, labels = histogram["name"], histogram["labels"]
+            declare(name, "histogram")
+            cumulative = 0
+            for bound, count in histogram["buckets"].items():
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, le=bound)} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, le='+Inf')} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+registry = MetricsRegistry()
+_toggle_hooks = []
+
+
+def is_enabled():
+    return registry.enabled
+
+
+def enable():
+    _set_enabled(True)
+
+
+def disable():
+    _set_enabled(False)
+
+
+def _set_enabled(enabled):
+    registry.enabled = enabled
+    for hook in list(_toggle_hooks):
+        hook(enabled)
+
+
+def add_toggle_hook(hook):
+    """hook(enabled) вызывается при включении и выключении метрик (например, чтобы повесить trace на соединения)."""
+    _toggle_hooks.append(hook)
+
+
+def save_report(path=None):
+    """Сохраняет метрики в JSON (путь из LIFEDOTS_METRICS_FILE, по умолчанию metrics.json).
+    Возвращает путь к файлу или None, если метрики выключены."""
+    if not registry.enabled:
+        return None
+    path = path or os.environ.get(METRICS_FILE_ENV, DEFAULT_METRICS_FILE)
+    registry.dump_json(path)
+    return path
+
+
+def timed(group, name=None):
+    """Декоратор: время вызова пишется в гистограмму lifedots_<group>_call_seconds{op=...},
+    исключения - в счетчик lifedots_<group>_errors_total."""
+    def decorator(func):
+        metric = f"lifedots_{group}_call_seconds"
+        errors = f"lifedots_{group}_errors_total"
+        op = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not registry.enabled:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                registry.inc(errors, op=op)
+                raise
+            finally:
+                registry.observe(metric, time.perf_counter() - started, op=op)
+        return wrapper
+    return decorator
+
+
+def statement_tracer(connection):
+    """Trace-callback для sqlite3: считает выполненные выражения по типу, коммиты и
+    количество записанных строк (по connection.total_changes между коммитами)."""
+    state = {"changes": connection.total_changes}
+
+    def trace(statement):
+        words = statement.split(None, 1)
+        kind = words[0].upper() if words else "EMPTY"
+        if kind.startswith("--"):
+            # Выражения внутри триггеров приходят как комментарий "-- TRIGGER ..."
+            kind = "TRIGGER"
+        registry.inc("lifedots_db_statements_total", kind=kind)
+        if kind == "COMMIT":
+            registry.inc("lifedots_db_commits_total")
+            registry.inc("lifedots_db_rows_written_total", connection.total_changes - state["changes"])
+            state["changes"] = connection.total_changes
+        elif kind == "ROLLBACK":
+            registry.inc("lifedots_db_rollbacks_total")
+            state["changes"] = connection.total_changes
+    return trace
+
+
+def instrument_screen_manager(manager):
+    """Замеры переходов между экранами Kivy ScreenManager.
+
+    lifedots_screen_transition_seconds{screen} - от начала перехода (on_pre_enter)
+    до его завершения (on_enter), включая анимацию; lifedots_screen_call_seconds{op="<экран>.on_pre_enter"} -
+    время обработчика on_pre_enter экрана. Экраны, добавленные позже (ленивое создание),
+    подключаются при добавлении.
+    """
+    instrumented = set()
+    def start(screen):
+        screen._metrics_transition_started = time.perf_counter()
+
+    def finish(screen):
+        started = getattr(screen, "_metrics_transition_started", None)
+        if started is not None:
+            registry.observe("lifedots_screen_transition_seconds", time.perf_counter() - started, screen=screen.name)
+            screen._metrics_transition_started = None
+        registry.inc("lifedots_screen_enter_total", screen=screen.name)
+
+    def instrument(manager, screens):
+        for screen in screens:
+            if screen.name in instrumented:
+                continue
+            instrumented.add(screen.name)
+            screen.bind(on_pre_enter=start, on_enter=finish)
+            handler = getattr(screen, "on_pre_enter", None)
+            if handler is not None:
+                # Kivy вызывает обработчик события через getattr, поэтому обертка на экземпляре подхватывается
+                screen.on_pre_enter = timed("screen", name=f"{screen.name}.on_pre_enter")(handler)
+
+    manager.bind(screens=instrument)
+    instrument(manager, manager.screens)
+
+
+if os.environ.get(METRICS_ENV, "") not in ("", "0"):
+    registry.enabled = True
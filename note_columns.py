@@ -0,0 +1,161 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import date as Date
+
+try:
+    import numpy as np
+except ImportError:  # без numpy снимок не строится: аналитика читает заметки из БД
+    np = None
+
+from db_connection import get_connection, get_db_path
+from db_manager import fetch_notes_by_dates
+from log_setup import get_logger
+
+logger = get_logger("note_columns")
+
+# Версия формата файлов снимка: снимок другой версии перестраивается целиком
+COLUMNS_FORMAT = 1
+# Файлы столбцов и типы элементов. Строка i - день first + i (порядковые номера дат, как
+# date.toordinal()); в date - номер дня, если в этот день есть заметка, иначе 0
+COLUMNS = (
+    ("date", "<i4"),
+    ("rating", "u1"),
+    ("emotions", "<u2"),
+    ("people", "u1"),
+    ("weather", "u1"),
+)
+# Порядковый номер дня в SQL (julianday 0001-01-01 = 1721425.5)
+ORDINAL_SQL = "CAST(julianday(date) - 1721424.5 AS INTEGER)"
+
+_lock = threading.Lock()  # Обновление снимка из нескольких потоков
+
+
+def snapshot_dir(user_id):
+    """Папка снимка пользователя рядом с файлом БД."""
+    return os.path.join(f"{get_db_path()}.columns", str(user_id))
+
+
+def _read_meta(directory):
+    try:
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as fp:
+            meta = json.load(fp)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get("format") == COLUMNS_FORMAT else None
+
+
+def _write_meta(directory, meta):
+    """Метаданные пишутся последними и атомарно: после сбоя снимок догонит БД заново."""
+    path = os.path.join(directory, "meta.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as fp:
+        json.dump(meta, fp)
+    os.replace(path + ".tmp", path)
+
+
+def _last_seq(cursor):
+    cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM sync_log")
+    return cursor.fetchone()[0]
+
+
+def build_snapshot(user_id):
+    """Строит снимок пользователя заново по всем заметкам; возвращает метаданные."""
+    cursor = get_connection().cursor()
+    # Журнал читается до заметок: изменения между запросами просто применятся еще раз при обновлении
+    seq = _last_seq(cursor)
+    cursor.execute(f"""
+        SELECT {ORDINAL_SQL}, rating_code, emotions_mask, people_mask, weather_code FROM notes
+        WHERE user_id = ?
+    """, (user_id,))
+    rows = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, len(COLUMNS))
+    first = int(rows[:, 0].min()) if len(rows) else 0
+    days = int(rows[:, 0].max()) - first + 1 if len(rows) else 0
+
+    directory = snapshot_dir(user_id)
+    os.makedirs(directory, exist_ok=True)
+    for index, (name, dtype) in enumerate(COLUMNS):
+        column = np.zeros(days, dtype=dtype)
+        column[rows[:, 0] - first] = rows[:, index]
+        path = os.path.join(directory, name)
+        column.tofile(path + ".tmp")
+        os.replace(path + ".tmp", path)
+    meta = {"format": COLUMNS_FORMAT, "first": first, "days": days, "seq": seq}
+    _write_meta(directory, meta)
+    return meta
+
+
+def refresh_snapshot(user_id):
+    """Догоняет снимок до БД, перезаписывая только дни, измененные после прошлого обновления.
+
+    Измененные дни берутся из журнала sync_log (его ведут триггеры notes при любой записи,
+    в том числе при синхронизации и импорте). Новые дни после последнего дописываются в
+    конец столбцов, прежние - исправляются на месте; день раньше первого или отсутствие
+    снимка приводят к полной перестройке. Возвращает метаданные.
+    """
+    directory = snapshot_dir(user_id)
+    meta = _read_meta(directory)
+    if meta is None or not meta["days"]:
+        return build_snapshot(user_id)
+    cursor = get_connection().cursor()
+    seq = _last_seq(cursor)
+    if seq == meta["seq"]:
+        return meta
+    cursor.execute("""
+        SELECT l.key FROM sync_log l JOIN users u ON u.username = l.username
+        WHERE l.seq > ? AND l.entity = 'note' AND u.id = ?
+    """, (meta["seq"], user_id))
+    dates = [row[0] for row in cursor.fetchall()]
+    if dates:
+        ordinals = np.array([Date.fromisoformat(date).toordinal() for date in dates], dtype=np.int64)
+        if ordinals.min() < meta["first"]:
+            return build_snapshot(user_id)
+        _patch(directory, meta, dates, ordinals, fetch_notes_by_dates(cursor, user_id, dates))
+    meta["seq"] = seq
+    _write_meta(directory, meta)
+    return meta
+
+
+def _patch(directory, meta, dates, ordinals, notes):
+    """Записывает коды дней dates (удаленные заметки - нулями) в файлы столбцов."""
+    days = max(meta["days"], int(ordinals.max()) - meta["first"] + 1)
+    values = np.zeros((len(dates), len(COLUMNS)), dtype=np.int64)
+    for row, (date, ordinal) in enumerate(zip(dates, ordinals)):
+        if date in notes:
+            values[row] = (ordinal,) + tuple(notes[date][1:])
+    positions = ordinals - meta["first"]
+    for index, (name, dtype) in enumerate(COLUMNS):
+        path = os.path.join(directory, name)
+        if days > meta["days"]:
+            # Дописывание: файл удлиняется нулями (дни без заметок) до нового последнего дня
+            with open(path, "r+b") as fp:
+                fp.truncate(days * np.dtype(dtype).itemsize)
+        column = np.memmap(path, dtype=dtype, mode="r+", shape=(days,))
+        # Без flush (msync): читатели видят те же страницы кэша ОС, а на диск их запишет система,
+        # как и файлы полной перестройки
+        column[positions] = values[:, index]
+        del column
+    meta["days"] = days
+
+
+def open_snapshot(user_id, refresh=True):
+    """Столбцы снимка пользователя без копирования: {имя: np.memmap только для чтения}.
+
+    Дни без заметок - строки с date == 0. Возвращает None, если numpy не установлен
+    или снимок не удалось обновить (тогда данные нужно читать из БД).
+    """
+    if np is None:
+        return None
+    try:
+        with _lock:
+            meta = refresh_snapshot(user_id) if refresh else _read_meta(snapshot_dir(user_id))
+    except (sqlite3.Error, OSError) as e:
+        logger.error("Ошибка при обновлении снимка заметок: %s", e)
+        return None
+    if meta is None:
+        return None
+    directory = snapshot_dir(user_id)
+    if not meta["days"]:
+        return {name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS}
+    return {name: np.memmap(os.path.join(directory, name), dtype=dtype, mode="r", shape=(meta["days"],))
+            for name, dtype in COLUMNS}
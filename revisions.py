@@ -0,0 +1,96 @@
+import json
+from difflib import SequenceMatcher
+
+# Каждая REVISION_SNAPSHOT_INTERVAL-я ревизия хранится целиком: восстановление любой
+# ревизии применяет не больше REVISION_SNAPSHOT_INTERVAL - 1 дельт
+REVISION_SNAPSHOT_INTERVAL = 20
+# Изменившиеся середины текстов длиннее этого сравниваются по словам, а не по символам
+# (SequenceMatcher квадратичен по длине)
+CHAR_DIFF_LIMIT = 1000
+
+
+def make_delta(base, text):
+    """Дельта, восстанавливающая text из base: список из диапазонов [начало, конец]
+    base и вставляемых строк, в виде компактного JSON.
+
+    Общие начало и конец отсекаются сразу (обычная правка - дописывание или замена
+    нескольких слов), сравнивается только изменившаяся середина.
+    """
+    limit = min(len(base), len(text))
+    prefix = 0
+    while prefix < limit and base[prefix] == text[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and base[-1 - suffix] == text[-1 - suffix]:
+        suffix += 1
+
+    ops = [[0, prefix]] if prefix else []
+    base_middle = base[prefix:len(base) - suffix]
+    text_middle = text[prefix:len(text) - suffix]
+    if base_middle and text_middle:
+        split = list if max(len(base_middle), len(text_middle)) <= CHAR_DIFF_LIMIT else _split_words
+        ops.extend(_diff_ops(split(base_middle), split(text_middle), prefix))
+    elif text_middle:
+        ops.append(text_middle)
+    if suffix:
+        ops.append([len(base) - suffix, len(base)])
+    return json.dumps(ops, ensure_ascii=False, separators=(",", ":"))
+
+
+def _diff_ops(base_parts, text_parts, offset):
+    """Операции дельты для частей (символов или слов); диапазоны - в символах base со сдвигом offset."""
+    offsets = [offset]
+    for part in base_parts:
+        offsets.append(offsets[-1] + len(part))
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, base_parts, text_parts, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append([offsets[i1], offsets[i2]])
+        elif j2 > j1:
+            ops.append("".join(text_parts[j1:j2]))
+    return ops
+
+
+def _split_words(text):
+    words = []
+    start = 0
+    for i in range(1, len(text) + 1):
+        if i == len(text) or text[i].isspace() != text[i - 1].isspace():
+            words.append(text[start:i])
+            start = i
+    return words
+
+
+def apply_delta(base, delta):
+    return "".join(base[op[0]:op[1]] if isinstance(op, list) else op for op in json.loads(delta))
+
+
+def revision_rows(user_id, date, revision, old, new):
+    """Строка note_revisions для прежнего состояния заметки old, замененного на new.
+
+    old и new - (note, rating_code, emotions_mask, people_mask, weather_code); new=None,
+    если заметка удалена. Текст хранится дельтой относительно нового состояния, а каждая
+    REVISION_SNAPSHOT_INTERVAL-я ревизия (и состояние перед удалением) - целиком.
+    """
+    text = old[0] or ""
+    snapshot = new is None or revision % REVISION_SNAPSHOT_INTERVAL == 0
+    data = text
+    if not snapshot:
+        delta = make_delta(new[0] or "", text)
+        # Для коротких или полностью переписанных текстов дельта бывает длиннее самого текста
+        if len(delta) < len(text):
+            data = delta
+        else:
+            snapshot = True
+    return (user_id, date, revision, int(snapshot), data) + tuple(old[1:])
+
+
+def reconstruct(current_text, chain):
+    """Текст ревизии по цепочке от ближайшего более нового снимка (или текущей заметки).
+
+    chain - строки (snapshot, data) от более новых ревизий к нужной.
+    """
+    text = current_text
+    for snapshot, data in chain:
+        text = data if snapshot else apply_delta(text, data)
+    return text
@@ -0,0 +1,60 @@
+from datetime import date as Date, timedelta
+
+# Периоды агрегатов настроения
+PERIODS = ("week", "month", "year")
+
+
+def period_start(date, period):
+    """Дата начала периода (неделя начинается с понедельника) в формате YYYY-MM-DD."""
+    day = Date.fromisoformat(date) if isinstance(date, str) else date
+    if period == "week":
+        day = day - timedelta(days=day.weekday())
+    elif period == "month":
+        day = day.replace(day=1)
+    elif period == "year":
+        day = day.replace(month=1, day=1)
+    else:
+        raise ValueError(f"Неизвестный период: {period}")
+    return day.isoformat()
+
+
+def note_rollup_deltas(deltas, user_id, date, codes, sign):
+    """Добавляет в deltas вклад одной заметки со знаком sign (+1 - добавить, -1 - убрать).
+
+    codes - (rating_code, emotions_mask, people_mask, weather_code).
+    deltas - словарь {(user_id, period, period_start, metric, code): изменение счетчика}.
+    Коды всех метрик - как в таблице vocabulary (1..N): у эмоции это номер бита маски + 1.
+    """
+    rating_code, emotions_mask, _, weather_code = codes
+    contributions = [("notes", 0)]
+    if rating_code:
+        contributions.append(("rating", rating_code))
+    if weather_code:
+        contributions.append(("weather", weather_code))
+    bit = 0
+    while emotions_mask >> bit:
+        if emotions_mask & (1 << bit):
+            contributions.append(("emotion", bit + 1))
+        bit += 1
+
+    for period in PERIODS:
+        start = period_start(date, period)
+        for metric, code in contributions:
+            key = (user_id, period, start, metric, code)
+            deltas[key] = deltas.get(key, 0) + sign
+
+
+def apply_rollup_deltas(cursor, deltas):
+    """Применяет накопленные изменения счетчиков и удаляет обнулившиеся строки."""
+    changes = [key + (delta,) for key, delta in deltas.items() if delta]
+    if not changes:
+        return
+    cursor.executemany("""
+        INSERT INTO mood_rollups (user_id, period, period_start, metric, code, count)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, period, period_start, metric, code) DO UPDATE SET count = count + excluded.count
+    """, changes)
+    cursor.executemany("""
+        DELETE FROM mood_rollups
+        WHERE user_id = ? AND period = ? AND period_start = ? AND metric = ? AND code = ? AND count <= 0
+    """, [change[:5] for change in changes])
@@ -3,11 +3,14 @@ from kivy.uix.button import Button
 from kivy.uix.textinput import TextInput
 from kivy.uix.label import Label
 from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.popup import Popup
 from datetime import datetime, timedelta
-import sqlite3
 from db_manager import get_note_from_db, save_note_to_db
+from db_connection import get_connection
 from kivy.uix.gridlayout import GridLayout
+from log_setup import get_logger
+from utils import get_popups
+
+logger = get_logger("screens")
 
 # Экран входа
 class LoginScreen(Screen):
@@ -32,14 +35,14 @@ class LoginScreen(Screen):
         if self.check_credentials(username, password):
             self.manager.current = 'calendar'  # Переключаемся на экран календаря
         else:
+            logger.warning("Неудачная попытка входа: %s", username)
             self.show_popup("Ошибка", "Неверное имя пользователя или пароль.")
 
     def check_credentials(self, username, password):
-        connection = sqlite3.connect("app_data.db")
+        connection = get_connection()
         cursor = connection.cursor()
         cursor.execute("SELECT password FROM users WHERE username = ?", (username,))
         result = cursor.fetchone()
-        connection.close()
         if result and result[0] == password:
             return True
         return False
@@ -48,17 +51,7 @@ class LoginScreen(Screen):
         self.manager.current = 'registration'  # Переключаемся на экран регистрации
 
     def show_popup(self, title, message):
-        content = BoxLayout(orientation='vertical', padding=10)
-        content.add_widget(Label(text=message))
-        close_button = Button(text="Закрыть")
-        close_button.bind(on_press=lambda x: self.dismiss_popup())
-        content.add_widget(close_button)
-
-        self.popup = Popup(title=title, content=content, size_hint=(0.6, 0.4))
-        self.popup.open()
-
-    def dismiss_popup(self):
-        self.popup.dismiss()
+        get_popups().show_info(title, message)
 
 # Экран регистрации
 class RegistrationScreen(Screen):
@@ -84,38 +77,27 @@ class RegistrationScreen(Screen):
             self.show_popup("Ошибка", "Пользователь с таким именем уже существует.")
         else:
             self.save_to_db(username, password)
+            logger.info("Пользователь %s зарегистрирован.", username)
             self.manager.current = 'calendar'  # Переход к экрану календаря после регистрации
 
     def check_user_exists(self, username):
-        connection = sqlite3.connect("app_data.db")
+        connection = get_connection()
         cursor = connection.cursor()
         cursor.execute("SELECT username FROM users WHERE username = ?", (username,))
         result = cursor.fetchone()
-        connection.close()
         return result is not None
 
     def save_to_db(self, username, password):
-        connection = sqlite3.connect("app_data.db")
+        connection = get_connection()
         cursor = connection.cursor()
         cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, password))
         connection.commit()
-        connection.close()
 
     def go_back(self, instance):
         self.manager.current = 'login'  # Переход на экран входа
 
     def show_popup(self, title, message):
-        content = BoxLayout(orientation='vertical', padding=10)
-        content.add_widget(Label(text=message))
-        close_button = Button(text="Закрыть")
-        close_button.bind(on_press=lambda x: self.dismiss_popup())
-        content.add_widget(close_button)
-
-        self.popup = Popup(title=title, content=content, size_hint=(0.6, 0.4))
-        self.popup.open()
-
-    def dismiss_popup(self):
-        self.popup.dismiss()
+        get_popups().show_info(title, message)
 
 # Экран календаря
 class CalendarScreen(Screen):
@@ -148,6 +130,7 @@ class CalendarScreen(Screen):
         today = datetime.today()
         selected_date = today.replace(day=int(day))
         formatted_date = selected_date.strftime("%Y-%m-%d")
+        logger.debug("Выбрана дата: %s", formatted_date)
         self.manager.current = 'note'  # Переход на экран заметок
         self.manager.get_screen('note').set_date(formatted_date)
 
@@ -175,14 +158,5 @@ class NoteScreen(Screen):
             self.show_popup("Успех", "Заметка успешно сохранена!")
 
     def show_popup(self, title, message):
-        content = BoxLayout(orientation='vertical', padding=10)
-        content.add_widget(Label(text=message))
-        close_button = Button(text="Закрыть")
-        close_button.bind(on_press=lambda x: self.dismiss_popup())
-        content.add_widget(close_button)
-        self.popup = Popup(title=title, content=content, size_hint=(0.6, 0.4))
-        self.popup.open()
-
-    def dismiss_popup(self):
-        self.popup.dismiss()
+        get_popups().show_info(title, message)
 
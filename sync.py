@@ -0,0 +1,360 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import zlib
+
+from db_cache import clear_caches
+from db_connection import get_connection, open_connection
+from db_manager import write_notes, delete_notes
+from db_migrations import migrate, SYNC_TABLES
+from log_setup import get_logger, setup_logging
+from metrics import timed
+
+logger = get_logger("sync")
+
+# Версия формата пакета изменений
+PAYLOAD_FORMAT = 1
+
+# Колонки данных каждой сущности в пакете (после имени пользователя и ключа)
+PAYLOAD_COLUMNS = {
+    "note": ("note", "rating_code", "emotions_mask", "people_mask", "weather_code"),
+    "habit": ("buttons",),
+    "saved_habit": ("selected_buttons",),
+}
+
+
+def get_replica_id(connection):
+    return connection.execute("SELECT replica_id FROM sync_state").fetchone()[0]
+
+
+def _peer_state(cursor, peer_id):
+    """(sent_seq, received_seq) для реплики peer_id."""
+    cursor.execute("SELECT sent_seq, received_seq FROM sync_peers WHERE peer_id = ?", (peer_id,))
+    return cursor.fetchone() or (0, 0)
+
+
+@timed("sync")
+def export_changes(connection, peer_id):
+    """Пакет изменений для реплики peer_id: все записи журнала после последней
+    подтвержденной ею позиции, кроме пришедших от нее самой.
+
+    Стоимость пропорциональна количеству изменений: журнал читается по seq, данные
+    строк - по их естественным ключам.
+    """
+    cursor = connection.cursor()
+    sent_seq, received_seq = _peer_state(cursor, peer_id)
+    cursor.execute("SELECT replica_id, clock FROM sync_state")
+    replica_id, clock = cursor.fetchone()
+    cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM sync_log")
+    upto = cursor.fetchone()[0]
+
+    payload = {
+        "format": PAYLOAD_FORMAT,
+        "replica": replica_id,
+        "clock": clock,
+        "upto": upto,
+        "ack": received_seq,
+        "replicas": [],
+        "users": {},
+    }
+    replicas = {}
+    for entity, (table, key_column) in SYNC_TABLES.items():
+        columns = ", ".join(f"t.{column}" for column in PAYLOAD_COLUMNS[entity])
+        cursor.execute(f"""
+            SELECT l.username, l.key, l.clock, l.replica, l.deleted, u.password, t.id, {columns}
+            FROM sync_log l
+            JOIN users u ON u.username = l.username
+            LEFT JOIN {table} t ON t.user_id = u.id AND t.{key_column} = l.key AND l.deleted = 0
+            WHERE l.seq > ? AND l.seq <= ? AND l.entity = ? AND l.replica != ?
+            ORDER BY l.seq
+        """, (sent_seq, upto, entity, peer_id))
+        changes = []
+        for username, key, change_clock, replica, deleted, password, row_id, *values in cursor.fetchall():
+            payload["users"][username] = password
+            replica_index = replicas.setdefault(replica, len(replicas))
+            # Наличие строки проверяется по id: колонки данных (например, текст заметки) бывают NULL
+            if deleted or row_id is None:
+                changes.append([username, key, change_clock, replica_index, 1])
+            else:
+                changes.append([username, key, change_clock, replica_index, 0] + values)
+        payload[entity] = changes
+    payload["replicas"] = sorted(replicas, key=replicas.get)
+    return payload
+
+
+def encode_payload(payload):
+    """Сжатое представление пакета для передачи между устройствами."""
+    return zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 9)
+
+
+def decode_payload(data):
+    payload = json.loads(zlib.decompress(data).decode("utf-8"))
+    if payload.get("format") != PAYLOAD_FORMAT:
+        raise ValueError(f"Неподдерживаемый формат пакета: {payload.get('format')}")
+    return payload
+
+
+def _user_ids(cursor, users, stats):
+    """Локальные ID пользователей пакета; отсутствующие создаются с хэшем пароля из пакета."""
+    ids = {}
+    for username, password in users.items():
+        cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, password))
+            stats["users_created"] += 1
+            ids[username] = cursor.lastrowid
+        else:
+            ids[username] = row[0]
+    return ids
+
+
+def _apply_notes(cursor, user_id, changes):
+    """Записывает заметки одного пользователя: [(дата, удалена, значения)] с пересчетом агрегатов."""
+    write_notes(cursor, [(user_id, date) + tuple(values) for date, deleted, values in changes if not deleted])
+    delete_notes(cursor, user_id, [date for date, deleted, _ in changes if deleted])
+
+
+def _apply_habit(cursor, user_id, name, deleted, values):
+    cursor.execute("SELECT id FROM habits WHERE user_id = ? AND name = ?", (user_id, name))
+    habit_ids = [row[0] for row in cursor.fetchall()]
+    if deleted:
+        for habit_id in habit_ids:
+            cursor.execute("DELETE FROM habits WHERE id = ?", (habit_id,))
+            cursor.execute("DELETE FROM habit_log WHERE user_id = ? AND habit_id = ?", (user_id, habit_id))
+            cursor.execute("DELETE FROM habit_stats WHERE user_id = ? AND habit_id = ?", (user_id, habit_id))
+    elif habit_ids:
+        cursor.execute("UPDATE habits SET buttons = ? WHERE id = ?", (values[0], habit_ids[0]))
+    else:
+        cursor.execute("INSERT INTO habits (user_id, name, buttons) VALUES (?, ?, ?)", (user_id, name, values[0]))
+
+
+def _apply_saved_habit(cursor, user_id, habit_name, deleted, values):
+    cursor.execute("DELETE FROM saved_habits WHERE user_id = ? AND habit_name = ?", (user_id, habit_name))
+    if not deleted:
+        cursor.execute("INSERT INTO saved_habits (user_id, habit_name, selected_buttons) VALUES (?, ?, ?)",
+                       (user_id, habit_name, values[0]))
+
+
+@timed("sync")
+def apply_changes(connection, payload):
+    """Применяет пакет другой реплики одной транзакцией и возвращает счетчики.
+
+    Конфликты решаются детерминированно (last writer wins): побеждает изменение
+    с большими часами Лэмпорта, при равных часах - с большим ID реплики. Поэтому
+    реплики приходят к одному состоянию независимо от порядка обмена.
+    """
+    stats = {"received": 0, "applied": 0, "skipped": 0, "users_created": 0}
+    replicas = payload["replicas"]
+    cursor = connection.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        # Пока идет применение, триггеры не пишут журнал: записи добавляются ниже с чужими часами
+        cursor.execute("UPDATE sync_state SET applying = 1")
+        user_ids = _user_ids(cursor, payload["users"], stats)
+        log_rows = []
+        for entity in SYNC_TABLES:
+            notes = {}  # user_id -> [(дата, удалена, значения)]
+            for username, key, clock, replica_index, deleted, *values in payload.get(entity, []):
+                stats["received"] += 1
+                replica = replicas[replica_index]
+                cursor.execute("SELECT clock, replica FROM sync_log WHERE entity = ? AND username = ? AND key = ?",
+                               (entity, username, key))
+                local = cursor.fetchone()
+                if local is not None and tuple(local) >= (clock, replica):
+                    stats["skipped"] += 1
+                    continue
+                user_id = user_ids[username]
+                if entity == "note":
+                    notes.setdefault(user_id, []).append((key, deleted, values))
+                elif entity == "habit":
+                    _apply_habit(cursor, user_id, key, deleted, values)
+                else:
+                    _apply_saved_habit(cursor, user_id, key, deleted, values)
+                log_rows.append((entity, username, key, clock, replica, deleted))
+                stats["applied"] += 1
+            for user_id, changes in notes.items():
+                _apply_notes(cursor, user_id, changes)
+
+        cursor.executemany("DELETE FROM sync_log WHERE entity = ? AND username = ? AND key = ?",
+                           [row[:3] for row in log_rows])
+        cursor.executemany("""
+            INSERT INTO sync_log (entity, username, key, clock, replica, deleted) VALUES (?, ?, ?, ?, ?, ?)
+        """, log_rows)
+        # Правило Лэмпорта: следующие локальные изменения получат часы больше всех увиденных
+        cursor.execute("UPDATE sync_state SET applying = 0, clock = MAX(clock, ?)", (payload["clock"],))
+        cursor.execute("""
+            INSERT INTO sync_peers (peer_id, sent_seq, received_seq) VALUES (?, ?, ?)
+            ON CONFLICT(peer_id) DO UPDATE SET
+                sent_seq = MAX(sent_seq, excluded.sent_seq),
+                received_seq = MAX(received_seq, excluded.received_seq)
+        """, (payload["replica"], payload["ack"], payload["upto"]))
+        connection.commit()
+    except sqlite3.Error as e:
+        connection.rollback()
+        logger.error("Ошибка при применении изменений реплики %s: %s", payload.get("replica"), e)
+        raise
+    if connection is get_connection():
+        clear_caches()
+    return stats
+
+
+def sync_pair(first, second):
+    """Двусторонняя синхронизация двух открытых баз. Возвращает размеры пакетов и счетчики.
+
+    Третий пакет пустой по данным и только подтверждает второй, чтобы в следующий
+    раз вторая реплика не отправляла те же изменения повторно.
+    """
+    first_id, second_id = get_replica_id(first), get_replica_id(second)
+    report = []
+    for source, target, target_id in ((first, second, second_id), (second, first, first_id),
+                                      (first, second, second_id)):
+        data = encode_payload(export_changes(source, target_id))
+        stats = apply_changes(target, decode_payload(data))
+        stats["bytes"] = len(data)
+        report.append(stats)
+    return report
+
+
+def content_digest(connection):
+    """Хэш синхронизируемых данных (по именам пользователей) для сравнения реплик."""
+    digest = hashlib.sha256()
+    queries = (
+        "SELECT u.username, n.date, n.note, n.rating_code, n.emotions_mask, n.people_mask, n.weather_code "
+        "FROM notes n JOIN users u ON u.id = n.user_id ORDER BY u.username, n.date",
+        "SELECT u.username, h.name, h.buttons FROM habits h JOIN users u ON u.id = h.user_id "
+        "ORDER BY u.username, h.name",
+        "SELECT u.username, s.habit_name, s.selected_buttons FROM saved_habits s JOIN users u ON u.id = s.user_id "
+        "ORDER BY u.username, s.habit_name",
+    )
+    for query in queries:
+        for row in connection.execute(query):
+            digest.update(repr(row).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def run_check(users=3, years=1, rounds=5, edits=50, seed=7):
+    """Проверка на двух локальных репликах: общий начальный набор, затем rounds раундов
+    независимых правок (в том числе одних и тех же ключей и удалений) с синхронизацией.
+    После каждого раунда содержимое реплик должно совпадать. Возвращает отчет по раундам."""
+    from db_connection import set_db_path, close_all
+    from synthetic_data import generate_dataset
+
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as directory:
+        first_path = os.path.join(directory, "phone.db")
+        second_path = os.path.join(directory, "tablet.db")
+        set_db_path(first_path)
+        migrate(get_connection())
+        generate_dataset(users=users, years=years, seed=seed)
+        close_all()
+        first, second = open_connection(first_path), open_connection(second_path)
+        migrate(second)
+
+        report = {"initial": sync_pair(first, second), "rounds": []}
+        for round_number in range(rounds):
+            for connection in (first, second):
+                _random_edits(connection, rng, edits)
+            exchange = sync_pair(first, second)
+            converged = content_digest(first) == content_digest(second)
+            report["rounds"].append({"round": round_number + 1, "converged": converged, "exchange": exchange})
+            if not converged:
+                logger.error("Раунд %s: реплики разошлись", round_number + 1)
+        report["notes"] = first.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+        first.close()
+        second.close()
+    return report
+
+
+def _random_edits(connection, rng, count):
+    """Случайные правки заметок, привычек и выбранных кнопок на одной реплике."""
+    cursor = connection.cursor()
+    user_ids = [row[0] for row in cursor.execute("SELECT id FROM users")]
+    for i in range(count):
+        user_id = rng.choice(user_ids)
+        # Узкий диапазон дат, чтобы реплики правили одни и те же заметки
+        date = f"2024-12-{rng.randint(1, 28):02d}"
+        action = rng.random()
+        if action < 0.6:
+            write_notes(cursor, [(user_id, date, f"правка {rng.random():.6f}", rng.randint(0, 5),
+                                  rng.getrandbits(4), rng.getrandbits(3), rng.randint(0, 3))])
+        elif action < 0.7:
+            _apply_notes(cursor, user_id, [(date, True, ())])
+        elif action < 0.85:
+            name = f"Привычка {rng.randint(1, 4)}"
+            cursor.execute("SELECT id FROM habits WHERE user_id = ? AND name = ?", (user_id, name))
+            if cursor.fetchone():
+                _apply_habit(cursor, user_id, name, rng.random() < 0.5, ("Да,Нет",))
+            else:
+                _apply_habit(cursor, user_id, name, False, (f"{rng.randint(1, 9)},Нет",))
+        else:
+            _apply_saved_habit(cursor, user_id, f"Привычка {rng.randint(1, 4)}", rng.random() < 0.3, ("Да",))
+    connection.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Синхронизация баз LifeDots между устройствами.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("id", help="показать ID реплики")
+    command.add_argument("--db", required=True)
+
+    command = commands.add_parser("export", help="сохранить изменения для другой реплики в файл")
+    command.add_argument("--db", required=True)
+    command.add_argument("--peer", required=True, help="ID реплики-получателя")
+    command.add_argument("-o", "--output", required=True)
+
+    command = commands.add_parser("import", help="применить файл изменений другой реплики")
+    command.add_argument("--db", required=True)
+    command.add_argument("file")
+
+    command = commands.add_parser("pair", help="синхронизировать две базы на одном устройстве")
+    command.add_argument("first")
+    command.add_argument("second")
+
+    command = commands.add_parser("check", help="проверка на двух временных репликах")
+    command.add_argument("--users", type=int, default=3)
+    command.add_argument("--years", type=float, default=1)
+    command.add_argument("--rounds", type=int, default=5)
+    command.add_argument("--edits", type=int, default=50, help="правок на реплику за раунд")
+    command.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    if args.command == "check":
+        report = run_check(args.users, args.years, args.rounds, args.edits, args.seed)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0 if all(item["converged"] for item in report["rounds"]) else 1
+
+    paths = [args.first, args.second] if args.command == "pair" else [args.db]
+    connections = [open_connection(path) for path in paths]
+    try:
+        for connection in connections:
+            migrate(connection)
+        if args.command == "id":
+            print(get_replica_id(connections[0]))
+        elif args.command == "export":
+            data = encode_payload(export_changes(connections[0], args.peer))
+            with open(args.output, "wb") as fp:
+                fp.write(data)
+            logger.info("Сохранено %s байт в %s", len(data), args.output)
+        elif args.command == "import":
+            with open(args.file, "rb") as fp:
+                stats = apply_changes(connections[0], decode_payload(fp.read()))
+            logger.info("Применено: %s", stats)
+        else:
+            for stats in sync_pair(*connections):
+                logger.info("Пакет: %s", stats)
+    finally:
+        for connection in connections:
+            connection.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
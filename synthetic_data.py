@@ -0,0 +1,141 @@
+import argparse
+import random
+import sqlite3
+import time
+from datetime import date as Date, timedelta
+
+from auth import hash_password
+from db_connection import get_connection, set_db_path
+from db_manager import init_db, write_notes
+from log_setup import get_logger, setup_logging
+from vocabulary import RATINGS, EMOTIONS, PEOPLE, WEATHER, encode_note
+
+logger = get_logger("synthetic_data")
+
+# Пароль всех сгенерированных пользователей
+SYNTHETIC_PASSWORD = "password123"
+
+# Заготовки для привычек и текста заметок
+HABIT_TEMPLATES = (
+    ("Вода", ["1", "2", "3", "4", "5", "6", "7", "8"]),
+    ("Спорт", ["Бег", "Зал", "Йога"]),
+    ("Чтение", ["10 мин", "30 мин", "1 час"]),
+    ("Сон", ["До 23:00", "8 часов"]),
+    ("Медитация", ["Утро", "Вечер"]),
+    ("Языки", ["Слова", "Грамматика", "Практика"]),
+)
+NOTE_WORDS = (
+    "сегодня", "работа", "прогулка", "встреча", "друзья", "семья", "кофе", "дождь", "солнце",
+    "книга", "фильм", "устал", "радость", "спорт", "дорога", "ужин", "планы", "проект", "море",
+)
+
+# Заметки пишутся пачками через write_notes
+WRITE_CHUNK_SIZE = 1000
+
+
+def _random_note(rng):
+    """Случайная заметка: (текст, оценка, эмоции, люди, погода) в виде подписей кнопок."""
+    text = " ".join(rng.choice(NOTE_WORDS) for _ in range(rng.randint(3, 40))) if rng.random() < 0.8 else ""
+    return (
+        text,
+        rng.choice(RATINGS),
+        rng.sample(EMOTIONS, rng.randint(0, 3)),
+        rng.sample(PEOPLE, rng.randint(0, 2)),
+        rng.choice(WEATHER),
+    )
+
+
+def _habit_stats(dates):
+    """Счетчики habit_stats по отсортированному списку дат выполнения."""
+    streak = 0
+    previous = None
+    for date in dates:
+        streak = streak + 1 if previous is not None and date - previous == timedelta(days=1) else 1
+        previous = date
+    return len(dates), dates[0].isoformat(), dates[-1].isoformat(), streak
+
+
+def generate_dataset(users=10, years=1, habits_per_user=3, seed=42, fill_rate=0.85, end_date=None):
+    """Заполняет текущую БД синтетическими данными и возвращает список ID пользователей.
+
+    Для каждого пользователя создаются заметки за years лет (день заполнен с
+    вероятностью fill_rate), привычки с журналом отметок и выбранные кнопки.
+    При одинаковом seed данные повторяются.
+    """
+    rng = random.Random(seed)
+    end_date = end_date or Date.today()
+    start_date = end_date - timedelta(days=int(365.25 * years) - 1)
+    days = (end_date - start_date).days + 1
+    # Хэш считается один раз: scrypt на каждого пользователя сильно замедлил бы генерацию
+    password_hash = hash_password(SYNTHETIC_PASSWORD)
+
+    connection = get_connection()
+    cursor = connection.cursor()
+    user_ids = []
+    try:
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM users")
+        first_number = cursor.fetchone()[0] + 1
+        for number in range(first_number, first_number + users):
+            cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)",
+                           (f"user{number:05d}", password_hash))
+            user_id = cursor.lastrowid
+            user_ids.append(user_id)
+
+            rows = []
+            for offset in range(days):
+                if rng.random() >= fill_rate:
+                    continue
+                date = (start_date + timedelta(days=offset)).isoformat()
+                note, *labels = _random_note(rng)
+                rows.append((user_id, date, note) + encode_note(*labels))
+                if len(rows) >= WRITE_CHUNK_SIZE:
+                    write_notes(cursor, rows)
+                    rows = []
+            write_notes(cursor, rows)
+
+            for name, buttons in rng.sample(HABIT_TEMPLATES, min(habits_per_user, len(HABIT_TEMPLATES))):
+                cursor.execute("INSERT INTO habits (user_id, name, buttons) VALUES (?, ?, ?)",
+                               (user_id, name, ",".join(buttons)))
+                habit_id = cursor.lastrowid
+                done_rate = rng.uniform(0.3, 0.9)
+                log = []
+                done_dates = []
+                for offset in range(days):
+                    if rng.random() >= done_rate:
+                        continue
+                    date = start_date + timedelta(days=offset)
+                    done_dates.append(date)
+                    for button in rng.sample(buttons, rng.randint(1, len(buttons))):
+                        log.append((user_id, habit_id, date.isoformat(), button))
+                cursor.executemany("INSERT INTO habit_log (user_id, habit_id, date, button) VALUES (?, ?, ?, ?)", log)
+                if done_dates:
+                    cursor.execute("""
+                        INSERT INTO habit_stats (habit_id, user_id, days_done, first_date, last_date, current_streak)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    """, (habit_id, user_id) + _habit_stats(done_dates))
+                cursor.execute("INSERT INTO saved_habits (user_id, habit_name, selected_buttons) VALUES (?, ?, ?)",
+                               (user_id, name, ",".join(rng.sample(buttons, rng.randint(1, len(buttons))))))
+        connection.commit()
+    except sqlite3.Error as e:
+        connection.rollback()
+        logger.error("Ошибка при генерации данных: %s", e)
+        raise
+    return user_ids
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Генератор синтетических данных LifeDots.")
+    parser.add_argument("--db", required=True, help="файл базы данных (будет создан при отсутствии)")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--years", type=float, default=1)
+    parser.add_argument("--habits", type=int, default=3, help="привычек на пользователя")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    setup_logging()
+    set_db_path(args.db)
+    init_db()
+    started = time.perf_counter()
+    created = generate_dataset(args.users, args.years, args.habits, args.seed)
+    logger.info("Создано пользователей: %s за %.1f с (пароль: %s)",
+                len(created), time.perf_counter() - started, SYNTHETIC_PASSWORD)
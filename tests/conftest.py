@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+# Модули приложения лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Пустая база актуальной версии во временной папке."""
+    from db_cache import clear_caches
+    from db_connection import set_db_path, close_all
+    from db_manager import init_db
+
+    set_db_path(str(tmp_path / "app_data.db"))
+    clear_caches()
+    init_db()
+    yield
+    close_all()
+    clear_caches()
+
+
+@pytest.fixture
+def user_id(db):
+    """Пользователь, зарегистрированный как в приложении."""
+    from auth import register_user
+
+    return register_user("anna", "password")
@@ -0,0 +1,23 @@
+from db_cache import LRUCache
+
+
+def test_put_skipped_after_invalidate_during_read():
+    cache = LRUCache(4)
+    generation = cache.generation
+    # Запись заметки между чтением из БД и put сбрасывает кэш
+    cache.invalidate((1, "2024-01-01"))
+    cache.put((1, "2024-01-01"), {"note": "старая"}, generation)
+    assert cache.get((1, "2024-01-01")) is None
+
+    cache.put((1, "2024-01-01"), {"note": "новая"}, cache.generation)
+    assert cache.get((1, "2024-01-01")) == {"note": "новая"}
+
+
+def test_put_without_generation_always_stores():
+    cache = LRUCache(2)
+    cache.clear()
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.put("c", 3)
+    assert cache.get("a") is None
+    assert cache.get("c") == 3
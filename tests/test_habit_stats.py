@@ -0,0 +1,105 @@
+import random
+from datetime import date as Date, timedelta
+
+import pytest
+
+from db_connection import get_connection
+from db_manager import add_habit_to_db, get_user_habits, set_habit_mark
+
+START = Date(2024, 1, 1)
+
+
+def day(number):
+    """Дата дня number (1 - 2024-01-01)."""
+    return (START + timedelta(days=number - 1)).isoformat()
+
+
+@pytest.fixture
+def habit(user_id):
+    add_habit_to_db(user_id, "Спорт", ["Да", "Чуть-чуть"])
+    return user_id, get_user_habits(user_id)[0][0]
+
+
+def stored(habit):
+    user_id, habit_id = habit
+    row = get_connection().execute("""
+        SELECT days_done, first_date, last_date, current_streak FROM habit_stats WHERE habit_id = ?
+    """, (habit_id,)).fetchone()
+    return tuple(row) if row else (0, None, None, 0)
+
+
+def recomputed(habit):
+    """Счетчики привычки, посчитанные заново по всему журналу habit_log."""
+    user_id, habit_id = habit
+    dates = [row[0] for row in get_connection().execute(
+        "SELECT DISTINCT date FROM habit_log WHERE user_id = ? AND habit_id = ? ORDER BY date", (user_id, habit_id))]
+    if not dates:
+        return 0, None, None, 0
+    streak = 1
+    for previous, current in zip(reversed(dates[:-1]), reversed(dates)):
+        if Date.fromisoformat(current) - Date.fromisoformat(previous) != timedelta(days=1):
+            break
+        streak += 1
+    return len(dates), dates[0], dates[-1], streak
+
+
+def mark(habit, numbers, marked=True, button="Да"):
+    user_id, habit_id = habit
+    for number in numbers:
+        set_habit_mark(user_id, habit_id, day(number), button, marked)
+        assert stored(habit) == recomputed(habit)
+
+
+def test_filling_gap_merges_streaks(habit):
+    mark(habit, [1, 2, 4, 5])
+    assert stored(habit)[3] == 2
+
+    mark(habit, [3])
+    assert stored(habit) == (5, day(1), day(5), 5)
+
+
+def test_filling_gap_before_current_streak_keeps_it(habit):
+    mark(habit, [1, 3, 5, 6])
+    mark(habit, [2])
+    assert stored(habit) == (5, day(1), day(6), 2)
+
+
+def test_unmarking_day_inside_streak(habit):
+    mark(habit, range(1, 6))
+    mark(habit, [3], marked=False)
+    assert stored(habit) == (4, day(1), day(5), 2)
+
+
+def test_unmarking_last_marked_day(habit):
+    mark(habit, [1, 2, 5])
+    mark(habit, [5], marked=False)
+    assert stored(habit) == (2, day(1), day(2), 2)
+
+    mark(habit, [2, 1], marked=False)
+    assert stored(habit) == (0, None, None, 0)
+
+
+def test_marking_day_before_first_day(habit):
+    mark(habit, [5, 6])
+    mark(habit, [2])
+    assert stored(habit) == (3, day(2), day(6), 2)
+
+    mark(habit, [4])
+    assert stored(habit) == (4, day(2), day(6), 3)
+
+    mark(habit, [3])
+    assert stored(habit) == (5, day(2), day(6), 5)
+
+
+def test_second_button_does_not_change_day(habit):
+    mark(habit, [1, 2])
+    mark(habit, [2], button="Чуть-чуть")
+    mark(habit, [2], marked=False)
+    assert stored(habit) == (2, day(1), day(2), 2)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_marks_match_recompute(habit, seed):
+    rng = random.Random(seed)
+    for _ in range(300):
+        mark(habit, [rng.randint(1, 20)], marked=rng.random() < 0.6, button=rng.choice(["Да", "Чуть-чуть"]))
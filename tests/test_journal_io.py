@@ -0,0 +1,43 @@
+import io
+import json
+
+from db_manager import get_notes_for_range, get_user_habits
+from journal_io import import_records, read_records
+
+RECORDS = [
+    {"type": "note", "date": "2024-01-01", "note": "Первая", "day_rating": "Хорошо", "emotions": ["Счастье"]},
+    {"type": "note", "date": "20240102", "note": "Дата без дефисов"},
+    {"type": "note", "date": "2024-01-03", "emotions": 5},
+    {"type": "note", "date": "2024-01-04", "people": {"Друзья": 1}},
+    {"type": "note", "date": "2024-13-01"},
+    {"type": "note", "date": 20240105},
+    {"type": "note", "date": "2024-01-06", "weather": "Град"},
+    {"type": "habit", "name": "Спорт", "buttons": 5},
+    {"type": "habit", "name": "Чтение", "buttons": ["Утро", "Вечер"]},
+    {"type": "unknown"},
+    [1, 2],
+]
+
+
+def _jsonl(records, extra_lines=()):
+    lines = [json.dumps(record, ensure_ascii=False) for record in records] + list(extra_lines)
+    return io.StringIO("\n".join(lines) + "\n")
+
+
+def test_malformed_records_are_counted_as_invalid(user_id):
+    fp = _jsonl(RECORDS, extra_lines=['{"type": "note", "date": ', "не json"])
+
+    stats = import_records(user_id, read_records(fp))
+
+    assert stats == {"notes": 2, "habits": 1, "saved_habits": 0, "skipped": 0, "invalid": 10}
+    notes = get_notes_for_range(user_id, "2024-01-01", "2024-01-31")
+    assert sorted(notes) == ["2024-01-01", "2024-01-02"]
+    assert notes["2024-01-01"]["emotions"] == "Счастье"
+    assert [habit[1] for habit in get_user_habits(user_id)] == ["Чтение"]
+
+
+def test_dates_are_stored_as_yyyy_mm_dd(user_id):
+    stats = import_records(user_id, [{"type": "note", "date": "2024-W01-3", "note": "Неделя ISO"}])
+
+    assert stats["notes"] == 1
+    assert get_notes_for_range(user_id, "2024-01-01", "2024-01-31")["2024-01-03"]["note"] == "Неделя ISO"
@@ -0,0 +1,26 @@
+import logging
+
+import pytest
+
+from log_setup import ROOT_LOGGER, get_logger, setup_logging
+
+
+@pytest.fixture
+def restore_logging():
+    yield
+    setup_logging(level="INFO", module_levels={})
+    get_logger("db_manager").setLevel(logging.NOTSET)
+
+
+def test_unknown_levels_fall_back_to_info(monkeypatch, restore_logging, capsys):
+    monkeypatch.setenv("LIFEDOTS_LOG_LEVEL", "LOUD")
+    monkeypatch.setenv("LIFEDOTS_LOG_LEVELS", "db_manager=VERBOSE,main=debug")
+
+    setup_logging()
+
+    warnings = capsys.readouterr().err
+    assert "'LOUD'" in warnings and "'VERBOSE'" in warnings
+    assert logging.getLogger(ROOT_LOGGER).level == logging.INFO
+    assert get_logger("db_manager").level == logging.INFO
+    assert get_logger("main").level == logging.DEBUG
+    get_logger("main").setLevel(logging.NOTSET)
@@ -0,0 +1,118 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+from db_migrations import SCHEMA_VERSION, get_schema_version, migrate
+from vocabulary import decode_note, encode_note
+
+BUNDLED_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app_data.db")
+
+# Таблицы, которые должны быть в базе актуальной версии
+CURRENT_TABLES = {
+    "users", "notes", "habits", "saved_habits", "vocabulary", "notes_fts", "habit_log",
+    "habit_stats", "mood_rollups", "sync_state", "sync_log", "sync_peers", "note_revisions",
+}
+
+
+def _tables(connection):
+    return {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def _note_columns(connection):
+    return [row[1] for row in connection.execute("PRAGMA table_info(notes)")]
+
+
+@pytest.fixture
+def connect(tmp_path):
+    """Открывает соединения с базами во временной папке и закрывает их после теста."""
+    connections = []
+
+    def _connect(name="app_data.db"):
+        connection = sqlite3.connect(str(tmp_path / name))
+        connections.append(connection)
+        return connection
+
+    yield _connect
+    for connection in connections:
+        connection.close()
+
+
+def test_bundled_db_upgrades_to_current_version(tmp_path, connect):
+    shutil.copy(BUNDLED_DB, tmp_path / "app_data.db")
+    connection = connect()
+    before = connection.execute("""
+        SELECT user_id, date, note, day_rating, emotions, people, weather FROM notes ORDER BY id
+    """).fetchall()
+    habits = connection.execute("SELECT user_id, name, buttons FROM habits ORDER BY id").fetchall()
+    assert get_schema_version(connection) == 0
+
+    assert migrate(connection) == SCHEMA_VERSION
+    assert get_schema_version(connection) == SCHEMA_VERSION
+    assert CURRENT_TABLES <= _tables(connection)
+
+    after = connection.execute("""
+        SELECT user_id, date, note, rating_code, emotions_mask, people_mask, weather_code FROM notes ORDER BY id
+    """).fetchall()
+    assert [row[:3] for row in after] == [row[:3] for row in before]
+    for old, new in zip(before, after):
+        assert new[3:] == encode_note(*old[3:])
+        assert decode_note(*new[3:])["day_rating"] == (old[3] or "")
+    assert connection.execute("SELECT user_id, name, buttons FROM habits ORDER BY id").fetchall() == habits
+    # Полнотекстовый индекс заполнен существующими заметками
+    assert connection.execute("SELECT COUNT(*) FROM notes_fts").fetchone()[0] == len(before)
+
+
+def test_old_primary_key_notes_layout(connect):
+    connection = connect()
+    connection.executescript("""
+        CREATE TABLE users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL
+        );
+        CREATE TABLE notes (
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            note TEXT,
+            day_rating TEXT,
+            PRIMARY KEY (user_id, date)
+        );
+        INSERT INTO users (username, password) VALUES ('anna', 'hash');
+        INSERT INTO notes VALUES (1, '2024-01-01', 'Первая', 'Хорошо');
+        INSERT INTO notes VALUES (1, '2024-01-02', 'Вторая', NULL);
+    """)
+
+    assert migrate(connection) == SCHEMA_VERSION
+
+    columns = _note_columns(connection)
+    assert "id" in columns
+    assert {"emotions", "people", "weather", "rating_code", "emotions_mask"} <= set(columns)
+    rows = connection.execute("SELECT id, date, note, rating_code FROM notes ORDER BY date").fetchall()
+    assert [(date, note) for _, date, note, _ in rows] == [("2024-01-01", "Первая"), ("2024-01-02", "Вторая")]
+    assert all(row[0] is not None for row in rows)
+    assert decode_note(rows[0][3], 0, 0, 0)["day_rating"] == "Хорошо"
+    assert rows[1][3] == 0
+    # Уникальность (user_id, date) сохраняется и после пересоздания таблицы
+    with pytest.raises(sqlite3.IntegrityError):
+        connection.execute("INSERT INTO notes (user_id, date, note) VALUES (1, '2024-01-01', 'Дубль')")
+
+
+def test_empty_db_gets_current_schema(connect):
+    connection = connect()
+
+    assert migrate(connection) == SCHEMA_VERSION
+    assert get_schema_version(connection) == SCHEMA_VERSION
+    assert CURRENT_TABLES <= _tables(connection)
+    assert connection.execute("SELECT COUNT(*) FROM notes").fetchone()[0] == 0
+
+
+def test_current_db_reads_only_user_version(connect):
+    migrate(connect())
+    connection = connect()
+    statements = []
+    connection.set_trace_callback(statements.append)
+
+    assert migrate(connection) == SCHEMA_VERSION
+    assert statements == ["PRAGMA user_version"]
@@ -0,0 +1,89 @@
+import random
+import sqlite3
+from collections import Counter
+from datetime import date as Date, timedelta
+
+from db_connection import get_connection
+from db_manager import delete_notes, get_mood_stats, save_note_to_db
+from db_migrations import MIGRATIONS, migrate
+from journal_io import import_records
+from vocabulary import EMOTIONS, PEOPLE, RATINGS, WEATHER
+
+
+def recomputed(connection):
+    """Агрегаты настроения, посчитанные заново по таблице notes: {ключ строки: count}."""
+    counts = Counter()
+    rows = connection.execute("SELECT user_id, date, rating_code, emotions_mask, weather_code FROM notes")
+    for user_id, date, rating_code, emotions_mask, weather_code in rows:
+        day = Date.fromisoformat(date)
+        starts = {
+            "week": day - timedelta(days=day.weekday()),
+            "month": day.replace(day=1),
+            "year": day.replace(month=1, day=1),
+        }
+        metrics = [("notes", 0)]
+        metrics += [("rating", rating_code)] if rating_code else []
+        metrics += [("weather", weather_code)] if weather_code else []
+        metrics += [("emotion", index + 1) for index in range(len(EMOTIONS)) if emotions_mask & (1 << index)]
+        for period, start in starts.items():
+            for metric, code in metrics:
+                counts[(user_id, period, start.isoformat(), metric, code)] += 1
+    return dict(counts)
+
+
+def stored(connection):
+    rows = connection.execute("SELECT user_id, period, period_start, metric, code, count FROM mood_rollups")
+    return {tuple(row[:5]): row[5] for row in rows}
+
+
+def test_rollups_follow_saves_edits_and_deletes(user_id):
+    rng = random.Random(3)
+    connection = get_connection()
+    dates = [(Date(2024, 1, 25) + timedelta(days=offset)).isoformat() for offset in range(14)]
+    for step in range(200):
+        date = rng.choice(dates)
+        if step % 10 == 9:
+            delete_notes(connection.cursor(), user_id, [date])
+            connection.commit()
+        else:
+            save_note_to_db(date, rng.choice(["", "заметка", None]), user_id,
+                            rng.choice(RATINGS + ("",)), ",".join(rng.sample(EMOTIONS, rng.randint(0, 3))),
+                            ",".join(rng.sample(PEOPLE, rng.randint(0, 2))), rng.choice(WEATHER + ("",)))
+        assert stored(connection) == recomputed(connection), f"шаг {step}"
+
+    import_records(user_id, [{"type": "note", "date": date, "emotions": ["Грусть"], "day_rating": "Плохо"}
+                             for date in dates[:5]], policy="overwrite")
+    assert stored(connection) == recomputed(connection)
+
+
+def test_mood_stats_decode_emotions(user_id):
+    save_note_to_db("2024-03-04", "", user_id, "Хорошо", "Счастье,Усталость", "", "Дождь")
+    save_note_to_db("2024-03-05", "", user_id, "Хорошо", "Счастье", "", "")
+    save_note_to_db("2024-03-05", "", user_id, "Плохо", "Чилл", "", "")
+
+    stats = get_mood_stats(user_id, "week", "2024-03-06")
+
+    assert stats["notes"] == 2
+    assert stats["ratings"] == {"Хорошо": 1, "Плохо": 1}
+    assert stats["emotions"] == {"Счастье": 1, "Усталость": 1, "Чилл": 1}
+    assert stats["weather"] == {"Дождь": 1}
+
+
+def test_migrations_fill_rollups_from_existing_notes(tmp_path):
+    connection = sqlite3.connect(str(tmp_path / "old.db"))
+    # База до появления агрегатов (миграции 1-5) с заметками, у которых есть все метрики
+    cursor = connection.cursor()
+    for step in MIGRATIONS[:5]:
+        step(cursor)
+    cursor.execute("PRAGMA user_version = 5")
+    cursor.execute("INSERT INTO users (username, password) VALUES ('anna', 'hash')")
+    cursor.executemany("""
+        INSERT INTO notes (user_id, date, note, rating_code, emotions_mask, people_mask, weather_code)
+        VALUES (1, ?, '', ?, ?, 0, ?)
+    """, [("2024-01-01", 1, 0b1, 2), ("2024-01-02", 5, 0b1000000000000001, 0), ("2024-02-10", 0, 0b110, 5)])
+    connection.commit()
+
+    migrate(connection)
+
+    assert stored(connection) == recomputed(connection)
+    connection.close()
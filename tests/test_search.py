@@ -0,0 +1,26 @@
+import pytest
+
+from db_connection import get_connection
+from db_manager import save_note_to_db, search_notes
+
+
+@pytest.fixture
+def notes(user_id):
+    save_note_to_db("2024-01-01", "Скидка 100% на file_name", user_id)
+    save_note_to_db("2024-01-02", "Скидка 1000 на filename", user_id)
+    save_note_to_db("2024-01-03", "Путь C:\\temp", user_id)
+
+
+def _dates(user_id, text):
+    results, _ = search_notes(user_id, text)
+    return sorted(result["date"] for result in results)
+
+
+def test_like_fallback_treats_wildcards_literally(user_id, notes):
+    # SQLite без FTS5: поиск идет через LIKE
+    get_connection().execute("DROP TABLE notes_fts")
+
+    assert _dates(user_id, "0%") == ["2024-01-01"]
+    assert _dates(user_id, "file_name") == ["2024-01-01"]
+    assert _dates(user_id, "C:\\t") == ["2024-01-03"]
+    assert _dates(user_id, "Скидка") == ["2024-01-01", "2024-01-02"]
@@ -0,0 +1,44 @@
+import pytest
+
+from db_connection import open_connection
+from db_manager import write_notes
+from db_migrations import migrate
+from sync import content_digest, sync_pair
+
+
+@pytest.fixture
+def replicas(tmp_path, db):
+    # db: общее соединение приложения (apply_changes сравнивает с ним) открывается во временной папке
+    connections = [open_connection(str(tmp_path / name)) for name in ("phone.db", "tablet.db")]
+    for connection in connections:
+        migrate(connection)
+    yield connections
+    for connection in connections:
+        connection.close()
+
+
+def test_note_without_text_round_trips(replicas):
+    first, second = replicas
+    cursor = first.cursor()
+    cursor.execute("INSERT INTO users (username, password) VALUES ('anna', 'hash')")
+    user_id = cursor.lastrowid
+    # Заметка без текста: только оценка и эмоции
+    write_notes(cursor, [(user_id, "2024-01-01", None, 2, 0b101, 0, 0)])
+    first.commit()
+
+    sync_pair(first, second)
+
+    assert second.execute("SELECT date, note, rating_code, emotions_mask FROM notes").fetchall() == [
+        ("2024-01-01", None, 2, 0b101)]
+    assert content_digest(first) == content_digest(second)
+
+    # Правка на второй реплике возвращается на первую, тоже без текста
+    cursor = second.cursor()
+    tablet_user = cursor.execute("SELECT id FROM users WHERE username = 'anna'").fetchone()[0]
+    write_notes(cursor, [(tablet_user, "2024-01-01", None, 3, 0, 0, 1)])
+    second.commit()
+
+    sync_pair(first, second)
+
+    assert first.execute("SELECT note, rating_code, weather_code FROM notes").fetchall() == [(None, 3, 1)]
+    assert content_digest(first) == content_digest(second)
@@ -1,53 +1,107 @@
+from functools import partial
+
 from kivy.uix.popup import Popup
 from kivy.uix.label import Label
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.button import Button
 
+# Цвета из палитры
+LIGHT_BROWN = (0.949, 0.808, 0.635, 1)  # светлый бежевый
+DARK_BROWN = (0.251, 0.161, 0.078, 1)  # темно-коричневый
+BUTTON_BROWN = (0.451, 0.298, 0.161, 1)  # коричневый
+LIGHT_BROWN_BUTTON = (0.851, 0.675, 0.510, 1)  # светлый оттенок коричневого
+WHITE = (1, 1, 1, 1)
+
+
+class PopupService:
+    """Всплывающие окна приложения: по одному экземпляру на вид (info, error, confirm).
+
+    Окна создаются один раз (prepare вызывается при запуске приложения) и при каждом
+    показе получают новый текст и обработчики. Обработчики сбрасываются при закрытии,
+    чтобы окно не удерживало экраны и данные после использования.
+    """
+
+    def __init__(self):
+        self.popups = {}
+        self.labels = {}
+        self.callbacks = {}  # вид окна -> {"close" | "confirm" | "cancel": обработчик}
+
+    def prepare(self):
+        """Создает окна заранее, чтобы первый показ не тратил время на построение виджетов."""
+        if self.popups:
+            return
+        for kind in ("info", "error"):
+            content = BoxLayout(orientation="vertical", padding=10, spacing=20)
+            content.add_widget(self._build_label(kind))
+            content.add_widget(self._build_button("Закрыть", partial(self._press, kind, "close")))
+            self._build_popup(kind, content)
+
+        content = BoxLayout(orientation="vertical", padding=10, spacing=20)
+        content.add_widget(self._build_label("confirm"))
+        buttons = BoxLayout(orientation="horizontal", spacing=10, size_hint=(1, 0.3))
+        buttons.add_widget(self._build_button("Да", partial(self._press, "confirm", "confirm"), BUTTON_BROWN))
+        buttons.add_widget(self._build_button("Нет", partial(self._press, "confirm", "cancel")))
+        content.add_widget(buttons)
+        self._build_popup("confirm", content)
+
+    def _build_label(self, kind):
+        label = Label(color=WHITE, font_size='18sp', halign='center', valign='middle', size_hint=(1, 0.7))
+        label.bind(size=label.setter('text_size'))  # Перенос длинных сообщений по ширине окна
+        self.labels[kind] = label
+        return label
+
+    def _build_button(self, text, handler, color=DARK_BROWN):
+        button = Button(text=text, background_normal='', background_color=color, color=WHITE)
+        button.bind(on_release=handler)
+        return button
+
+    def _build_popup(self, kind, content):
+        popup = Popup(content=content, size_hint=(0.8, 0.4), background_color=LIGHT_BROWN, auto_dismiss=False)
+        popup.bind(on_dismiss=partial(self._release_callbacks, kind))
+        self.popups[kind] = popup
+
+    def _show(self, kind, title, message, auto_dismiss=False, **callbacks):
+        """auto_dismiss - закрывать ли окно нажатием за его пределами (тогда обработчики не вызываются)."""
+        self.prepare()
+        self.callbacks[kind] = callbacks
+        popup = self.popups[kind]
+        popup.title = title
+        popup.auto_dismiss = auto_dismiss
+        self.labels[kind].text = message
+        popup.open()
+
+    def show_info(self, title, message, on_close=None):
+        """Сообщение с кнопкой "Закрыть"; on_close() вызывается после нажатия на нее."""
+        # Окно с обработчиком закрывается только кнопкой, чтобы on_close не потерялся
+        self._show("info", title, message, auto_dismiss=on_close is None, close=on_close)
+
+    def show_error(self, message, title="Ошибка", on_close=None):
+        self._show("error", title, message, auto_dismiss=on_close is None, close=on_close)
+
+    def show_confirm(self, title, message, on_confirm, on_cancel=None):
+        """Вопрос с кнопками "Да" и "Нет"."""
+        self._show("confirm", title, message, confirm=on_confirm, cancel=on_cancel)
+
+    def _press(self, kind, action, instance):
+        callback = self.callbacks.get(kind, {}).get(action)
+        self.popups[kind].dismiss()
+        if callback is not None:
+            callback()
+
+    def _release_callbacks(self, kind, popup):
+        self.callbacks.pop(kind, None)
+
+
+_popups = None
+
+
+def get_popups():
+    """Общий сервис всплывающих окон."""
+    global _popups
+    if _popups is None:
+        _popups = PopupService()
+    return _popups
+
 
 def show_popup(title, message):
-    # Цвета из палитры
-    light_brown = (0.949, 0.808, 0.635, 1)  # светлый бежевый
-    dark_brown = (0.251, 0.161, 0.078, 1)  # темно-коричневый
-    button_brown = (0.451, 0.298, 0.161, 1)  # коричневый
-    light_brown_button = (0.851, 0.675, 0.510, 1)  # светлый оттенок коричневого
-
-    # Макет попапа
-    popup_layout = BoxLayout(orientation="vertical", padding=10, spacing=10)
-
-    # Создание метки с сообщением
-    popup_label = Label(
-        text=message,
-        size_hint=(1, 0.7),
-        color=(1, 1, 1, 1),  # Белый цвет текста
-        font_size='18sp',  # Увеличенный размер шрифта
-        halign='center',  # Центрирование текста по горизонтали
-        valign='middle'  # Центрирование текста по вертикали
-    )
-
-    # Кнопка закрытия
-    close_button = Button(
-        text="Закрыть",
-        size_hint=(1, 0.3),
-        background_normal='',  # Без фона
-        background_color=button_brown,  # Цвет фона кнопки
-        color=(1, 1, 1, 1)  # Белый текст на кнопке
-    )
-
-    # Добавление виджетов в макет попапа
-    popup_layout.add_widget(popup_label)
-    popup_layout.add_widget(close_button)
-
-    # Создание попапа
-    popup = Popup(
-        title=title,
-        content=popup_layout,
-        size_hint=(0.7, 0.4),
-        auto_dismiss=False,  # Попап не будет закрываться автоматически при нажатии за пределы
-        background_color=light_brown  # Цвет фона попапа
-    )
-
-    # Привязка кнопки закрытия к методу закрытия попапа
-    close_button.bind(on_release=popup.dismiss)
-
-    # Открытие попапа
-    popup.open()
+    get_popups().show_info(title, message)
@@ -0,0 +1,80 @@
+# Словари значений формы заметки (порядок как в lifedots.kv).
+# Коды хранятся в БД, поэтому существующие значения нельзя переставлять или удалять -
+# новые значения добавляются только в конец списка.
+
+RATINGS = ("Замечательно", "Хорошо", "Обычно", "Грустно", "Плохо")
+
+EMOTIONS = (
+    "Счастье", "Чилл", "Гордость", "Ожидание",
+    "Радость", "Энергия", "Любовь", "Обновление",
+    "Подавленность", "Одиночество", "Тревога", "Грусть",
+    "Злость", "Давление", "Раздражение", "Усталость",
+)
+
+PEOPLE = ("Друзья", "Семья", "Партнер", "Знакомый", "Никто")
+
+WEATHER = ("Солнечно", "Облачно", "Дождь", "Снежно", "Ветрено")
+
+# Словари по типу: одиночный выбор хранится кодом (1..N, 0 - не выбрано),
+# множественный - битовой маской (бит i соответствует значению с индексом i)
+VOCABULARIES = {
+    "rating": RATINGS,
+    "emotion": EMOTIONS,
+    "people": PEOPLE,
+    "weather": WEATHER,
+}
+
+
+def encode_code(label, vocabulary):
+    """Код одиночного значения: 1..N, 0 - если значение пустое или неизвестное."""
+    if not label:
+        return 0
+    try:
+        return vocabulary.index(label) + 1
+    except ValueError:
+        return 0
+
+
+def decode_code(code, vocabulary):
+    """Значение по коду ('' для 0 или неизвестного кода)."""
+    if code and 0 < code <= len(vocabulary):
+        return vocabulary[code - 1]
+    return ""
+
+
+def encode_mask(labels, vocabulary):
+    """Битовая маска набора значений. labels - итерируемое или строка через запятую."""
+    if not labels:
+        return 0
+    if isinstance(labels, str):
+        labels = labels.split(',')
+    mask = 0
+    for label in labels:
+        if label in vocabulary:
+            mask |= 1 << vocabulary.index(label)
+    return mask
+
+
+def decode_mask(mask, vocabulary):
+    """Список значений маски в порядке словаря."""
+    return [label for i, label in enumerate(vocabulary) if mask and mask & (1 << i)]
+
+
+def encode_note(day_rating, emotions, people, weather):
+    """Коды заметки: (rating_code, emotions_mask, people_mask, weather_code)."""
+    return (
+        encode_code(day_rating, RATINGS),
+        encode_mask(emotions, EMOTIONS),
+        encode_mask(people, PEOPLE),
+        encode_code(weather, WEATHER),
+    )
+
+
+def decode_note(rating_code, emotions_mask, people_mask, weather_code):
+    """Обратное преобразование кодов в значения формы (строки как в старой схеме)."""
+    return {
+        "day_rating": decode_code(rating_code, RATINGS),
+        "emotions": ",".join(decode_mask(emotions_mask, EMOTIONS)),
+        "people": ",".join(decode_mask(people_mask, PEOPLE)),
+        "weather": decode_code(weather_code, WEATHER),
+    }